@@ -1,14 +1,29 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import importlib.util
+from contextlib import ExitStack
 from functools import wraps
 
+import elasticsearch
+from elasticsearch import helpers as es_helpers
 from elasticsearch.client import _normalize_hosts
 from unittest.mock import patch
 
+from elasticmock import helpers
+from elasticmock.fake_async_elasticsearch import AsyncFakeElasticsearch
 from elasticmock.fake_elasticsearch import FakeElasticsearch
 
 ELASTIC_INSTANCES = {}
 
+# Also patched in the actions module of elasticsearch 6 and later, where
+# elasticsearch.helpers.bulk looks streaming_bulk up, so that even one
+# imported before the patch is covered
+HELPERS_TARGETS = ('elasticsearch.helpers',)
+if importlib.util.find_spec('elasticsearch.helpers.actions') is not None:
+    HELPERS_TARGETS += ('elasticsearch.helpers.actions',)
+HELPERS = ('bulk', 'streaming_bulk', 'parallel_bulk')
+
 
 def _get_elasticmock(hosts=None, *args, **kwargs):
     host = _normalize_hosts(hosts)[0]
@@ -24,11 +39,39 @@ def _get_elasticmock(hosts=None, *args, **kwargs):
     return connection
 
 
+def _get_async_elasticmock(hosts=None, *args, **kwargs):
+    # Shares the store of the sync instance of the same host
+    return AsyncFakeElasticsearch(client=_get_elasticmock(hosts, *args, **kwargs))
+
+
+def _patch_elasticsearch(stack):
+    stack.enter_context(patch('elasticsearch.Elasticsearch', _get_elasticmock))
+    for target in HELPERS_TARGETS:
+        for helper in HELPERS:
+            stack.enter_context(patch('{0}.{1}'.format(target, helper), getattr(helpers, helper)))
+    # The async client and helpers only exist when aiohttp is installed
+    if hasattr(elasticsearch, 'AsyncElasticsearch'):
+        stack.enter_context(patch('elasticsearch.AsyncElasticsearch', _get_async_elasticmock))
+    if hasattr(es_helpers, 'async_scan'):
+        stack.enter_context(patch('elasticsearch.helpers.async_scan', helpers.async_scan))
+
+
 def elasticmock(f):
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            ELASTIC_INSTANCES.clear()
+            with ExitStack() as stack:
+                _patch_elasticsearch(stack)
+                result = await f(*args, **kwargs)
+            return result
+        return decorated_coroutine
+
     @wraps(f)
     def decorated(*args, **kwargs):
         ELASTIC_INSTANCES.clear()
-        with patch('elasticsearch.Elasticsearch', _get_elasticmock):
+        with ExitStack() as stack:
+            _patch_elasticsearch(stack)
             result = f(*args, **kwargs)
         return result
     return decorated
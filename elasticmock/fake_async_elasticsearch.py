@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from functools import partial
+
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+
+
+def _run_in_executor(name):
+    """Makes a coroutine method running the method of the wrapped sync client
+    in the executor, so that the event loop keeps serving other coroutines"""
+    async def method(self, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        call = partial(getattr(self._get_sync_client(), name), *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+    method.__name__ = name
+    return method
+
+
+def _run_inline(name):
+    """Makes a coroutine method running the method of the wrapped sync client
+    directly, for calls too cheap to be worth a thread switch. They must take
+    no lock, as waiting for one would block the event loop"""
+    async def method(self, *args, **kwargs):
+        return getattr(self._get_sync_client(), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class AsyncFakeElasticsearch:
+    """Stand-in for AsyncElasticsearch, wrapping a FakeElasticsearch whose
+    store and engine it shares. Every call taking a lock runs in executor,
+    which is the event loop's default one when None, so that a long search
+    holding an index never blocks the event loop."""
+
+    def __init__(self, hosts=None, client=None, executor=None, **kwargs):
+        self.sync_client = client if client is not None else FakeElasticsearch(hosts, **kwargs)
+        self.executor = executor
+
+    def _get_sync_client(self):
+        return self.sync_client
+
+    @property
+    def indices(self):
+        return AsyncFakeIndicesClient(self)
+
+    @property
+    def cluster(self):
+        return AsyncFakeClusterClient(self)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    ping = _run_inline('ping')
+    info = _run_inline('info')
+
+    index = _run_in_executor('index')
+    exists = _run_in_executor('exists')
+    get = _run_in_executor('get')
+    get_source = _run_in_executor('get_source')
+    delete = _run_in_executor('delete')
+    clear_scroll = _run_in_executor('clear_scroll')
+    open_point_in_time = _run_in_executor('open_point_in_time')
+    close_point_in_time = _run_in_executor('close_point_in_time')
+    bulk = _run_in_executor('bulk')
+    mget = _run_in_executor('mget')
+    count = _run_in_executor('count')
+    search = _run_in_executor('search')
+    msearch = _run_in_executor('msearch')
+    scroll = _run_in_executor('scroll')
+    suggest = _run_in_executor('suggest')
+    update_by_query = _run_in_executor('update_by_query')
+    load_ndjson = _run_in_executor('load_ndjson')
+
+
+class AsyncFakeIndicesClient:
+
+    def __init__(self, client):
+        self.client = client
+
+    def _get_sync_client(self):
+        return self.client.sync_client.indices
+
+    @property
+    def executor(self):
+        return self.client.executor
+
+    exists = _run_inline('exists')
+    refresh = _run_inline('refresh')
+
+    create = _run_in_executor('create')
+    delete = _run_in_executor('delete')
+    clear_cache = _run_in_executor('clear_cache')
+
+
+class AsyncFakeClusterClient:
+
+    def __init__(self, client):
+        self.client = client
+
+    def _get_sync_client(self):
+        return self.client.sync_client.cluster
+
+    health = _run_inline('health')
@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
+import bisect
+import copy
 import datetime
+import gzip
+import itertools
 import json
+import os
 import sys
+import threading
+import time
 from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 
-import dateutil.parser
 from elasticsearch import Elasticsearch
 from elasticsearch.client.utils import query_params
 from elasticsearch.client import _normalize_hosts
@@ -13,10 +20,21 @@ from elasticsearch.exceptions import NotFoundError, RequestError
 
 from elasticmock.behaviour.server_failure import server_failure
 from elasticmock.fake_cluster import FakeClusterClient
+from elasticmock.fake_index import (
+    ALL_DOC_TYPES, FakeIndex, UnsupportedValue, get_epoch, get_field_key
+)
 from elasticmock.fake_indices import FakeIndicesClient
-from elasticmock.utilities import (extract_ignore_as_iterable, get_random_id,
-    get_random_scroll_id)
+from elasticmock.fake_point_in_time import PointsInTime
+from elasticmock.fake_scroll import ScrollContexts, Slice, parse_time_value
+from elasticmock.fake_sort import SHARD_DOC_FIELD, Sort, SortedMatches, SortField
+from elasticmock.utilities import copy_json, extract_ignore_as_iterable, get_random_id
+from elasticmock.utilities.bitmap import bitmap_to_ordinals, ordinals_to_bitmap
 from elasticmock.utilities.decorator import for_all_methods
+from elasticmock.utilities.lru_cache import LRUCache, get_canonical_key
+from elasticmock.utilities.ndjson import (DEFAULT_CHUNK_SIZE, is_bulk_action, iter_body_lines,
+    iter_bulk_actions, iter_json_lines)
+from elasticmock.utilities.shared_image import read_shared_image, write_shared_image
+from elasticmock.utilities.snapshot_file import read_snapshot_file, write_snapshot_file
 
 PY3 = sys.version_info[0] == 3
 if PY3:
@@ -79,219 +97,381 @@ class MetricType:
 
 
 class FakeQueryCondition:
+    """Compiled query clause: sub-clauses are built once, and field keys
+    and range bounds resolved once, so evaluating a document only walks
+    prebuilt objects"""
     type = None
     condition = None
 
+    _EVALUATORS = {
+        QueryType.MATCH: '_evaluate_for_field',
+        QueryType.MATCH_ALL: '_evaluate_for_match_all_query_type',
+        QueryType.TERM: '_evaluate_for_field',
+        QueryType.TERMS: '_evaluate_for_field',
+        QueryType.RANGE: '_evaluate_for_range_query_type',
+        QueryType.BOOL: '_evaluate_for_compound_query_type',
+        QueryType.FILTER: '_evaluate_for_compound_query_type',
+        QueryType.MUST: '_evaluate_for_compound_query_type',
+        QueryType.SHOULD: '_evaluate_for_should_query_type',
+        QueryType.MULTI_MATCH: '_evaluate_for_field',
+        QueryType.MUST_NOT: '_evaluate_for_must_not_query_type',
+    }
+
     def __init__(self, type, condition):
         self.type = type
         self.condition = condition
+        self.sub_conditions = []
+        self._field_values = []
+        self._range_path = None
+        self._range_comparisons = []
+        # The comparisons of stored datetimes, by epoch, or None when a
+        # bound isn't a date
+        self._range_epoch_comparisons = []
+        self._filter_cache_keys = []
+        if type in (QueryType.BOOL, QueryType.FILTER, QueryType.MUST, QueryType.SHOULD, QueryType.MUST_NOT):
+            self.sub_conditions = self._get_sub_conditions()
+            if type == QueryType.FILTER:
+                self._filter_cache_keys = [
+                    get_canonical_key([sub_condition.type, sub_condition.condition])
+                    for sub_condition in self.sub_conditions
+                ]
+        elif type in (QueryType.MATCH, QueryType.TERM):
+            self._field_values = self._compile_field_values(condition.items(), type == QueryType.MATCH)
+        elif type == QueryType.TERMS:
+            self._field_values = self._compile_field_values(
+                ((field, term) for field in condition for term in condition[field]), False
+            )
+        elif type == QueryType.MULTI_MATCH:
+            value = condition.get('query')
+            if value:
+                self._field_values = self._compile_field_values(
+                    ((field, value) for field in condition.get('fields', [])), True
+                )
+        elif type == QueryType.RANGE:
+            self._compile_range(condition)
+        self._evaluate = getattr(self, self._EVALUATORS.get(type, '_evaluate_for_unsupported_query_type'))
+
+    @classmethod
+    def compile(cls, query):
+        """Returns the conditions of a search query body, reusing the ones
+        compiled for an equal body while they stay in QUERY_PLAN_CACHE"""
+        key = get_canonical_key(query)
+        conditions = None if key is None else QUERY_PLAN_CACHE.get(key)
+        if conditions is None:
+            # Compiled from a copy, as cached plans outlive the caller's body
+            query = copy.deepcopy(query)
+            conditions = tuple(
+                cls(QueryType.get_query_type(query_type_str), condition)
+                for query_type_str, condition in query.items()
+            )
+            if key is not None:
+                QUERY_PLAN_CACHE.put(key, conditions)
+        return conditions
 
     def evaluate(self, document):
-        return self._evaluate_for_query_type(document)
+        return self._evaluate(document)
 
-    def _evaluate_for_query_type(self, document):
+    def find_ordinals(self, fake_index):
+        """Returns the set of ordinals of the documents of fake_index that
+        match, or None when the condition must be evaluated per document"""
         if self.type == QueryType.MATCH:
-            return self._evaluate_for_match_query_type(document)
+            return self._find_ordinals_for_field(fake_index, True)
         elif self.type == QueryType.MATCH_ALL:
-            return True
+            return set(fake_index.ordinals())
         elif self.type == QueryType.TERM:
-            return self._evaluate_for_term_query_type(document)
+            return self._find_ordinals_for_field(fake_index, False)
         elif self.type == QueryType.TERMS:
-            return self._evaluate_for_terms_query_type(document)
+            return self._find_ordinals_for_terms_query_type(fake_index)
         elif self.type == QueryType.RANGE:
-            return self._evaluate_for_range_query_type(document)
-        elif self.type == QueryType.BOOL:
-            return self._evaluate_for_compound_query_type(document)
+            return self._find_ordinals_for_range_query_type(fake_index)
         elif self.type == QueryType.FILTER:
-            return self._evaluate_for_compound_query_type(document)
-        elif self.type == QueryType.MUST:
-            return self._evaluate_for_compound_query_type(document)
+            return self._find_ordinals_for_filter_query_type(fake_index)
+        elif self.type in (QueryType.BOOL, QueryType.MUST):
+            return self._find_ordinals_for_compound_query_type(fake_index)
         elif self.type == QueryType.SHOULD:
-            return self._evaluate_for_should_query_type(document)
+            return self._find_ordinals_for_should_query_type(fake_index)
         elif self.type == QueryType.MULTI_MATCH:
-            return self._evaluate_for_multi_match_query_type(document)
+            return self._find_ordinals_for_multi_match_query_type(fake_index)
         elif self.type == QueryType.MUST_NOT:
-            return self._evaluate_for_must_not_query_type(document)
-        else:
-            raise NotImplementedError('Fake query evaluation not implemented for query type: %s' % self.type)
+            return self._find_ordinals_for_must_not_query_type(fake_index)
+        return None
 
-    def _evaluate_for_match_query_type(self, document):
-        return self._evaluate_for_field(document, True)
+    def _find_ordinals_for_field(self, fake_index, ignore_case):
+        return self._union_term_ordinals(fake_index, self.condition.items(), ignore_case)
 
-    def _evaluate_for_term_query_type(self, document):
-        return self._evaluate_for_field(document, False)
+    def _find_ordinals_for_terms_query_type(self, fake_index):
+        field_terms = ((field, term) for field in self.condition for term in self.condition[field])
+        return self._union_term_ordinals(fake_index, field_terms, False)
 
-    def _evaluate_for_terms_query_type(self, document):
-        for field in self.condition:
-            for term in self.condition[field]:
-                if FakeQueryCondition(QueryType.TERM, {field: term}).evaluate(document):
-                    return True
-        return False
-
-    def _evaluate_for_field(self, document, ignore_case):
-        doc_source = document['_source']
-        return_val = False
-        for field, value in self.condition.items():
-            return_val = self._compare_value_for_field(
-                doc_source,
-                field,
-                value,
-                ignore_case
-            )
-            if return_val:
-                break
-        return return_val
+    def _find_ordinals_for_range_query_type(self, fake_index):
+        # Only the first field of a range query is evaluated
+        for field, comparisons in self.condition.items():
+            return fake_index.find_range_ordinals(field, comparisons)
+        return set()
 
-    def _evaluate_for_fields(self, document):
-        doc_source = document['_source']
-        return_val = False
+    def _find_ordinals_for_multi_match_query_type(self, fake_index):
         value = self.condition.get('query')
         if not value:
-            return return_val
-        fields = self.condition.get('fields', [])
-        for field in fields:
-            return_val = self._compare_value_for_field(
-                doc_source,
-                field,
-                value,
-                True
-            )
-            if return_val:
-                break
+            return set()
+        field_terms = ((field, value) for field in self.condition.get('fields', []))
+        return self._union_term_ordinals(fake_index, field_terms, True)
 
-        return return_val
-
-    def _evaluate_for_range_query_type(self, document):
-        for field, comparisons in self.condition.items():
-            doc_val = document['_source']
-            for k in field.split("."):
-                if hasattr(doc_val, k):
-                    doc_val = getattr(doc_val, k)
-                elif k in doc_val:
-                    doc_val = doc_val[k]
-                else:
-                    return False
+    @staticmethod
+    def _union_term_ordinals(fake_index, field_terms, ignore_case):
+        ordinals = set()
+        for field, value in field_terms:
+            field_ordinals = fake_index.find_term_ordinals(field, value, ignore_case)
+            if field_ordinals is None:
+                return None
+            ordinals |= field_ordinals
+        return ordinals
+
+    def _find_ordinals_for_compound_query_type(self, fake_index):
+        ordinals = None
+        unresolved = []
+        for sub_condition in self.sub_conditions:
+            sub_ordinals = sub_condition.find_ordinals(fake_index)
+            if sub_ordinals is None:
+                unresolved.append(sub_condition)
+            elif ordinals is None:
+                ordinals = sub_ordinals
+            else:
+                ordinals &= sub_ordinals
+
+        return self._filter_unresolved(fake_index, ordinals, unresolved)
+
+    def _find_ordinals_for_filter_query_type(self, fake_index):
+        """Intersects the matches of each filter clause as bitmaps cached in
+        FILTER_CACHE for the current generation of fake_index"""
+        bitmap = None
+        unresolved = []
+        for sub_condition, cache_key in zip(self.sub_conditions, self._filter_cache_keys):
+            sub_bitmap = self._get_filter_bitmap(fake_index, sub_condition, cache_key)
+            if sub_bitmap is None:
+                unresolved.append(sub_condition)
+            elif bitmap is None:
+                bitmap = sub_bitmap
+            else:
+                bitmap &= sub_bitmap
 
-            if isinstance(doc_val, list):
-                return False
+        ordinals = None if bitmap is None else bitmap_to_ordinals(bitmap)
+        return self._filter_unresolved(fake_index, ordinals, unresolved)
 
-            for sign, value in comparisons.items():
-                if isinstance(doc_val, datetime.datetime):
-                    value = dateutil.parser.isoparse(value)
-                if sign == 'gte':
-                    if doc_val < value:
-                        return False
-                elif sign == 'gt':
-                    if doc_val <= value:
-                        return False
-                elif sign == 'lte':
-                    if doc_val > value:
-                        return False
-                elif sign == 'lt':
-                    if doc_val >= value:
-                        return False
-                else:
-                    raise ValueError(f"Invalid comparison type {sign}")
-            return True
+    @staticmethod
+    def _get_filter_bitmap(fake_index, sub_condition, cache_key):
+        if cache_key is None:
+            return None
+        key = (fake_index.generation, cache_key)
+        bitmap = FILTER_CACHE.get(key)
+        if bitmap is None:
+            ordinals = sub_condition.find_ordinals(fake_index)
+            if ordinals is None:
+                # Clauses the index can't answer are evaluated on every
+                # document once, then served from the cache
+                ordinals = [
+                    ordinal for ordinal, document in fake_index.iter_items()
+                    if sub_condition.evaluate(document)
+                ]
+            bitmap = ordinals_to_bitmap(ordinals)
+            FILTER_CACHE.put(key, bitmap)
+        return bitmap
 
-    def _evaluate_for_compound_query_type(self, document):
-        return_val = False
+    @staticmethod
+    def _filter_unresolved(fake_index, ordinals, unresolved):
+        if ordinals is None:
+            # An empty compound query matches nothing
+            return None if unresolved else set()
+        if unresolved:
+            ordinals = {
+                document_ordinal for document_ordinal in ordinals
+                if document_ordinal in fake_index.ordinals() and all(
+                    sub_condition.evaluate(fake_index.get_by_ordinal(document_ordinal))
+                    for sub_condition in unresolved
+                )
+            }
+        return ordinals
+
+    def _find_ordinals_for_should_query_type(self, fake_index):
+        if not isinstance(self.condition, list):
+            return None
+        ordinals = set()
+        for sub_condition in self.sub_conditions:
+            sub_ordinals = sub_condition.find_ordinals(fake_index)
+            if sub_ordinals is None:
+                return None
+            ordinals |= sub_ordinals
+        return ordinals
+
+    def _find_ordinals_for_must_not_query_type(self, fake_index):
+        excluded = set()
+        for sub_condition in self.sub_conditions:
+            sub_ordinals = sub_condition.find_ordinals(fake_index)
+            if sub_ordinals is None:
+                return None
+            excluded |= sub_ordinals
+        return set(fake_index.ordinals()) - excluded
+
+    def _get_sub_conditions(self):
         if isinstance(self.condition, dict):
-            for query_type, sub_query in self.condition.items():
-                return_val = FakeQueryCondition(
-                    QueryType.get_query_type(query_type),
-                    sub_query
-                ).evaluate(document)
-                if not return_val:
-                    return False
+            return [
+                FakeQueryCondition(QueryType.get_query_type(query_type), sub_query)
+                for query_type, sub_query in self.condition.items()
+            ]
         elif isinstance(self.condition, list):
-            for sub_condition in self.condition:
-                for sub_condition_key in sub_condition:
-                    return_val = FakeQueryCondition(
-                        QueryType.get_query_type(sub_condition_key),
-                        sub_condition[sub_condition_key]
-                    ).evaluate(document)
-                    if not return_val:
-                        return False
+            return [
+                FakeQueryCondition(QueryType.get_query_type(sub_condition_key), sub_condition[sub_condition_key])
+                for sub_condition in self.condition
+                for sub_condition_key in sub_condition
+            ]
+        return []
 
-        return return_val
+    @staticmethod
+    def _compile_field_values(field_values, ignore_case):
+        compiled = []
+        for field, value in field_values:
+            if ignore_case and isinstance(value, str):
+                value = value.lower()
+            compiled.append((get_field_key(field), value, str(value), ignore_case))
+        return compiled
+
+    def _compile_range(self, condition):
+        # Only the first field of a range query is evaluated
+        for field, comparisons in condition.items():
+            self._range_path = field.split('.')
+            for sign, value in comparisons.items():
+                self._range_comparisons.append((sign, value))
+                try:
+                    if self._range_epoch_comparisons is not None:
+                        self._range_epoch_comparisons.append((sign, get_epoch(value)))
+                except UnsupportedValue:
+                    self._range_epoch_comparisons = None
+            break
 
-    def _evaluate_for_must_not_query_type(self, document):
-        if isinstance(self.condition, dict):
-            for query_type, sub_query in self.condition.items():
-                return_val = FakeQueryCondition(
-                    QueryType.get_query_type(query_type),
-                    sub_query
-                ).evaluate(document)
-                if return_val:
-                    return False
-        elif isinstance(self.condition, list):
-            for sub_condition in self.condition:
-                for sub_condition_key in sub_condition:
-                    return_val = FakeQueryCondition(
-                        QueryType.get_query_type(sub_condition_key),
-                        sub_condition[sub_condition_key]
-                    ).evaluate(document)
-                    if return_val:
-                        return False
+    def _evaluate_for_match_all_query_type(self, document):
         return True
 
-    def _evaluate_for_should_query_type(self, document):
-        return_val = False
-        for sub_condition in self.condition:
-            for sub_condition_key in sub_condition:
-                return_val = FakeQueryCondition(
-                    QueryType.get_query_type(sub_condition_key),
-                    sub_condition[sub_condition_key]
-                ).evaluate(document)
-                if return_val:
-                    return True
-        return return_val
-
-    def _evaluate_for_multi_match_query_type(self, document):
-        return self._evaluate_for_fields(document)
-
-    def _compare_value_for_field(self, doc_source, field, value, ignore_case):
-        if ignore_case and isinstance(value, str):
-            value = value.lower()
-
-        doc_val = doc_source
-        # Remove boosting
-        field, *_ = field.split("*")
-        for k in field.split("."):
+    def _evaluate_for_field(self, document):
+        doc_source = document.source
+        for field_key, value, value_str, ignore_case in self._field_values:
+            if self._compare_value_for_field(doc_source, field_key, value, value_str, ignore_case):
+                return True
+        return False
+
+    def _evaluate_for_range_query_type(self, document):
+        if self._range_path is None:
+            return None
+
+        doc_val = document.source
+        for k in self._range_path:
             if hasattr(doc_val, k):
                 doc_val = getattr(doc_val, k)
-                break
             elif k in doc_val:
                 doc_val = doc_val[k]
-                break
             else:
                 return False
 
+        if isinstance(doc_val, list):
+            return False
+
+        comparisons = self._range_comparisons
+        if isinstance(doc_val, datetime.datetime):
+            doc_val, comparisons = get_epoch(doc_val), self._range_epoch_comparisons
+            if comparisons is None:
+                raise ValueError(f"Invalid date range bounds {dict(self._range_comparisons)}")
+
+        for sign, value in comparisons:
+            if sign == 'gte':
+                if doc_val < value:
+                    return False
+            elif sign == 'gt':
+                if doc_val <= value:
+                    return False
+            elif sign == 'lte':
+                if doc_val > value:
+                    return False
+            elif sign == 'lt':
+                if doc_val >= value:
+                    return False
+            else:
+                raise ValueError(f"Invalid comparison type {sign}")
+        return True
+
+    def _evaluate_for_compound_query_type(self, document):
+        for sub_condition in self.sub_conditions:
+            if not sub_condition.evaluate(document):
+                return False
+        return bool(self.sub_conditions)
+
+    def _evaluate_for_must_not_query_type(self, document):
+        for sub_condition in self.sub_conditions:
+            if sub_condition.evaluate(document):
+                return False
+        return True
+
+    def _evaluate_for_should_query_type(self, document):
+        for sub_condition in self.sub_conditions:
+            if sub_condition.evaluate(document):
+                return True
+        return False
+
+    def _evaluate_for_unsupported_query_type(self, document):
+        raise NotImplementedError('Fake query evaluation not implemented for query type: %s' % self.type)
+
+    @staticmethod
+    def _compare_value_for_field(doc_source, field_key, value, value_str, ignore_case):
+        # Fields are resolved by their first path element only
+        if hasattr(doc_source, field_key):
+            doc_val = getattr(doc_source, field_key)
+        elif field_key in doc_source:
+            doc_val = doc_source[field_key]
+        else:
+            return False
+
         if not isinstance(doc_val, list):
             doc_val = [doc_val]
 
         for val in doc_val:
             if not isinstance(val, (int, float, complex)) or val is None:
-                val = str(val)
+                # Datetimes match by their ISO form, as in the term index
+                val = val.isoformat() if isinstance(val, datetime.datetime) else str(val)
                 if ignore_case:
                     val = val.lower()
 
             if value == val:
                 return True
-            if isinstance(val, str) and str(value) in val:
+            if isinstance(val, str) and value_str in val:
                 return True
 
         return False
 
 
+QUERY_PLAN_CACHE = LRUCache(maxsize=256)
+# Bitmaps of the documents matching filter clauses, bounded to 64MB
+FILTER_CACHE = LRUCache(maxsize=64 * 1024 * 1024, getsizeof=sys.getsizeof)
+REQUEST_CACHE_SIZE = 1000
+# Sorted matches of the recent sorted searches of a client, so that
+# search_after pages reuse them
+SORTED_MATCHES_CACHE_SIZE = 16
+# Sorted searches for from + size hits up to a quarter of their matches
+# select them with a bounded heap instead of sorting all matches
+TOP_K_RATIO = 4
+# Bitmaps of the documents of each slice, for recent sliced searches
+SLICE_CACHE = LRUCache(maxsize=64)
+_SLICE_LOCK = threading.Lock()
+
+
 @for_all_methods([server_failure])
 class FakeElasticsearch(Elasticsearch):
     __documents_dict = None
 
     def __init__(self, hosts=None, transport_class=None, **kwargs):
         self.__documents_dict = {}
-        self.__scrolls = {}
+        self.__scroll_contexts = ScrollContexts()
+        self.__points_in_time = PointsInTime()
+        # Guards __documents_dict; each index has its own lock
+        self.__lock = threading.RLock()
+        self.__request_cache = LRUCache(maxsize=REQUEST_CACHE_SIZE)
+        self.__sorted_matches_cache = LRUCache(maxsize=SORTED_MATCHES_CACHE_SIZE)
         self.transport = Transport(_normalize_hosts(hosts), **kwargs)
 
     @property
@@ -323,6 +503,78 @@ class FakeElasticsearch(Elasticsearch):
             'tagline': 'You Know, for Search'
         }
 
+    def snapshot(self):
+        """Returns a copy-on-write snapshot of all indexes, to be given to
+        restore. Later writes don't change the snapshot."""
+        snapshot = {}
+        for name, fake_index in list(self.__documents_dict.items()):
+            with fake_index.lock.read_locked():
+                snapshot[name] = fake_index.fork()
+        return snapshot
+
+    def restore(self, snapshot):
+        """Resets all indexes to the given snapshot, which stays reusable"""
+        documents_dict = {name: fake_index.fork() for name, fake_index in snapshot.items()}
+        with self.__lock:
+            self.__documents_dict = documents_dict
+            self.__scroll_contexts = ScrollContexts()
+            points_in_time, self.__points_in_time = self.__points_in_time, PointsInTime()
+        self.__sorted_matches_cache.clear()
+        points_in_time.close_all()
+
+    def fork(self):
+        """Returns a new instance sharing the current indexes copy-on-write"""
+        forked = copy.copy(self)
+        forked.__lock = threading.RLock()
+        forked.__points_in_time = PointsInTime()
+        forked.__request_cache = LRUCache(maxsize=REQUEST_CACHE_SIZE)
+        forked.__sorted_matches_cache = LRUCache(maxsize=SORTED_MATCHES_CACHE_SIZE)
+        forked.restore(self.snapshot())
+        return forked
+
+    def request_cache_stats(self):
+        """Returns the hits, misses and size of the request cache"""
+        return self.__request_cache.info()
+
+    def clear_request_cache(self):
+        self.__request_cache.clear()
+
+    def sorted_matches_cache_stats(self):
+        """Returns the hits, misses and size of the sorted matches cache"""
+        return self.__sorted_matches_cache.info()
+
+    def clear_sorted_matches_cache(self):
+        """Drops the sorted matches of past searches, and with them the
+        indexes they hold"""
+        self.__sorted_matches_cache.clear()
+
+    def save_snapshot(self, directory):
+        """Writes all indexes, derived data included, to a file of directory
+        named by the sha256 of its content, and returns its path"""
+        documents_dict = dict(self.__documents_dict)
+        with self._read_locked(documents_dict.values()):
+            return write_snapshot_file(documents_dict, directory)
+
+    def load_snapshot(self, path, freeze=False):
+        """Restores the indexes written to path by save_snapshot. freeze
+        calls gc.freeze() afterwards, for the whole process."""
+        self.restore(read_snapshot_file(path, freeze=freeze))
+
+    def publish_image(self, directory):
+        """Writes all indexes to an image file of directory, named by the
+        sha256 of its content, for other processes to attach_image, and
+        returns its path"""
+        documents_dict = dict(self.__documents_dict)
+        with self._read_locked(documents_dict.values()):
+            return write_shared_image(documents_dict, directory)
+
+    def attach_image(self, path, freeze=False):
+        """Restores the indexes of the image at path, written by
+        publish_image. Sources are read from the mapped file, shared with
+        every process attaching it, and writes only change this instance.
+        freeze calls gc.freeze() afterwards, for the whole process."""
+        self.restore(read_shared_image(path, freeze=freeze))
+
     @query_params('consistency',
                   'op_type',
                   'parent',
@@ -335,8 +587,7 @@ class FakeElasticsearch(Elasticsearch):
                   'version',
                   'version_type')
     def index(self, index, body, doc_type='_doc', id=None, params=None, headers=None):
-        if index not in self.__documents_dict:
-            self.__documents_dict[index] = list()
+        fake_index = self._get_or_create_index(index)
 
         version = 1
 
@@ -344,20 +595,12 @@ class FakeElasticsearch(Elasticsearch):
         if id is None:
             id = get_random_id()
 
-        elif self.exists(index, id, doc_type=doc_type, params=params):
-            doc = self.get(index, id, doc_type=doc_type, params=params)
-            version = doc['_version'] + 1
-            self.delete(index, id, doc_type=doc_type)
+        with fake_index.lock.write_locked():
+            previous = fake_index.put(id, doc_type, body)
+        if previous is not None:
+            version = previous.version + 1
             result = 'updated'
 
-        self.__documents_dict[index].append({
-            '_type': doc_type,
-            '_id': id,
-            '_source': body,
-            '_index': index,
-            '_version': version
-        })
-
         return {
             '_type': doc_type,
             '_id': id,
@@ -373,108 +616,131 @@ class FakeElasticsearch(Elasticsearch):
         items = []
         errors = False
 
-        for raw_line in body.splitlines():
-            if len(raw_line.strip()) > 0:
-                line = json.loads(raw_line)
+        actions = iter_bulk_actions(iter_json_lines(iter_body_lines(body)))
+        for bulk_result in self._iter_bulk_results(actions, index):
+            errors = errors or bulk_result[-1]
+            items.append(self._make_bulk_item(*bulk_result))
+        return {
+            'errors': errors,
+            'items': items
+        }
 
-                if any(action in line for action in ['index', 'create', 'update', 'delete']):
-                    action = next(iter(line.keys()))
+    def _iter_bulk_results(self, actions, index=None):
+        """Applies (action, meta, source) bulk actions as they come. Yields
+        (action, doc_type, id, index, status, result, error) for each, from
+        which _make_bulk_item builds the response item when needed."""
+        for action, meta, source in actions:
+            index = meta.get('_index') or index
+            doc_type = meta.get('_type', "_doc")  # _type is deprecated in 7.x
 
-                    version = 1
-                    index = line[action].get('_index') or index
-                    doc_type = line[action].get('_type', "_doc")  # _type is deprecated in 7.x
+            if action in ['delete', 'update'] and not meta.get("_id"):
+                raise RequestError(400, 'action_request_validation_exception', 'missing id')
 
-                    if action in ['delete', 'update'] and not line[action].get("_id"):
-                        raise RequestError(400, 'action_request_validation_exception', 'missing id')
+            document_id = meta['_id'] if '_id' in meta else get_random_id()
+            fake_index = self._get_or_create_index(index)
+            with fake_index.lock.write_locked():
+                status, result, error = self._apply_bulk_action(action, fake_index, document_id, doc_type, source)
+            yield action, doc_type, document_id, index, status, result, error
+
+    @staticmethod
+    def _make_bulk_item(action, doc_type, document_id, index, status, result, error):
+        item = {
+            '_type': doc_type,
+            '_id': document_id,
+            '_index': index,
+            '_version': 1,
+            'status': status,
+        }
+        item['error' if error else 'result'] = result
+        return {action: item}
+
+    def load_ndjson(self, source, index=None, doc_type='_doc', chunk_size=DEFAULT_CHUNK_SIZE):
+        """Indexes an NDJSON file, given as a path (gzip if it ends with .gz)
+        or an open file, reading chunk_size lines at a time and without
+        building a response per document. Lines are either bulk actions,
+        each followed by its source, or one document each, in which case
+        index is required. Returns ingestion stats, throughput included."""
+        start = time.perf_counter()
+        if isinstance(source, (str, os.PathLike)):
+            opener = gzip.open if os.fspath(source).endswith('.gz') else open
+            with opener(source, 'rb') as ndjson_file:
+                documents, errors = self._load_ndjson_lines(ndjson_file, index, doc_type, chunk_size)
+        else:
+            documents, errors = self._load_ndjson_lines(source, index, doc_type, chunk_size)
+        took = time.perf_counter() - start
 
-                    document_id = line[action].get('_id', get_random_id())
-
-                    if action == 'delete':
-                        status, result, error = self._validate_action(
-                            action, index, document_id, doc_type, params=params
-                        )
-                        item = {action: {
-                            '_type': doc_type,
-                            '_id': document_id,
-                            '_index': index,
-                            '_version': version,
-                            'status': status,
-                        }}
-                        if error:
-                            errors = True
-                            item[action]["error"] = result
-                        else:
-                            self.delete(index, document_id, doc_type=doc_type, params=params)
-                            item[action]["result"] = result
-                        items.append(item)
-
-                    if index not in self.__documents_dict:
-                        self.__documents_dict[index] = list()
-                else:
-                    if 'doc' in line and action == 'update':
-                        source = line['doc']
-                    else:
-                        source = line
-                    status, result, error = self._validate_action(
-                        action, index, document_id, doc_type, params=params
-                    )
-                    item = {
-                        action: {
-                            '_type': doc_type,
-                            '_id': document_id,
-                            '_index': index,
-                            '_version': version,
-                            'status': status,
-                        }
-                    }
-                    if not error:
-                        item[action]["result"] = result
-                        if self.exists(index, document_id, doc_type=doc_type, params=params):
-                            doc = self.get(index, document_id, doc_type=doc_type, params=params)
-                            version = doc['_version'] + 1
-                            self.delete(index, document_id, doc_type=doc_type, params=params)
-
-                        self.__documents_dict[index].append({
-                            '_type': doc_type,
-                            '_id': document_id,
-                            '_source': source,
-                            '_index': index,
-                            '_version': version
-                        })
-                    else:
-                        errors = True
-                        item[action]["error"] = result
-                    items.append(item)
         return {
+            'documents': documents,
             'errors': errors,
-            'items': items
+            'took': took,
+            'docs_per_second': documents / took if took else float(documents),
         }
 
-    def _validate_action(self, action, index, document_id, doc_type, params=None):
-        if action in ['index', 'update'] and self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 200, 'updated', False
-        if action == 'create' and self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 409, 'version_conflict_engine_exception', True
-        elif action in ['index', 'create'] and not self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 201, 'created', False
-        elif action == "delete" and self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 200, 'deleted', False
-        elif action == 'update' and not self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 404, 'document_missing_exception', True
-        elif action == 'delete' and not self.exists(index, id=document_id, doc_type=doc_type, params=params):
-            return 404, 'not_found', True
+    def _load_ndjson_lines(self, lines, index, doc_type, chunk_size):
+        documents = errors = 0
+        lines = iter_json_lines(lines, chunk_size)
+        first_line = next(lines, None)
+        if first_line is None:
+            return documents, errors
+        lines = itertools.chain([first_line], lines)
+
+        if is_bulk_action(first_line):
+            for action, meta, doc_source in iter_bulk_actions(lines):
+                document_id = meta.get('_id')
+                if document_id is None:
+                    if action in ['delete', 'update']:
+                        raise RequestError(400, 'action_request_validation_exception', 'missing id')
+                    document_id = get_random_id()
+                fake_index = self._get_or_create_index(self._get_ndjson_index(meta.get('_index') or index))
+                with fake_index.lock.write_locked():
+                    _, _, error = self._apply_bulk_action(
+                        action, fake_index, document_id, meta.get('_type', doc_type), doc_source
+                    )
+                if error:
+                    errors += 1
+                else:
+                    documents += 1
         else:
-            raise NotImplementedError(f"{action} behaviour hasn't been implemented")
+            fake_index = self._get_or_create_index(self._get_ndjson_index(index))
+            for doc_source in lines:
+                with fake_index.lock.write_locked():
+                    fake_index.put(get_random_id(), doc_type, doc_source)
+                documents += 1
+        return documents, errors
+
+    @staticmethod
+    def _get_ndjson_index(index):
+        if index is None:
+            raise ValueError('index is required for lines without an _index')
+        return index
+
+    @staticmethod
+    def _apply_bulk_action(action, fake_index, document_id, doc_type, source):
+        """Applies one bulk action, looking the document up once for index
+        and delete actions. Returns its status, result (or error) and
+        whether it failed."""
+        if action in ['create', 'update']:
+            existing = fake_index.get(document_id, doc_type)
+            if action == 'create' and existing is not None:
+                return 409, 'version_conflict_engine_exception', True
+            elif action == 'update' and existing is None:
+                return 404, 'document_missing_exception', True
+        elif action == 'delete':
+            if fake_index.remove(document_id, doc_type) is None:
+                return 404, 'not_found', True
+            return 200, 'deleted', False
+
+        if fake_index.put(document_id, doc_type, source) is None:
+            return 201, 'created', False
+        return 200, 'updated', False
 
     @query_params('parent', 'preference', 'realtime', 'refresh', 'routing')
     def exists(self, index, id, doc_type=None, params=None, headers=None):
-        result = False
-        if index in self.__documents_dict:
-            for document in self.__documents_dict[index]:
-                if document.get('_id') == id and document.get('_type') == doc_type:
-                    result = True
-                    break
-        return result
+        fake_index = self.__documents_dict.get(index)
+        if fake_index is None:
+            return False
+        with fake_index.lock.read_locked():
+            return fake_index.get(id, doc_type) is not None
 
     @query_params('_source', '_source_exclude', '_source_include', 'fields',
                   'parent', 'preference', 'realtime', 'refresh', 'routing', 'version',
@@ -483,18 +749,13 @@ class FakeElasticsearch(Elasticsearch):
         ignore = extract_ignore_as_iterable(params)
         result = None
 
-        if index in self.__documents_dict:
-            for document in self.__documents_dict[index]:
-                if document.get('_id') == id:
-                    if doc_type == '_all':
-                        result = document
-                        break
-                    else:
-                        if document.get('_type') == doc_type:
-                            result = document
-                            break
+        fake_index = self.__documents_dict.get(index)
+        if fake_index is not None:
+            with fake_index.lock.read_locked():
+                result = fake_index.get(id, doc_type)
 
         if result:
+            result = result.to_dict()
             result['found'] = True
             return result
         elif params and 404 in ignore:
@@ -570,7 +831,7 @@ class FakeElasticsearch(Elasticsearch):
             params=params, headers=headers)
         if matches['hits']['total']:
             for hit in matches['hits']['hits']:
-                body = hit['_source']
+                body = copy_json(hit['_source'])
                 body.update(new_values)
                 self.index(index, body, doc_type=hit['_type'], id=hit['_id'])
                 total_updated += 1
@@ -630,13 +891,25 @@ class FakeElasticsearch(Elasticsearch):
                   'track_scores', 'version')
     def count(self, index=None, doc_type=None, body=None, params=None, headers=None):
         searchable_indexes = self._normalize_index_to_list(index)
-
-        i = 0
-        for searchable_index in searchable_indexes:
-            for document in self.__documents_dict[searchable_index]:
-                if doc_type and document.get('_type') != doc_type:
-                    continue
-                i += 1
+        doc_types = self._normalize_doc_type_to_list(doc_type)
+        cache_key = self._get_request_cache_key('count', searchable_indexes, doc_type, body, params)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+        # Only a query parameter of count, whose body is its query alone
+        terminate_after = int(params.get('terminate_after', 0))
+        fake_indexes = [self.__documents_dict[searchable_index] for searchable_index in searchable_indexes]
+        with self._read_locked(fake_indexes):
+            conditions = ()
+            if body and 'query' in body:
+                conditions = FakeQueryCondition.compile(body['query'])
+            # Counted the way searches count their hits, without a page: from
+            # the partitions when nothing filters, then from the term and
+            # range indexes, reading documents only when neither can tell
+            _, i, terminated_early = self._collect_hits(
+                fake_indexes, None, conditions, doc_types, None, 0, 0, True, terminate_after
+            )
         result = {
             'count': i,
             '_shards': {
@@ -646,11 +919,296 @@ class FakeElasticsearch(Elasticsearch):
                 'total': 1
             }
         }
+        if terminate_after:
+            result['terminated_early'] = terminated_early
 
+        self._cache_response(cache_key, result)
         return result
 
-    def _get_fake_query_condition(self, query_type_str, condition):
-        return FakeQueryCondition(QueryType.get_query_type(query_type_str), condition)
+    def _make_search_result(self, documents, total, shards, sort_values=None, track_total_hits=True,
+                            terminated_early=False):
+        hits = []
+        for position, document in enumerate(documents):
+            hit = document.to_hit()
+            hit['_score'] = 1.0
+            if sort_values is not None:
+                hit['sort'] = sort_values[position]
+            hits.append(hit)
+
+        result = {
+            'hits': {
+                'total': {'value': total, 'relation': 'eq'},
+                'max_score': 1.0,
+                'hits': hits,
+            },
+            '_shards': {
+                # Simulate indexes with 1 shard each
+                'successful': shards,
+                'skipped': 0,
+                'failed': 0,
+                'total': shards
+            },
+            'took': 1,
+            'timed_out': False
+        }
+        if track_total_hits is False:
+            del result['hits']['total']
+        elif track_total_hits is not True and total > track_total_hits:
+            result['hits']['total'] = {'value': track_total_hits, 'relation': 'gte'}
+        if terminated_early:
+            result['terminated_early'] = True
+        return result
+
+    def _get_request_cache_key(self, method, searchable_indexes, doc_type, body, params):
+        """Returns the request cache key of a search or count, or None when
+        its response must not be cached. Like the shard request cache, only
+        requests without hits are cached unless request_cache is true."""
+        request_cache = self._get_param_as_str(params, 'request_cache').lower()
+        if request_cache == 'false' or 'scroll' in params:
+            return None
+        if request_cache != 'true' and method == 'search':
+            size = self._get_param_as_str(params, 'size')
+            if not size and body:
+                size = str(body.get('size', ''))
+            if size != '0':
+                return None
+
+        request = get_canonical_key([method, searchable_indexes, doc_type, body, params])
+        if request is None:
+            return None
+        generations = tuple(self.__documents_dict[index].generation for index in searchable_indexes)
+        return request, generations
+
+    @staticmethod
+    def _get_param_as_str(params, name):
+        # query_params escapes values to bytes
+        value = params.get(name, '')
+        if isinstance(value, bytes):
+            return value.decode()
+        return str(value)
+
+    def _get_cached_response(self, cache_key):
+        if cache_key is None:
+            return None
+        response = self.__request_cache.get(cache_key)
+        return copy.deepcopy(response) if response is not None else None
+
+    def _cache_response(self, cache_key, response):
+        if cache_key is not None:
+            self.__request_cache.put(cache_key, copy.deepcopy(response))
+
+    def _find_matches(self, fake_indexes, views, conditions, doc_types, slice_=None, terminate_after=0):
+        """Returns the matching documents, index by index in insertion order,
+        with the (index, matched ordinals) pairs of each index. With views,
+        the documents each view sees are searched instead of live ones, and
+        with a slice, only the documents in it. terminate_after bounds the
+        matches of each index."""
+        matches = []
+        matched_ordinals = []
+        for position, fake_index in enumerate(fake_indexes):
+            plan = self._plan_index_search(fake_index, views[position] if views else None, conditions, slice_)
+            index_ordinals = []
+            matched_ordinals.append((fake_index, index_ordinals))
+
+            for ordinal, document in self._iter_index_matches(fake_index, plan, conditions, doc_types, slice_):
+                matches.append(document)
+                index_ordinals.append(ordinal)
+                if len(index_ordinals) == terminate_after:
+                    break
+        return matches, matched_ordinals
+
+    def _collect_hits(self, fake_indexes, views, conditions, doc_types, slice_, from_, size, track_total_hits,
+                      terminate_after):
+        """Returns the matching documents from from_ to from_ + size, how many
+        documents matched, and whether terminate_after stopped the search.
+        Matches are read one at a time, only the page is kept, and reading
+        stops once the page is full and as many matches as track_total_hits
+        asks have been counted. Indexes whose query resolves to ordinals are
+        counted from them, reading only the documents of the page."""
+        end = from_ + int(size) if size is not None else None
+        if track_total_hits is True or end is None:
+            count_limit = None
+        elif track_total_hits is False:
+            count_limit = end
+        else:
+            # One more than the cap tells whether there are more
+            count_limit = max(end, track_total_hits + 1)
+
+        page = []
+        total = 0
+        terminated_early = False
+        for position, fake_index in enumerate(fake_indexes):
+            if count_limit is not None and total >= count_limit:
+                break
+            plan = self._plan_index_search(fake_index, views[position] if views else None, conditions, slice_)
+            ordinals, evaluate, check_slice, view = plan
+            if end is not None and not (evaluate or check_slice or view or terminate_after):
+                # Matches are known without reading documents: only read
+                # those of the page
+                index_total = fake_index.count_items(ordinals, doc_types)
+                if total + index_total > from_ and total < end:
+                    matches = self._iter_index_matches(fake_index, plan, conditions, doc_types, slice_)
+                    skip = max(from_ - total, 0)
+                    page.extend(document for _, document in itertools.islice(
+                        matches, skip, min(index_total, end - total)
+                    ))
+                total += index_total
+                continue
+
+            index_total = 0
+            for _, document in self._iter_index_matches(fake_index, plan, conditions, doc_types, slice_):
+                if from_ <= total and (end is None or total < end):
+                    page.append(document)
+                total += 1
+                index_total += 1
+                if index_total == terminate_after:
+                    terminated_early = True
+                    break
+                if count_limit is not None and total >= count_limit:
+                    break
+        return page, total, terminated_early
+
+    def _plan_index_search(self, fake_index, view, conditions, slice_):
+        """Returns how to find the matches of fake_index: the ordinals they
+        are among, or None for any, whether each must still be evaluated and
+        checked for slice_, and the view to read instead of live documents"""
+        if view is not None and view.generation != fake_index.generation:
+            # Term, range and column structures only know live documents
+            return None, bool(conditions), slice_ is not None, view
+
+        if any(condition.type == QueryType.MATCH_ALL for condition in conditions):
+            # Any of the conditions matching is enough
+            conditions = ()
+        ordinals = self._find_ordinals(fake_index, conditions) if conditions else None
+        evaluate = bool(conditions) and ordinals is None
+        if slice_ is not None:
+            slice_ordinals = bitmap_to_ordinals(self._get_slice_bitmap(fake_index, slice_))
+            ordinals = slice_ordinals if ordinals is None else ordinals & slice_ordinals
+        return ordinals, evaluate, False, None
+
+    @staticmethod
+    def _iter_index_matches(fake_index, plan, conditions, doc_types, slice_):
+        ordinals, evaluate, check_slice, view = plan
+        if view is None:
+            items = fake_index.iter_items(ordinals, doc_types)
+        else:
+            items = fake_index.iter_view_items(view, doc_types)
+        for ordinal, document in items:
+            if evaluate and not any(condition.evaluate(document) for condition in conditions):
+                continue
+            if check_slice and not slice_.contains(document):
+                continue
+            yield ordinal, document
+
+    @staticmethod
+    def _get_slice_bitmap(fake_index, slice_):
+        """Returns the bitmap of the documents of fake_index in slice_. The
+        documents of every slice are found in one pass, cached in SLICE_CACHE
+        for the current generation of fake_index, so that each slice of a
+        sliced scroll only reads its own documents."""
+        key = (fake_index.generation, slice_.field, slice_.max)
+        bitmaps = SLICE_CACHE.get(key)
+        if bitmaps is None:
+            with _SLICE_LOCK:
+                bitmaps = SLICE_CACHE.get(key)
+                if bitmaps is None:
+                    slices = [[] for _ in range(slice_.max)]
+                    for ordinal, document in fake_index.iter_items():
+                        for slice_id in slice_.get_slices(document):
+                            slices[slice_id].append(ordinal)
+                    bitmaps = [ordinals_to_bitmap(ordinals) for ordinals in slices]
+                    SLICE_CACHE.put(key, bitmaps)
+        return bitmaps[slice_.id]
+
+    def _find_sorted_matches(self, fake_indexes, views, conditions, doc_types, slice_, terminate_after, sort, from_,
+                             size, search_after, body, params, point_in_time):
+        """Returns the matches of a sorted search with their matched ordinals,
+        then either their SortedMatches, or the sort entries of its first
+        from_ + size hits when those are few enough to pick with a heap.
+        SortedMatches are kept in the sorted matches cache while the indexes or
+        the point in time of the search stay the same, so that pages after
+        the first are a bisect away."""
+        if point_in_time is not None:
+            state = point_in_time.id
+        else:
+            state = tuple(fake_index.generation for fake_index in fake_indexes)
+        request = get_canonical_key([
+            body.get('query') if body else None, body.get('sort') if body else None,
+            self._get_param_as_str(params, 'sort'), doc_types, body.get('slice') if body else None, terminate_after,
+        ])
+        cache_key = None if request is None else (state, request)
+        sorted_matches = self.__sorted_matches_cache.get(cache_key) if cache_key is not None else None
+        if sorted_matches is not None:
+            return sorted_matches.matches, sorted_matches.matched_ordinals, sorted_matches, None
+
+        matches, matched_ordinals = self._find_matches(
+            fake_indexes, views, conditions, doc_types, slice_, terminate_after
+        )
+        # Doc values only hold the documents indexes have now
+        live = None if views is None else [
+            view.generation == fake_index.generation for fake_index, view in zip(fake_indexes, views)
+        ]
+        top = from_ + int(size) if size is not None else None
+        if search_after is None and 'scroll' not in params and top is not None \
+                and top * TOP_K_RATIO <= len(matches):
+            return matches, matched_ordinals, None, sort.nsmallest(top, matches, matched_ordinals, live)
+
+        sorted_matches = SortedMatches(matches, matched_ordinals, sort, live)
+        if cache_key is not None:
+            self.__sorted_matches_cache.put(cache_key, sorted_matches)
+        return matches, matched_ordinals, sorted_matches, None
+
+    def _get_point_in_time(self, index, body):
+        pit = body.get('pit') if body else None
+        if pit is None:
+            return None
+        if index:
+            raise RequestError(400, 'action_request_validation_exception',
+                               '[indices] cannot be used with point in time')
+        keep_alive = parse_time_value(pit['keep_alive']) if pit.get('keep_alive') else None
+        return self.__points_in_time.get(pit.get('id'), keep_alive)
+
+    @classmethod
+    def _get_track_total_hits(cls, body, params):
+        """Returns True to count all matches, False to count none, or the
+        number of matches to count before reporting a lower bound"""
+        if body and 'track_total_hits' in body:
+            track_total_hits = body['track_total_hits']
+        else:
+            track_total_hits = cls._get_param_as_str(params, 'track_total_hits') or True
+        if isinstance(track_total_hits, str):
+            track_total_hits = {'true': True, 'false': False}.get(track_total_hits.lower(), track_total_hits)
+        if isinstance(track_total_hits, bool):
+            return track_total_hits
+        try:
+            track_total_hits = int(track_total_hits)
+        except (TypeError, ValueError):
+            raise RequestError(400, 'illegal_argument_exception',
+                               'failed to parse [track_total_hits] [{0}]'.format(track_total_hits))
+        if track_total_hits < -1:
+            raise RequestError(400, 'illegal_argument_exception',
+                               '[track_total_hits] parameter must be positive or equals to -1')
+        # -1 disables tracking
+        return track_total_hits if track_total_hits >= 0 else False
+
+    @staticmethod
+    def _get_sort(body, params, point_in_time):
+        sort = body.get('sort') if body and 'sort' in body else params.get('sort')
+        sort = Sort.parse(sort) if sort else None
+        if point_in_time is not None:
+            # Hits of a point in time are sorted by a unique tiebreaker last
+            sort = sort.with_tiebreaker() if sort is not None else Sort([SortField(SHARD_DOC_FIELD)])
+        return sort
+
+    @staticmethod
+    def _find_ordinals(fake_index, conditions):
+        ordinals = set()
+        for condition in conditions:
+            condition_ordinals = condition.find_ordinals(fake_index)
+            if condition_ordinals is None:
+                return None
+            ordinals |= condition_ordinals
+        return ordinals
 
     @query_params(
         "ccs_minimize_roundtrips",
@@ -691,103 +1249,155 @@ class FakeElasticsearch(Elasticsearch):
                   'preference', 'q', 'request_cache', 'routing', 'scroll', 'search_type',
                   'size', 'sort', 'stats', 'suggest_field', 'suggest_mode',
                   'suggest_size', 'suggest_text', 'terminate_after', 'timeout',
-                  'track_scores', 'version')
+                  'track_scores', 'track_total_hits', 'version')
     def search(self, index=None, doc_type=None, body=None, params=None, headers=None):
-        searchable_indexes = self._normalize_index_to_list(index)
-
-        matches = []
-        conditions = []
-
-        if body and 'query' in body:
-            query = body['query']
-            for query_type_str, condition in query.items():
-                conditions.append(self._get_fake_query_condition(query_type_str, condition))
-        for searchable_index in searchable_indexes:
-
-            for document in self.__documents_dict[searchable_index]:
-
-                if doc_type:
-                    if isinstance(doc_type, list) and document.get('_type') not in doc_type:
-                        continue
-                    if isinstance(doc_type, str) and document.get('_type') != doc_type:
-                        continue
-                if conditions:
-                    for condition in conditions:
-                        if condition.evaluate(document):
-                            matches.append(document)
-                            break
+        doc_types = self._normalize_doc_type_to_list(doc_type)
+        point_in_time = self._get_point_in_time(index, body)
+        if point_in_time is None:
+            searchable_indexes = self._normalize_index_to_list(index)
+            cache_key = self._get_request_cache_key('search', searchable_indexes, doc_type, body, params)
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+            fake_indexes = [self.__documents_dict[searchable_index] for searchable_index in searchable_indexes]
+            views = None
+        else:
+            # Searches through a point in time read its views and aren't cached
+            cache_key = None
+            fake_indexes = [fake_index for fake_index, _ in point_in_time.views]
+            views = [view for _, view in point_in_time.views]
+
+        sort = self._get_sort(body, params, point_in_time)
+        size = params.get('size', body.get('size') if body else None)
+        # The client passes from_ on as it is given
+        from_ = int(params.get('from_', params.get('from', body.get('from', 0) if body else 0)))
+        search_after = body.get('search_after') if body else None
+        if search_after is not None and sort is None:
+            raise RequestError(400, 'illegal_argument_exception', 'search_after requires a sort')
+        if search_after is not None and from_ > 0:
+            raise RequestError(400, 'illegal_argument_exception',
+                               '[from] parameter must be set to 0 when [search_after] is used')
+        track_total_hits = self._get_track_total_hits(body, params)
+        terminate_after = int(params.get('terminate_after', body.get('terminate_after', 0) if body else 0))
+        slice_ = None
+        if body and body.get('slice') is not None:
+            if 'scroll' not in params and point_in_time is None:
+                raise RequestError(400, 'action_request_validation_exception',
+                                   '[slice] can only be used with [scroll] or [point-in-time] requests')
+            slice_ = Slice.parse(body['slice'])
+
+        with self._read_locked(fake_indexes):
+            conditions = ()
+            if body and 'query' in body:
+                conditions = FakeQueryCondition.compile(body['query'])
+
+            aggregate = body is not None and 'aggs' in body
+            page_sort_values = None
+            if sort is None and 'scroll' not in params and not aggregate:
+                # Nothing needs the matches beyond the page
+                page, total, terminated_early = self._collect_hits(
+                    fake_indexes, views, conditions, doc_types, slice_, from_, size, track_total_hits, terminate_after
+                )
+            else:
+                sorted_matches = top_entries = None
+                if sort is None:
+                    matches, matched_ordinals = self._find_matches(
+                        fake_indexes, views, conditions, doc_types, slice_, terminate_after
+                    )
                 else:
-                    matches.append(document)
-
-        for match in matches:
-            self._find_and_convert_data_types(match['_source'])
-
-        result = {
-            'hits': {
-                'total': {'value': len(matches), 'relation': 'eq'},
-                'max_score': 1.0
-            },
-            '_shards': {
-                # Simulate indexes with 1 shard each
-                'successful': len(searchable_indexes),
-                'skipped': 0,
-                'failed': 0,
-                'total': len(searchable_indexes)
-            },
-            'took': 1,
-            'timed_out': False
-        }
-
-        hits = []
-        for match in matches:
-            match['_score'] = 1.0
-            hits.append(match)
-
-        # build aggregations
-        if body is not None and 'aggs' in body:
-            aggregations = {}
-
-            for aggregation, definition in body['aggs'].items():
-                aggregations[aggregation] = {
-                    "doc_count_error_upper_bound": 0,
-                    "sum_other_doc_count": 0,
-                    "buckets": self.make_aggregation_buckets(definition, matches)
-                }
+                    matches, matched_ordinals, sorted_matches, top_entries = self._find_sorted_matches(
+                        fake_indexes, views, conditions, doc_types, slice_, terminate_after, sort, from_, size,
+                        search_after, body, params, point_in_time,
+                    )
+                total = len(matches)
+                terminated_early = bool(terminate_after) and any(
+                    len(ordinals) == terminate_after for _, ordinals in matched_ordinals
+                )
+
+                if 'scroll' in params:
+                    documents = sorted_matches.documents if sorted_matches is not None else matches
+                    # Scan searches of clients before elasticsearch 5 give
+                    # their first hits on the first scroll
+                    scroll_context, page = self.__scroll_contexts.open(
+                        documents, int(size if size is not None else 10), parse_time_value(params['scroll']),
+                        from_, len(fake_indexes), self._get_param_as_str(params, 'search_type') != 'scan',
+                    )
+                elif top_entries is not None:
+                    page = [document for _, _, document in top_entries[from_:]]
+                    page_sort_values = [values for _, values, _ in top_entries[from_:]]
+                elif sorted_matches is not None:
+                    start = from_
+                    if search_after is not None:
+                        start = bisect.bisect_right(sorted_matches.keys, sort.get_key(search_after))
+                    end = start + int(size) if size is not None else None
+                    page = sorted_matches.documents[start:end]
+                    page_sort_values = sorted_matches.sort_values[start:end]
+                else:
+                    page = matches[from_:from_ + int(size)] if size is not None else matches[from_:]
 
-            if aggregations:
-                result['aggregations'] = aggregations
-
-        if 'scroll' in params:
-            result['_scroll_id'] = str(get_random_scroll_id())
-            params['size'] = int(params.get('size', 10))
-            params['from'] = int(params.get('from') + params.get('size') if 'from' in params else 0)
-            self.__scrolls[result.get('_scroll_id')] = {
-                'index': index,
-                'doc_type': doc_type,
-                'body': body,
-                'params': params
-            }
-            hits = hits[params.get('from'):params.get('from') + params.get('size')]
-        elif 'size' in params:
-            hits = hits[:int(params['size'])]
-        elif body and 'size' in body:
-            hits = hits[:int(body['size'])]
+            result = self._make_search_result(
+                page, total, len(fake_indexes), page_sort_values, track_total_hits, terminated_early
+            )
+            if 'scroll' in params:
+                result['_scroll_id'] = scroll_context.id
+            if point_in_time is not None:
+                result['pit_id'] = point_in_time.id
+
+            # build aggregations
+            if body is not None and 'aggs' in body:
+                aggregations = {}
+
+                for aggregation, definition in body['aggs'].items():
+                    aggregations[aggregation] = {
+                        "doc_count_error_upper_bound": 0,
+                        "sum_other_doc_count": 0,
+                        "buckets": self.make_aggregation_buckets(definition, matches, matched_ordinals)
+                    }
 
-        result['hits']['hits'] = hits
+                if aggregations:
+                    result['aggregations'] = aggregations
 
+        self._cache_response(cache_key, result)
         return result
 
     @query_params('scroll')
-    def scroll(self, scroll_id, params=None, headers=None):
-        scroll = self.__scrolls.pop(scroll_id)
-        result = self.search(
-            index=scroll.get('index'),
-            doc_type=scroll.get('doc_type'),
-            body=scroll.get('body'),
-            params=scroll.get('params')
-        )
+    def scroll(self, scroll_id=None, body=None, params=None, headers=None):
+        if scroll_id is None and body:
+            scroll_id = body.get('scroll_id')
+            params.setdefault('scroll', body.get('scroll'))
+        keep_alive = parse_time_value(params['scroll']) if params.get('scroll') else None
+
+        scroll_context, page = self.__scroll_contexts.next_page(scroll_id, keep_alive)
+        result = self._make_search_result(page, len(scroll_context.documents), scroll_context.shards)
+        result['_scroll_id'] = scroll_context.id
         return result
 
+    @query_params()
+    def clear_scroll(self, body=None, scroll_id=None, params=None, headers=None):
+        if scroll_id is None and body:
+            scroll_id = body.get('scroll_id') if isinstance(body, dict) else body
+        if isinstance(scroll_id, str):
+            scroll_id = scroll_id.split(',')
+        if scroll_id is not None and '_all' in scroll_id:
+            scroll_id = None
+
+        return {'succeeded': True, 'num_freed': self.__scroll_contexts.clear(scroll_id)}
+
+    @query_params('expand_wildcards', 'ignore_unavailable', 'keep_alive', 'preference', 'routing')
+    def open_point_in_time(self, index=None, params=None, headers=None):
+        if isinstance(index, str):
+            index = index.split(',')
+        keep_alive = self._get_param_as_str(params, 'keep_alive')
+        if not keep_alive:
+            raise RequestError(400, 'action_request_validation_exception', '[keep_alive] is not specified')
+        fake_indexes = [self.__documents_dict[name] for name in self._normalize_index_to_list(index)]
+        return {'id': self.__points_in_time.open(fake_indexes, parse_time_value(keep_alive)).id}
+
+    @query_params()
+    def close_point_in_time(self, body=None, params=None, headers=None):
+        closed = self.__points_in_time.close(body.get('id') if body else None)
+        return {'succeeded': True, 'num_freed': int(closed)}
+
     @query_params('consistency', 'parent', 'refresh', 'replication', 'routing',
                   'timeout', 'version', 'version_type')
     def delete(self, index, id, doc_type=None, params=None, headers=None):
@@ -795,15 +1405,11 @@ class FakeElasticsearch(Elasticsearch):
         found = False
         ignore = extract_ignore_as_iterable(params)
 
-        if index in self.__documents_dict:
-            for document in self.__documents_dict[index]:
-                if document.get('_id') == id:
-                    found = True
-                    if doc_type and document.get('_type') != doc_type:
-                        found = False
-                    if found:
-                        self.__documents_dict[index].remove(document)
-                        break
+        fake_index = self.__documents_dict.get(index)
+        if fake_index is not None:
+            with fake_index.lock.write_locked():
+                removed = fake_index.remove(id, doc_type or ALL_DOC_TYPES)
+            found = removed is not None
 
         result_dict = {
             'found': found,
@@ -846,10 +1452,40 @@ class FakeElasticsearch(Elasticsearch):
             ]
         return result_dict
 
+    def _get_or_create_index(self, index):
+        fake_index = self.__documents_dict.get(index)
+        if fake_index is None:
+            with self.__lock:
+                fake_index = self.__documents_dict.get(index)
+                if fake_index is None:
+                    fake_index = self.__documents_dict[index] = FakeIndex(index)
+        return fake_index
+
+    @staticmethod
+    @contextmanager
+    def _read_locked(fake_indexes):
+        # Read locks aren't reentrant, so each index is locked once. They are
+        # taken in one order whatever the order of fake_indexes: as waiting
+        # writers go first, two searches locking a and b in opposite orders
+        # could otherwise each wait on a writer queued behind the other.
+        fake_indexes = {id(fake_index): fake_index for fake_index in fake_indexes}.values()
+        with ExitStack() as stack:
+            for fake_index in sorted(fake_indexes, key=lambda fake_index: (fake_index.name, id(fake_index))):
+                stack.enter_context(fake_index.lock.read_locked())
+            yield
+
+    @staticmethod
+    def _normalize_doc_type_to_list(doc_type):
+        if not doc_type:
+            return None
+        elif isinstance(doc_type, str):
+            return [doc_type]
+        return doc_type
+
     def _normalize_index_to_list(self, index):
         # Ensure to have a list of index
         if index is None:
-            searchable_indexes = self.__documents_dict.keys()
+            searchable_indexes = list(self.__documents_dict)
         elif isinstance(index, str) or isinstance(index, unicode):
             searchable_indexes = [index]
         elif isinstance(index, list):
@@ -865,20 +1501,12 @@ class FakeElasticsearch(Elasticsearch):
 
         return searchable_indexes
 
-    @classmethod
-    def _find_and_convert_data_types(cls, document):
-        for key, value in document.items():
-            if isinstance(value, dict):
-                cls._find_and_convert_data_types(value)
-            elif isinstance(value, datetime.datetime):
-                document[key] = value.isoformat()
-
-    def make_aggregation_buckets(self, aggregation, documents):
+    def make_aggregation_buckets(self, aggregation, documents, matched_ordinals=None):
         if 'composite' in aggregation:
-            return self.make_composite_aggregation_buckets(aggregation, documents)
+            return self.make_composite_aggregation_buckets(aggregation, documents, matched_ordinals)
         return []
 
-    def make_composite_aggregation_buckets(self, aggregation, documents):
+    def make_composite_aggregation_buckets(self, aggregation, documents, matched_ordinals=None):
 
         def make_key(doc_source, agg_source):
             attr = list(agg_source.values())[0]["terms"]["field"]
@@ -887,14 +1515,14 @@ class FakeElasticsearch(Elasticsearch):
         def make_bucket(bucket_key, bucket):
             out = {
                 "key": {k: v for k, v in zip(bucket_key_fields, bucket_key)},
-                "doc_count": len(bucket),
+                "doc_count": get_doc_count(bucket),
             }
 
             for metric_key, metric_definition in aggregation["aggs"].items():
                 metric_type_str = list(metric_definition)[0]
                 metric_type = MetricType.get_metric_type(metric_type_str)
                 attr = metric_definition[metric_type_str]["field"]
-                data = [doc[attr] for doc in bucket]
+                data = get_values(bucket, attr)
 
                 if metric_type == MetricType.CARDINALITY:
                     value = len(set(data))
@@ -907,11 +1535,78 @@ class FakeElasticsearch(Elasticsearch):
         agg_sources = aggregation["composite"]["sources"]
         buckets = defaultdict(list)
         bucket_key_fields = [list(src)[0] for src in agg_sources]
-        for document in documents:
-            doc_src = document["_source"]
-            key = tuple(make_key(doc_src, agg_src) for agg_src in aggregation["composite"]["sources"])
-            buckets[key].append(doc_src)
+        columns = self._get_composite_aggregation_columns(aggregation, matched_ordinals)
+        if columns is not None:
+            # Group ordinals by encoded keys, decoding each distinct key once
+            for fake_index, ordinals in matched_ordinals:
+                key_columns = [columns[fake_index, attr] for attr in self._get_composite_key_fields(aggregation)]
+                encoded_keys = zip(*(column.read_encoded(ordinals) for column in key_columns))
+                groups = defaultdict(list)
+                for ordinal, encoded_key in zip(ordinals, encoded_keys):
+                    groups[encoded_key].append(ordinal)
+                for encoded_key, group in groups.items():
+                    key = tuple(
+                        self._decode_doc_value(column, value) for column, value in zip(key_columns, encoded_key)
+                    )
+                    buckets[key].append((fake_index, group))
+
+            def get_values(bucket, attr):
+                data = []
+                for fake_index, ordinals in bucket:
+                    column = columns[fake_index, attr]
+                    encoded = column.read_encoded(ordinals)
+                    decoded = {value: self._decode_doc_value(column, value) for value in set(encoded)}
+                    data.extend(decoded[value] for value in encoded)
+                return data
+
+            def get_doc_count(bucket):
+                return sum(len(ordinals) for _, ordinals in bucket)
+        else:
+            for document in documents:
+                doc_src = document.hit_source
+                key = tuple(make_key(doc_src, agg_src) for agg_src in aggregation["composite"]["sources"])
+                buckets[key].append(doc_src)
+
+            def get_values(bucket, attr):
+                return [doc[attr] for doc in bucket]
+
+            def get_doc_count(bucket):
+                return len(bucket)
 
         buckets = sorted(((k, v) for k, v in buckets.items()), key=lambda x: x[0])
         buckets = [make_bucket(bucket_key, bucket) for bucket_key, bucket in buckets]
         return buckets
+
+    @staticmethod
+    def _get_composite_key_fields(aggregation):
+        return [list(src.values())[0]["terms"]["field"] for src in aggregation["composite"]["sources"]]
+
+    def _get_composite_aggregation_columns(self, aggregation, matched_ordinals):
+        """Returns the doc values columns by (index, field) for the fields
+        used by a composite aggregation, or None when some matched document
+        has no column value for them"""
+        if matched_ordinals is None:
+            return None
+        try:
+            fields = self._get_composite_key_fields(aggregation)
+            for metric_definition in aggregation.get("aggs", {}).values():
+                fields.append(list(metric_definition.values())[0]["field"])
+        except (AttributeError, IndexError, KeyError, TypeError):
+            return None
+
+        columns = {}
+        for fake_index, ordinals in matched_ordinals:
+            for field in fields:
+                column = fake_index.get_column(field)
+                if column is None or not column.contains_all(ordinals):
+                    return None
+                columns[fake_index, field] = column
+        return columns
+
+    @staticmethod
+    def _decode_doc_value(column, value):
+        value = column.decode(value)
+        # Search hits expose datetimes in their ISO form
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return value
@@ -0,0 +1,904 @@
+# -*- coding: utf-8 -*-
+
+import array
+import bisect
+import copy
+import datetime
+import functools
+import heapq
+import itertools
+import pickle
+import threading
+
+import dateutil.parser
+
+from elasticmock.utilities import copy_json
+from elasticmock.utilities.rwlock import ReadWriteLock
+
+ALL_DOC_TYPES = '_all'
+
+parse_datetime = functools.lru_cache(maxsize=256)(dateutil.parser.isoparse)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class UnsupportedValue(Exception):
+    pass
+
+
+def isoformat_dates(value):
+    """Returns value with the datetimes it holds in their ISO form, the one
+    search hits give. Only the dicts and lists leading to them are copied,
+    so value itself is never changed."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    elif isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return value
+
+    converted = None
+    for key, item in items:
+        converted_item = isoformat_dates(item)
+        if converted_item is not item:
+            if converted is None:
+                converted = copy.copy(value)
+            converted[key] = converted_item
+    return converted if converted is not None else value
+
+
+def get_epoch(value):
+    """Returns the microseconds since the epoch of a datetime or of its ISO
+    form, naive ones being UTC. Raises UnsupportedValue for anything else."""
+    if isinstance(value, str):
+        try:
+            value = parse_datetime(value)
+        except ValueError:
+            raise UnsupportedValue(value)
+    if not isinstance(value, datetime.datetime):
+        raise UnsupportedValue(value)
+    offset = value.utcoffset()
+    if offset is not None:
+        value = value.replace(tzinfo=None) - offset
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def get_field_key(field):
+    # Queries resolve fields by their first path element, boost removed
+    field, *_ = field.split('*')
+    return field.split('.')[0]
+
+
+def _iter_field_values(value):
+    values = value if isinstance(value, list) else [value]
+    for value in values:
+        if isinstance(value, (int, float, complex)):
+            yield value, None
+        elif isinstance(value, datetime.datetime):
+            yield None, value.isoformat()
+        else:
+            yield None, str(value)
+
+
+class TermIndex:
+    """Inverted index of top-level field values to document ordinals.
+
+    It follows the rules of the ``term``/``match`` evaluation: numbers
+    match by equality, anything else matches when the searched value is
+    a substring of its string form. Substring matches walk the distinct
+    values of the field, never the documents. Datetimes are indexed by
+    their ISO form, the one search hits expose, and values are those at
+    index time: in-place changes to a stored ``_source`` are not seen.
+    """
+
+    def __init__(self):
+        self._numbers = {}
+        self._strings = {}
+        self._lowercase_strings = {}
+        self.complete = True
+
+    def add(self, ordinal, source):
+        if not isinstance(source, dict):
+            self.complete = False
+            return
+        for field, number, string in self._iter_terms(source):
+            if string is None:
+                self._numbers.setdefault(field, {}).setdefault(number, set()).add(ordinal)
+            else:
+                self._strings.setdefault(field, {}).setdefault(string, set()).add(ordinal)
+                self._lowercase_strings.setdefault(field, {}).setdefault(string.lower(), set()).add(ordinal)
+
+    def remove(self, ordinal, source):
+        if not isinstance(source, dict):
+            return
+        for field, number, string in self._iter_terms(source):
+            if string is None:
+                self._discard(self._numbers, field, number, ordinal)
+            else:
+                self._discard(self._strings, field, string, ordinal)
+                self._discard(self._lowercase_strings, field, string.lower(), ordinal)
+
+    def find(self, field, value, ignore_case):
+        """Returns the ordinals whose field matches value, or None if the
+        field can't be answered from the index"""
+        field = get_field_key(field)
+        if not self.complete or hasattr(dict, field):
+            return None
+
+        if ignore_case and isinstance(value, str):
+            value = value.lower()
+
+        ordinals = set()
+        try:
+            ordinals.update(self._numbers.get(field, {}).get(value, ()))
+        except TypeError:
+            # Unhashable values never equal a number
+            pass
+
+        needle = str(value)
+        strings = self._lowercase_strings if ignore_case else self._strings
+        for term, postings in strings.get(field, {}).items():
+            if needle in term:
+                ordinals.update(postings)
+        return ordinals
+
+    def copy(self):
+        other = TermIndex()
+        for name in ('_numbers', '_strings', '_lowercase_strings'):
+            setattr(other, name, {
+                field: {term: set(postings) for term, postings in terms.items()}
+                for field, terms in getattr(self, name).items()
+            })
+        other.complete = self.complete
+        return other
+
+    @staticmethod
+    def _iter_terms(source):
+        for field, value in source.items():
+            for number, string in _iter_field_values(value):
+                yield field, number, string
+
+    @staticmethod
+    def _discard(terms, field, term, ordinal):
+        postings = terms.get(field, {}).get(term)
+        if postings is None:
+            return
+        postings.discard(ordinal)
+        if not postings:
+            del terms[field][term]
+            if not terms[field]:
+                del terms[field]
+
+
+def resolve_field_path(source, path):
+    """Resolves a dotted path the way range queries do. Raises KeyError
+    when the path is missing and UnsupportedValue when resolving it
+    involves anything but plain dict lookups"""
+    value = source
+    for key in path.split('.'):
+        if hasattr(value, key):
+            raise UnsupportedValue(path)
+        try:
+            if key not in value:
+                raise KeyError(path)
+            value = value[key]
+        except TypeError:
+            raise UnsupportedValue(path)
+    return value
+
+
+def _get_range_domain(value):
+    if isinstance(value, (int, float)):
+        return 'number'
+    elif isinstance(value, datetime.datetime):
+        return 'date'
+    elif isinstance(value, str):
+        return 'string'
+    raise UnsupportedValue(value)
+
+
+def _convert_range_bound(domain, bound):
+    if domain == 'number':
+        if isinstance(bound, (int, float)):
+            return bound
+    elif domain == 'date':
+        return get_epoch(bound)
+    elif isinstance(bound, str):
+        return bound
+    raise UnsupportedValue(bound)
+
+
+class SortedField:
+    """Sorted ``(value, ordinal)`` entries of one field, for range queries.
+
+    A field can only be answered when all its values are comparable with
+    each other (numbers, datetimes by their epoch, or strings);
+    otherwise ``indexable`` is cleared and queries fall back to per
+    document evaluation. Lists are skipped, as range queries never match
+    them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.domain = None
+        self.indexable = True
+        self._entries = []
+        self._values = {}
+
+    def build(self, documents):
+        for ordinal, document in documents:
+            self._add_value(ordinal, document.source)
+        self._entries = sorted((value, ordinal) for ordinal, value in self._values.items())
+
+    def copy(self):
+        other = SortedField(self.path)
+        other.domain = self.domain
+        other.indexable = self.indexable
+        other._entries = list(self._entries)
+        other._values = dict(self._values)
+        return other
+
+    def add(self, ordinal, source):
+        if self._add_value(ordinal, source):
+            bisect.insort(self._entries, (self._values[ordinal], ordinal))
+
+    def remove(self, ordinal):
+        value = self._values.pop(ordinal, None)
+        if value is None:
+            return
+        position = bisect.bisect_left(self._entries, (value, ordinal))
+        del self._entries[position]
+
+    def find(self, comparisons):
+        if not self.indexable or not isinstance(comparisons, dict):
+            return None
+        if self.domain is None:
+            return set()
+
+        start, end = 0, len(self._entries)
+        for sign, bound in comparisons.items():
+            try:
+                bound = _convert_range_bound(self.domain, bound)
+            except UnsupportedValue:
+                return None
+            if sign == 'gte':
+                start = max(start, bisect.bisect_left(self._entries, (bound, -1)))
+            elif sign == 'gt':
+                start = max(start, bisect.bisect_right(self._entries, (bound, float('inf'))))
+            elif sign == 'lte':
+                end = min(end, bisect.bisect_right(self._entries, (bound, float('inf'))))
+            elif sign == 'lt':
+                end = min(end, bisect.bisect_left(self._entries, (bound, -1)))
+            else:
+                return None
+        return {ordinal for _, ordinal in self._entries[start:end]}
+
+    def _add_value(self, ordinal, source):
+        if not self.indexable:
+            return False
+        try:
+            value = resolve_field_path(source, self.path)
+        except KeyError:
+            return False
+        except UnsupportedValue:
+            self._set_unindexable()
+            return False
+        if isinstance(value, list):
+            return False
+
+        try:
+            domain = _get_range_domain(value)
+        except UnsupportedValue:
+            self._set_unindexable()
+            return False
+        if self.domain is None:
+            self.domain = domain
+        elif self.domain != domain:
+            self._set_unindexable()
+            return False
+
+        self._values[ordinal] = get_epoch(value) if domain == 'date' else value
+        return True
+
+    def _set_unindexable(self):
+        self.indexable = False
+        self._entries = []
+        self._values = {}
+
+
+class Column:
+    """Doc values of one top-level field, stored by ordinal.
+
+    Subclasses keep values in typed arrays; ``present`` tells which
+    ordinals have a value. Values a column can't encode (mixed kinds,
+    lists, objects) mark it unsupported, and readers then go back to the
+    ``_source`` of each document.
+    """
+    typecode = None
+
+    def __init__(self, field):
+        self.field = field
+        self.supported = True
+        self.present = bytearray()
+        self.values = array.array(self.typecode)
+
+    def copy(self):
+        other = copy.copy(self)
+        other.present = bytearray(self.present)
+        other.values = array.array(self.typecode, self.values)
+        return other
+
+    @staticmethod
+    def for_value(field, value):
+        if isinstance(value, bool):
+            return UnsupportedColumn(field)
+        elif isinstance(value, int):
+            return LongColumn(field)
+        elif isinstance(value, float):
+            return DoubleColumn(field)
+        elif isinstance(value, datetime.datetime):
+            return DateColumn(field, value.tzinfo)
+        elif isinstance(value, str):
+            return KeywordColumn(field)
+        return UnsupportedColumn(field)
+
+    def add(self, ordinal, value):
+        if not self.supported:
+            return
+        try:
+            encoded = self.encode(value)
+            missing = ordinal + 1 - len(self.present)
+            if missing > 0:
+                self.present.extend(bytes(missing))
+                self.values.frombytes(bytes(missing * self.values.itemsize))
+            self.values[ordinal] = encoded
+        except (TypeError, OverflowError):
+            self.supported = False
+            self.present = bytearray()
+            self.values = array.array(self.typecode)
+            return
+        self.present[ordinal] = 1
+
+    def remove(self, ordinal):
+        if ordinal < len(self.present):
+            self.present[ordinal] = 0
+
+    def contains_all(self, ordinals):
+        present = self.present
+        size = len(present)
+        return all(ordinal < size and present[ordinal] for ordinal in ordinals)
+
+    def get(self, ordinal):
+        return self.decode(self.values[ordinal])
+
+    def read_encoded(self, ordinals):
+        values = self.values
+        return [values[ordinal] for ordinal in ordinals]
+
+    def encode(self, value):
+        raise NotImplementedError()
+
+    def decode(self, value):
+        return value
+
+
+class UnsupportedColumn:
+
+    def __init__(self, field):
+        self.field = field
+        self.supported = False
+
+    def copy(self):
+        return self
+
+    def add(self, ordinal, value):
+        pass
+
+    def remove(self, ordinal):
+        pass
+
+
+class LongColumn(Column):
+    typecode = 'q'
+
+    def encode(self, value):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError(value)
+        return value
+
+
+class DoubleColumn(Column):
+    typecode = 'd'
+
+    def encode(self, value):
+        if not isinstance(value, float):
+            raise TypeError(value)
+        return value
+
+
+class DateColumn(Column):
+    """Datetimes sharing one tzinfo, as microseconds since the epoch"""
+    typecode = 'q'
+
+    def __init__(self, field, tzinfo):
+        super().__init__(field)
+        self.tzinfo = tzinfo
+
+    def encode(self, value):
+        if not isinstance(value, datetime.datetime) or value.tzinfo != self.tzinfo:
+            raise TypeError(value)
+        return get_epoch(value)
+
+    def decode(self, value):
+        value = _EPOCH + value * _MICROSECOND
+        if self.tzinfo is None:
+            return value
+        return value.replace(tzinfo=datetime.timezone.utc).astimezone(self.tzinfo)
+
+
+class KeywordColumn(Column):
+    """Strings, dictionary encoded: values holds codes into terms"""
+    typecode = 'l'
+
+    def __init__(self, field):
+        super().__init__(field)
+        self.terms = []
+        self._codes = {}
+
+    def copy(self):
+        other = super().copy()
+        other.terms = list(self.terms)
+        other._codes = dict(self._codes)
+        return other
+
+    def encode(self, value):
+        if not isinstance(value, str):
+            raise TypeError(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.terms)
+            self.terms.append(value)
+        return code
+
+    def decode(self, value):
+        return self.terms[value]
+
+
+class DocValues:
+    """Columnar side store of an index, with one column per top-level
+    field read through it. A column is built on first use and is then
+    kept up to date as documents are indexed and deleted."""
+
+    def __init__(self):
+        # A field maps to None until one of its values has been seen
+        self._columns = {}
+
+    def get_column(self, field, documents):
+        """Returns the column of field, or None if it can't be stored in one"""
+        if field not in self._columns:
+            self._columns[field] = None
+            for ordinal, document in documents:
+                self._add_to_column(field, ordinal, document.source)
+
+        column = self._columns[field]
+        if column is None or not column.supported:
+            return None
+        return column
+
+    def copy(self):
+        other = DocValues()
+        other._columns = {
+            field: column.copy() if column is not None else None
+            for field, column in self._columns.items()
+        }
+        return other
+
+    def add(self, ordinal, source):
+        for field in self._columns:
+            self._add_to_column(field, ordinal, source)
+
+    def remove(self, ordinal):
+        for column in self._columns.values():
+            if column is not None:
+                column.remove(ordinal)
+
+    def _add_to_column(self, field, ordinal, source):
+        if not isinstance(source, dict) or field not in source:
+            return
+        column = self._columns[field]
+        if column is None:
+            column = self._columns[field] = Column.for_value(field, source[field])
+        column.add(ordinal, source[field])
+
+
+class FakeDocument:
+    """A stored document. ``index`` and ``type`` reference the names kept
+    by its index and partition, so documents don't hold copies of them.
+    ``hit_source`` is the ``_source`` search hits give, datetimes in their
+    ISO form; it is ``source`` itself when that holds none. Responses give
+    copies of them."""
+    __slots__ = ('index', 'type', 'id', 'source', 'hit_source', 'version')
+
+    def __init__(self, index, type, id, source, version):
+        self.index = index
+        self.type = type
+        self.id = id
+        self.source = source
+        self.hit_source = isoformat_dates(source)
+        self.version = version
+
+    def to_dict(self):
+        return self._to_dict(self.source)
+
+    def to_hit(self):
+        """Returns the document as a search hit gives it"""
+        return self._to_dict(self.hit_source)
+
+    def _to_dict(self, source):
+        return {
+            '_type': self.type,
+            '_id': self.id,
+            '_source': copy_json(source),
+            '_index': self.index,
+            '_version': self.version
+        }
+
+
+_SOURCE_SLOT = FakeDocument.source
+_HIT_SOURCE_SLOT = FakeDocument.hit_source
+
+
+class MappedDocument(FakeDocument):
+    """A document whose ``_source`` stays pickled in a buffer shared with
+    other processes, such as a mapped file. It is unpickled on every read,
+    so the process never keeps its own copy; in-place changes to what is
+    read are not stored."""
+    __slots__ = ('buffer', 'start', 'end')
+
+    def __init__(self, index, type, id, version, buffer, start, end):
+        super().__init__(index, type, id, None, version)
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    @property
+    def source(self):
+        return pickle.loads(self.buffer[self.start:self.end])
+
+    @source.setter
+    def source(self, value):
+        _SOURCE_SLOT.__set__(self, value)
+
+    @property
+    def hit_source(self):
+        return isoformat_dates(self.source)
+
+    @hit_source.setter
+    def hit_source(self, value):
+        _HIT_SOURCE_SLOT.__set__(self, value)
+
+    def __reduce__(self):
+        # Pickled as the plain document it stands for, buffers being local
+        return FakeDocument, (self.index, self.type, self.id, self.source, self.version)
+
+
+class DocTypePartition:
+    """Documents of one _type, as an ``_id`` -> ordinal map. Writes always
+    re-insert ids, so the map is in ordinal order too."""
+    __slots__ = ('doc_type', 'ids')
+
+    def __init__(self, doc_type):
+        self.doc_type = doc_type
+        self.ids = {}
+
+    def copy(self):
+        other = DocTypePartition(self.doc_type)
+        other.ids = dict(self.ids)
+        return other
+
+
+class IndexView:
+    """Point in time of an index: its generation then, and the first
+    ordinal written after"""
+    __slots__ = ('generation', 'next_ordinal')
+
+    def __init__(self, generation, next_ordinal):
+        self.generation = generation
+        self.next_ordinal = next_ordinal
+
+
+# Shared by all indexes so that a recreated index never reuses a generation
+_generations = itertools.count(1)
+# Guards the counts of sharers, which forks holding different locks update
+_SHARERS_LOCK = threading.Lock()
+
+
+class FakeIndex:
+    """Documents stored for a single index.
+
+    Documents are kept by ordinal, a number assigned on every write, so
+    iterating the index yields them in insertion order. Each _type has its
+    own partition, used for point lookups by ``_id`` and for reading or
+    counting the documents of some types without touching the others.
+
+    ``fork`` returns an index sharing all of this state. Whichever side
+    writes first while it is shared takes its own copy, so writes on a
+    fork never reach the index it came from, or the other way round.
+
+    ``generation`` changes on every write, so results computed from an
+    index stay valid as long as its generation is the same.
+
+    Callers share ``lock`` between threads: reads, searches included, hold
+    it as readers and writes as its only writer. Term, range and column
+    structures built on first use are built under a lock of their own, as
+    readers may ask for them together. Forks share it with these
+    structures until they are written to.
+
+    ``open_view`` pins the documents as they are, for point in time reads.
+    While views are open, documents replaced or deleted are retired with
+    the generation that removed them rather than dropped, so a view reads
+    the live documents it predates plus the retired ones it still sees.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._documents = {}
+        self._partitions = {}
+        self._next_ordinal = 0
+        # Built on first term lookup, like sorted fields on first range
+        self.terms = None
+        self._sorted_fields = {}
+        self.doc_values = DocValues()
+        # Shared by all the forks still using the same state
+        self._sharers = [1]
+        self.generation = next(_generations)
+        self.lock = ReadWriteLock()
+        self._build_lock = threading.Lock()
+        # Generations of the open views, and the documents they may still see
+        self._views = []
+        self._retired = {}
+
+    def __iter__(self):
+        return iter(self._documents.values())
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __getstate__(self):
+        # Sharing, generations, locks and views only exist within a process,
+        # so they are not pickled
+        state = self.__dict__.copy()
+        for name in ('_sharers', 'generation', 'lock', '_build_lock', '_views', '_retired'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sharers = [1]
+        self.generation = next(_generations)
+        self.lock = ReadWriteLock()
+        self._build_lock = threading.Lock()
+        self._views = []
+        self._retired = {}
+
+    @classmethod
+    def from_documents(cls, name, documents):
+        """Returns an index of documents, in their order. Documents must have
+        distinct (_type, _id) pairs and be named after the index."""
+        fake_index = cls(name)
+        for ordinal, document in enumerate(documents):
+            partition = fake_index._partitions.get(document.type)
+            if partition is None:
+                partition = fake_index._partitions[document.type] = DocTypePartition(document.type)
+            fake_index._documents[ordinal] = document
+            partition.ids[document.id] = ordinal
+        fake_index._next_ordinal = len(fake_index._documents)
+        return fake_index
+
+    def fork(self):
+        other = FakeIndex.__new__(FakeIndex)
+        other.__dict__.update(self.__dict__)
+        # The build lock stays with the structures it guards, which the fork
+        # shares until one of them is written to
+        other.lock = ReadWriteLock()
+        other._views = []
+        other._retired = {}
+        with _SHARERS_LOCK:
+            self._sharers[0] += 1
+        return other
+
+    def _ensure_not_shared(self):
+        # Only forks of this index can raise a count of one, and they can't
+        # be taken while its write lock is held
+        if self._sharers[0] == 1:
+            return
+        # Copied before giving up our share, as the last sharer left then
+        # writes to the shared state in place
+        with self._build_lock:
+            documents = dict(self._documents)
+            partitions = {doc_type: partition.copy() for doc_type, partition in self._partitions.items()}
+            terms = self.terms.copy() if self.terms is not None else None
+            sorted_fields = {field: sorted_field.copy() for field, sorted_field in self._sorted_fields.items()}
+            doc_values = self.doc_values.copy()
+        with _SHARERS_LOCK:
+            # The other sharers may all have copied their state meanwhile
+            if self._sharers[0] > 1:
+                self._sharers[0] -= 1
+        self._sharers = [1]
+        self._build_lock = threading.Lock()
+        self._documents = documents
+        self._partitions = partitions
+        self.terms = terms
+        self._sorted_fields = sorted_fields
+        self.doc_values = doc_values
+
+    def ordinals(self):
+        return self._documents.keys()
+
+    def get_by_ordinal(self, ordinal):
+        return self._documents[ordinal]
+
+    def iter_items(self, ordinals=None, doc_types=None):
+        """Yields the live (ordinal, document) pairs in insertion order,
+        optionally restricted to some ordinals and to some _types"""
+        documents = self._documents
+        if ordinals is not None and len(ordinals) * 8 >= len(documents):
+            # Reading documents in order beats sorting most of their ordinals,
+            # and stops as early as callers do
+            for ordinal, document in documents.items():
+                if ordinal in ordinals and (doc_types is None or document.type in doc_types):
+                    yield ordinal, document
+        elif ordinals is not None:
+            for ordinal in sorted(ordinals):
+                document = documents.get(ordinal)
+                if document is not None and (doc_types is None or document.type in doc_types):
+                    yield ordinal, document
+        elif doc_types is None:
+            yield from documents.items()
+        else:
+            partitions = self._get_partitions(doc_types)
+            for ordinal in heapq.merge(*(partition.ids.values() for partition in partitions)):
+                yield ordinal, documents[ordinal]
+
+    def count_items(self, ordinals=None, doc_types=None):
+        """Returns how many pairs iter_items would yield, without reading
+        any document source"""
+        documents = self._documents
+        if ordinals is None:
+            if doc_types is None:
+                return len(documents)
+            return sum(len(partition.ids) for partition in self._get_partitions(doc_types))
+        if doc_types is None:
+            return sum(map(documents.__contains__, ordinals))
+        return sum(1 for ordinal in ordinals if ordinal in documents and documents[ordinal].type in doc_types)
+
+    def get_column(self, field):
+        with self._build_lock:
+            return self.doc_values.get_column(field, self._documents.items())
+
+    def find_term_ordinals(self, field, value, ignore_case):
+        terms = self.terms
+        if terms is None:
+            with self._build_lock:
+                if self.terms is None:
+                    terms = TermIndex()
+                    for ordinal, document in self._documents.items():
+                        terms.add(ordinal, document.source)
+                    self.terms = terms
+                terms = self.terms
+        return terms.find(field, value, ignore_case)
+
+    def find_range_ordinals(self, field, comparisons):
+        sorted_field = self._sorted_fields.get(field)
+        if sorted_field is None:
+            with self._build_lock:
+                sorted_field = self._sorted_fields.get(field)
+                if sorted_field is None:
+                    # Built on first use, then kept up to date by put and remove
+                    sorted_field = SortedField(field)
+                    sorted_field.build(self._documents.items())
+                    self._sorted_fields[field] = sorted_field
+        return sorted_field.find(comparisons)
+
+    def open_view(self):
+        """Returns a view of the documents as they are now, readable with
+        iter_view_items until it is given to close_view. Callers hold the
+        write lock, so that no write is halfway through."""
+        view = IndexView(self.generation, self._next_ordinal)
+        self._views.append(view.generation)
+        return view
+
+    def close_view(self, view):
+        """Closes view, dropping the retired documents no open view sees.
+        Callers hold the write lock."""
+        self._views.remove(view.generation)
+        oldest = min(self._views, default=None)
+        self._retired = {
+            ordinal: (document, generation) for ordinal, (document, generation) in self._retired.items()
+            if oldest is not None and generation > oldest
+        }
+
+    def iter_view_items(self, view, doc_types=None):
+        """Yields the (ordinal, document) pairs view sees, in insertion order"""
+        if view.generation == self.generation:
+            # Nothing was written since the view was opened
+            yield from self.iter_items(doc_types=doc_types)
+            return
+
+        live = itertools.takewhile(lambda item: item[0] < view.next_ordinal, self._documents.items())
+        retired = sorted(
+            (ordinal, document) for ordinal, (document, generation) in self._retired.items()
+            if generation > view.generation and ordinal < view.next_ordinal
+        )
+        for ordinal, document in heapq.merge(live, retired, key=lambda item: item[0]):
+            if doc_types is None or document.type in doc_types:
+                yield ordinal, document
+
+    def get(self, id, doc_type=ALL_DOC_TYPES):
+        ordinal = self._get_ordinal(id, doc_type)
+        if ordinal is None:
+            return None
+        return self._documents[ordinal]
+
+    def put(self, id, doc_type, source, version=None):
+        """Stores a document, replacing the one with the same _type and _id,
+        whose version plus one is the default version. Returns the replaced
+        document, if any"""
+        self._ensure_not_shared()
+        self.generation = next(_generations)
+        partition = self._partitions.get(doc_type)
+        if partition is None:
+            partition = self._partitions[doc_type] = DocTypePartition(doc_type)
+
+        previous = None
+        previous_ordinal = partition.ids.get(id)
+        if previous_ordinal is not None:
+            previous = self._remove_ordinal(previous_ordinal, id)
+        if version is None:
+            version = previous.version + 1 if previous is not None else 1
+
+        ordinal = self._next_ordinal
+        self._next_ordinal += 1
+        self._documents[ordinal] = FakeDocument(self.name, partition.doc_type, id, source, version)
+        partition.ids[id] = ordinal
+        if self.terms is not None:
+            self.terms.add(ordinal, source)
+        for sorted_field in self._sorted_fields.values():
+            sorted_field.add(ordinal, source)
+        self.doc_values.add(ordinal, source)
+        return previous
+
+    def remove(self, id, doc_type=ALL_DOC_TYPES):
+        ordinal = self._get_ordinal(id, doc_type)
+        if ordinal is None:
+            return None
+        self._ensure_not_shared()
+        self.generation = next(_generations)
+        return self._remove_ordinal(ordinal, id)
+
+    def _remove_ordinal(self, ordinal, id):
+        document = self._documents.pop(ordinal)
+        if self._views:
+            self._retired[ordinal] = (document, self.generation)
+        del self._partitions[document.type].ids[id]
+        if self.terms is not None:
+            self.terms.remove(ordinal, document.source)
+        for sorted_field in self._sorted_fields.values():
+            sorted_field.remove(ordinal)
+        self.doc_values.remove(ordinal)
+        return document
+
+    def _get_partitions(self, doc_types):
+        return [self._partitions[doc_type] for doc_type in dict.fromkeys(doc_types) if doc_type in self._partitions]
+
+    def _get_ordinal(self, id, doc_type):
+        if doc_type != ALL_DOC_TYPES:
+            partition = self._partitions.get(doc_type)
+            return partition.ids.get(id) if partition is not None else None
+
+        # The oldest document with that id, whatever its type
+        ordinals = [partition.ids[id] for partition in self._partitions.values() if id in partition.ids]
+        return min(ordinals) if ordinals else None
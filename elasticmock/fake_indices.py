@@ -3,14 +3,17 @@
 from elasticsearch.client.indices import IndicesClient
 from elasticsearch.client.utils import query_params
 
+from elasticmock.fake_index import FakeIndex
+
 
 class FakeIndicesClient(IndicesClient):
 
     @query_params('master_timeout', 'timeout')
     def create(self, index, body=None, params=None, headers=None, *args, **kwargs):
-        documents_dict = self.__get_documents_dict()
-        if index not in documents_dict:
-            documents_dict[index] = []
+        with self.__get_lock():
+            documents_dict = self.__get_documents_dict()
+            if index not in documents_dict:
+                documents_dict[index] = FakeIndex(index)
 
     @query_params('allow_no_indices', 'expand_wildcards', 'ignore_unavailable',
                   'local')
@@ -24,9 +27,21 @@ class FakeIndicesClient(IndicesClient):
 
     @query_params('master_timeout', 'timeout')
     def delete(self, index, params=None, headers=None):
-        documents_dict = self.__get_documents_dict()
-        if index in documents_dict:
-            del documents_dict[index]
+        with self.__get_lock():
+            documents_dict = self.__get_documents_dict()
+            if index in documents_dict:
+                del documents_dict[index]
+        self.client.clear_sorted_matches_cache()
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'fielddata', 'fields',
+                  'ignore_unavailable', 'query', 'request')
+    def clear_cache(self, index=None, params=None, headers=None):
+        self.client.clear_request_cache()
+        self.client.clear_sorted_matches_cache()
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
 
     def __get_documents_dict(self):
         return self.client._FakeElasticsearch__documents_dict
+
+    def __get_lock(self):
+        return self.client._FakeElasticsearch__lock
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from elasticsearch.exceptions import NotFoundError
+
+from elasticmock.utilities import get_random_scroll_id
+
+
+class PointInTime:
+    """Views of some indexes, opened together. Searches through it read
+    the documents as they were when it was opened."""
+
+    def __init__(self, fake_indexes, keep_alive):
+        self.id = get_random_scroll_id().decode('ascii')
+        self.keep_alive = keep_alive
+        self.expires_at = time.monotonic() + keep_alive
+        self.views = []
+        for fake_index in fake_indexes:
+            with fake_index.lock.write_locked():
+                self.views.append((fake_index, fake_index.open_view()))
+
+    def close(self):
+        for fake_index, view in self.views:
+            with fake_index.lock.write_locked():
+                fake_index.close_view(view)
+
+
+class PointsInTime:
+    """Open points in time of a client, each closed once its keep-alive
+    elapses without a search through it"""
+
+    def __init__(self):
+        self._points_in_time = {}
+        self._lock = threading.Lock()
+
+    def open(self, fake_indexes, keep_alive):
+        point_in_time = PointInTime(fake_indexes, keep_alive)
+        with self._lock:
+            self._points_in_time[point_in_time.id] = point_in_time
+        self._close_expired()
+        return point_in_time
+
+    def get(self, pit_id, keep_alive=None):
+        """Returns the point in time of pit_id, keeping it alive for
+        keep_alive more seconds, or for its last keep-alive"""
+        self._close_expired()
+        with self._lock:
+            point_in_time = self._points_in_time.get(pit_id)
+            if point_in_time is None:
+                raise NotFoundError(404, 'search_context_missing_exception',
+                                    'No search context found for id [{0}]'.format(pit_id))
+            if keep_alive is not None:
+                point_in_time.keep_alive = keep_alive
+            point_in_time.expires_at = time.monotonic() + point_in_time.keep_alive
+        return point_in_time
+
+    def close(self, pit_id):
+        """Closes the point in time of pit_id and returns whether it was open"""
+        with self._lock:
+            point_in_time = self._points_in_time.pop(pit_id, None)
+        if point_in_time is not None:
+            point_in_time.close()
+        self._close_expired()
+        return point_in_time is not None
+
+    def close_all(self):
+        with self._lock:
+            points_in_time = list(self._points_in_time.values())
+            self._points_in_time.clear()
+        for point_in_time in points_in_time:
+            point_in_time.close()
+
+    def _close_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [pit for pit in self._points_in_time.values() if pit.expires_at <= now]
+            for point_in_time in expired:
+                del self._points_in_time[point_in_time.id]
+        # Closing takes index locks, which must never be awaited holding ours
+        for point_in_time in expired:
+            point_in_time.close()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+import time
+import zlib
+
+from elasticsearch.exceptions import NotFoundError, RequestError, TransportError
+
+from elasticmock.fake_index import UnsupportedValue, resolve_field_path
+from elasticmock.utilities import get_random_scroll_id
+
+# The default of search.max_open_scroll_context
+MAX_OPEN_SCROLL_CONTEXT = 500
+# The default of index.max_slices_per_scroll
+MAX_SLICES_PER_SCROLL = 1024
+
+_TIME_VALUE = re.compile(r'(\d+(?:\.\d+)?)(nanos|micros|ms|s|m|h|d)')
+_TIME_UNITS = {'nanos': 1e-9, 'micros': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time_value(value):
+    """Returns the seconds of a time value such as '1m' or '500ms'"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    match = _TIME_VALUE.fullmatch(str(value).strip())
+    if match is None:
+        raise RequestError(400, 'illegal_argument_exception', 'failed to parse time value [{0}]'.format(value))
+    number, unit = match.groups()
+    return float(number) * _TIME_UNITS[unit]
+
+
+def _get_slice_hash(value):
+    # Integers are their own hash, so that a field numbering the documents
+    # spreads them evenly
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    return zlib.crc32(str(value).encode('utf-8'))
+
+
+class Slice:
+    """Slice id of the max slices a search's matches are split into, by a
+    hash of their _id or of the values of field. A document with several
+    values is in the slice of each of them, and one without any is in
+    none, as with doc values slicing."""
+
+    def __init__(self, id, max, field=None):
+        self.id = id
+        self.max = max
+        self.field = field
+
+    @classmethod
+    def parse(cls, body):
+        if not isinstance(body, dict) or not isinstance(body.get('id'), int) \
+                or not isinstance(body.get('max'), int):
+            raise RequestError(400, 'parsing_exception', '[slice] requires an integer [id] and [max]')
+        slice_id, max_slices, field = body['id'], body['max'], body.get('field')
+        if max_slices <= 1:
+            raise RequestError(400, 'illegal_argument_exception', 'max must be greater than 1')
+        if not 0 <= slice_id < max_slices:
+            raise RequestError(400, 'illegal_argument_exception', 'max must be greater than id')
+        if max_slices > MAX_SLICES_PER_SCROLL:
+            raise RequestError(
+                400, 'illegal_argument_exception',
+                'The number of slices [{0}] is too large. It must be less than [{1}]. This limit can be set by '
+                'changing the [index.max_slices_per_scroll] index level setting.'.format(
+                    max_slices, MAX_SLICES_PER_SCROLL)
+            )
+        return cls(slice_id, max_slices, None if field == '_id' else field)
+
+    def get_slices(self, document):
+        """Returns the set of the slices holding document"""
+        if self.field is None:
+            return {_get_slice_hash(str(document.id)) % self.max}
+        try:
+            values = resolve_field_path(document.source, self.field)
+        except (KeyError, UnsupportedValue):
+            return set()
+        if not isinstance(values, list):
+            values = [values]
+        return {_get_slice_hash(value) % self.max for value in values if value is not None}
+
+    def contains(self, document):
+        return self.id in self.get_slices(document)
+
+
+class ScrollContext:
+    """Documents matched by a scrolled search, captured when it ran, and the
+    position of the next page. Stored documents are replaced rather than
+    changed on writes, so pages never see writes made after the search."""
+
+    def __init__(self, documents, size, keep_alive, position=0, shards=1):
+        self.id = get_random_scroll_id().decode('ascii')
+        self.documents = documents
+        self.size = size
+        self.keep_alive = keep_alive
+        self.position = position
+        self.shards = shards
+        self.expires_at = time.monotonic() + keep_alive
+
+    def next_page(self):
+        page = self.documents[self.position:self.position + self.size]
+        self.position += len(page)
+        return page
+
+
+class ScrollContexts:
+    """Open scroll contexts of a client. A context is dropped once its
+    keep-alive elapses without it being scrolled, and opening more than
+    max_open contexts at a time fails as it does in Elasticsearch."""
+
+    def __init__(self, max_open=MAX_OPEN_SCROLL_CONTEXT):
+        self.max_open = max_open
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._contexts)
+
+    def open(self, documents, size, keep_alive, position=0, shards=1, first_page=True):
+        """Opens a context and returns it with its first page, or with no
+        page when first_page is False, as scan searches have"""
+        context = ScrollContext(documents, size, keep_alive, position, shards)
+        page = context.next_page() if first_page else []
+        with self._lock:
+            self._expire()
+            if len(self._contexts) >= self.max_open:
+                raise TransportError(
+                    500, 'exception',
+                    'Trying to create too many scroll contexts. Must be less than or equal to: [{0}]. This limit '
+                    'can be set by changing the [search.max_open_scroll_context] setting.'.format(self.max_open)
+                )
+            self._contexts[context.id] = context
+        return context, page
+
+    def next_page(self, scroll_id, keep_alive=None):
+        """Returns the context of scroll_id with its next page, keeping it
+        alive for keep_alive more seconds, or for its last keep-alive"""
+        with self._lock:
+            self._expire()
+            context = self._contexts.get(scroll_id)
+            if context is None:
+                raise NotFoundError(404, 'search_context_missing_exception',
+                                    'No search context found for id [{0}]'.format(scroll_id))
+            if keep_alive is not None:
+                context.keep_alive = keep_alive
+            context.expires_at = time.monotonic() + context.keep_alive
+            return context, context.next_page()
+
+    def clear(self, scroll_ids=None):
+        """Closes the given contexts, or all of them, and returns how many
+        were open"""
+        with self._lock:
+            self._expire()
+            if scroll_ids is None:
+                scroll_ids = list(self._contexts)
+            return sum(self._contexts.pop(scroll_id, None) is not None for scroll_id in scroll_ids)
+
+    def _expire(self):
+        now = time.monotonic()
+        for scroll_id in [scroll_id for scroll_id, context in self._contexts.items() if context.expires_at <= now]:
+            del self._contexts[scroll_id]
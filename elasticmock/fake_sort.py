@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import functools
+import heapq
+import operator
+import statistics
+
+from elasticsearch.exceptions import RequestError
+
+from elasticmock.fake_index import (
+    DateColumn, DoubleColumn, LongColumn, UnsupportedValue, get_epoch, resolve_field_path
+)
+
+DOC_FIELD = '_doc'
+SCORE_FIELD = '_score'
+# Tiebreaker of point in time searches, unique to each document
+SHARD_DOC_FIELD = '_shard_doc'
+
+MISSING_LAST = '_last'
+MISSING_FIRST = '_first'
+SORT_MODES = ('min', 'max', 'sum', 'avg', 'median')
+
+_get_entry_key = operator.itemgetter(0)
+
+
+@functools.total_ordering
+class _Descending:
+    """Wraps a sort key so that it sorts in reverse order"""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def _to_sort_value(value):
+    """Returns value the way hits give it in their sort values"""
+    if isinstance(value, datetime.datetime):
+        # Epoch milliseconds
+        return get_epoch(value) // 1000
+    return value
+
+
+def _get_value_key(value):
+    # Numbers sort before strings, which sort before anything else
+    if isinstance(value, (int, float)):
+        return 0, value
+    elif isinstance(value, str):
+        return 1, value
+    return 2, str(value)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class SortField:
+    """One sort criterion: a field of the sources, or _doc, _score or
+    _shard_doc, in ascending or descending order. Documents without a
+    value sort as missing says: _last, _first, or as if it was their
+    value. Fields with several values sort by the one mode selects."""
+
+    def __init__(self, field, descending=False, missing=MISSING_LAST, mode=None):
+        self.field = field
+        self.descending = descending
+        self.missing = missing
+        self.mode = mode or ('max' if descending else 'min')
+        self._missing_key = (-1,) if missing == MISSING_FIRST else (1,)
+
+    def get_value(self, document, position):
+        """Returns the sort value of the document at position, or None when
+        it has none"""
+        if self.field in (DOC_FIELD, SHARD_DOC_FIELD):
+            return position
+        elif self.field == SCORE_FIELD:
+            return 1.0
+
+        try:
+            value = resolve_field_path(document.source, self.field)
+        except (KeyError, UnsupportedValue):
+            value = None
+        if isinstance(value, list):
+            value = self._select([_to_sort_value(item) for item in value if item is not None])
+        else:
+            value = _to_sort_value(value)
+        return self._replace_missing(value)
+
+    def get_reader(self, fake_index=None):
+        """Returns a function of (document, ordinal, position) returning the
+        sort value of a document. Given the index of the documents, values
+        are read from its doc values when the field has a column."""
+        column = None
+        if fake_index is not None and not self.field.startswith('_') and '.' not in self.field:
+            column = fake_index.get_column(self.field)
+        if column is None:
+            return lambda document, ordinal, position: self.get_value(document, position)
+
+        present, values, decode = column.present, column.values, column.decode
+        size = len(present)
+        missing = self._replace_missing(None)
+        if isinstance(column, (LongColumn, DoubleColumn)):
+            decode = None
+        elif isinstance(column, DateColumn):
+            # Epoch milliseconds straight from the encoded microseconds
+            def read_date_column(document, ordinal, position):
+                if ordinal < size and present[ordinal]:
+                    return values[ordinal] // 1000
+                return missing
+            return read_date_column
+
+        def read_column(document, ordinal, position):
+            if ordinal < size and present[ordinal]:
+                return values[ordinal] if decode is None else _to_sort_value(decode(values[ordinal]))
+            return missing
+        return read_column
+
+    def get_key(self, value):
+        if value is None:
+            return self._missing_key
+        if not self.descending:
+            return (0,) + _get_value_key(value)
+        elif isinstance(value, (int, float)):
+            return 0, 0, -value
+        rank, key = _get_value_key(value)
+        return 0, -rank, _Descending(key)
+
+    def _select(self, values):
+        if not values:
+            return None
+        elif self.mode == 'min':
+            return min(values, key=_get_value_key)
+        elif self.mode == 'max':
+            return max(values, key=_get_value_key)
+        elif not all(_is_number(value) for value in values):
+            raise RequestError(400, 'illegal_argument_exception',
+                               'sort mode [{0}] only applies to numeric fields'.format(self.mode))
+        elif self.mode == 'sum':
+            return sum(values)
+        elif self.mode == 'avg':
+            return sum(values) / len(values)
+        return statistics.median(values)
+
+    def _replace_missing(self, value):
+        if value is None and self.missing not in (MISSING_FIRST, MISSING_LAST):
+            return _to_sort_value(self.missing)
+        return value
+
+
+class Sort:
+    """Sort of the hits of a search, parsed from its sort body or parameter"""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    @classmethod
+    def parse(cls, sort):
+        """Parses the sort of a search body, or of the sort parameter such as
+        'date:desc,_doc'. Returns None for no sort."""
+        if isinstance(sort, bytes):
+            sort = sort.decode('utf-8')
+        if isinstance(sort, str):
+            sort = [
+                {field: order} if order else field
+                for field, _, order in (item.partition(':') for item in sort.split(',') if item)
+            ]
+        if not isinstance(sort, list):
+            sort = [sort]
+
+        fields = []
+        for item in sort:
+            options = {}
+            if isinstance(item, str):
+                field = item
+            elif isinstance(item, dict) and len(item) == 1:
+                field, options = next(iter(item.items()))
+                if not isinstance(options, dict):
+                    options = {'order': options}
+            else:
+                raise RequestError(400, 'parsing_exception', 'malformed sort [{0}]'.format(item))
+            order = options.get('order', 'desc' if field == SCORE_FIELD else 'asc')
+            if order not in ('asc', 'desc'):
+                raise RequestError(400, 'parsing_exception', 'unknown sort order [{0}]'.format(order))
+            mode = options.get('mode')
+            if mode is not None and mode not in SORT_MODES:
+                raise RequestError(400, 'illegal_argument_exception', 'Unknown SortMode [{0}]'.format(mode))
+            fields.append(SortField(field, order == 'desc', options.get('missing', MISSING_LAST), mode))
+        return cls(fields) if fields else None
+
+    def with_tiebreaker(self):
+        """Returns this sort ending with _shard_doc, so that sort values are
+        unique to each document"""
+        if self.fields and self.fields[-1].field == SHARD_DOC_FIELD:
+            return self
+        return Sort(self.fields + [SortField(SHARD_DOC_FIELD)])
+
+    def get_values(self, document, position):
+        return [field.get_value(document, position) for field in self.fields]
+
+    def get_key(self, values):
+        """Returns a key ordering hits as this sort does, from their sort
+        values or from the values of search_after"""
+        if len(values) != len(self.fields):
+            raise RequestError(
+                400, 'illegal_argument_exception',
+                'search_after has {0} value(s) but sort has {1}.'.format(len(values), len(self.fields))
+            )
+        return tuple(field.get_key(value) for field, value in zip(self.fields, values))
+
+    def iter_entries(self, matches, matched_ordinals, live=None):
+        """Yields the (key, values, document) of each of matches, which are
+        the documents of matched_ordinals, index by index. The position of
+        a document, which _doc and _shard_doc sort by, is the index it was
+        found in then its ordinal. Values are read from doc values for the
+        indexes live flags as searched as they are now."""
+        documents = iter(matches)
+        fields = self.fields
+        for index_position, (fake_index, ordinals) in enumerate(matched_ordinals):
+            is_live = live is None or live[index_position]
+            readers = [field.get_reader(fake_index if is_live else None) for field in fields]
+            base = index_position << 32
+            if len(readers) == 1:
+                reader, get_key = readers[0], fields[0].get_key
+                for ordinal in ordinals:
+                    document = next(documents)
+                    value = reader(document, ordinal, base | ordinal)
+                    yield (get_key(value),), [value], document
+                continue
+            for ordinal in ordinals:
+                document = next(documents)
+                position = base | ordinal
+                values = [reader(document, ordinal, position) for reader in readers]
+                yield tuple(field.get_key(value) for field, value in zip(fields, values)), values, document
+
+    def nsmallest(self, count, matches, matched_ordinals, live=None):
+        """Returns the first count (key, values, document) entries of
+        matches in sort order, holding no more than count at a time"""
+        return heapq.nsmallest(count, self.iter_entries(matches, matched_ordinals, live), key=_get_entry_key)
+
+
+class SortedMatches:
+    """Documents matched by a search, with their sort values and keys in the
+    order of sort"""
+
+    def __init__(self, matches, matched_ordinals, sort, live=None):
+        self.matches = matches
+        self.matched_ordinals = matched_ordinals
+        entries = list(sort.iter_entries(matches, matched_ordinals, live))
+        # Stable, so that documents with equal keys stay in index order
+        entries.sort(key=_get_entry_key)
+        self.keys = [key for key, _, _ in entries]
+        self.sort_values = [values for _, values, _ in entries]
+        self.documents = [document for _, _, document in entries]
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""Stand-ins for the bulk helpers of ``elasticsearch.helpers``.
+
+Given a FakeElasticsearch, actions are applied to it as they are expanded,
+without serializing them to JSON and parsing them back, and response items
+are only built for what is yielded or reported. async_scan pages through
+the scrolls of an AsyncFakeElasticsearch. Any other client is handed to the
+original helper.
+"""
+
+import itertools
+import json
+from collections.abc import Mapping
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch import helpers as es_helpers
+from elasticsearch.helpers import BulkIndexError, expand_action
+
+from elasticmock.fake_async_elasticsearch import AsyncFakeElasticsearch
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+from elasticmock.utilities import copy_json
+
+_bulk = es_helpers.bulk
+_streaming_bulk = es_helpers.streaming_bulk
+_parallel_bulk = es_helpers.parallel_bulk
+# Only there when the async client's dependencies are installed
+_async_scan = getattr(es_helpers, 'async_scan', None)
+
+# The fields expand_action moves from a document to its action line
+ACTION_FIELDS = frozenset((
+    '_op_type', '_id', '_index', '_if_seq_no', '_if_primary_term', '_parent', '_percolate', '_retry_on_conflict',
+    '_routing', '_timestamp', '_type', '_version', '_version_type', 'if_seq_no', 'if_primary_term', 'parent',
+    'pipeline', 'retry_on_conflict', 'routing', 'version', 'version_type',
+))
+
+
+def streaming_bulk(client, actions, chunk_size=500, max_chunk_bytes=100 * 1024 * 1024, raise_on_error=True,
+                   expand_action_callback=expand_action, raise_on_exception=True, max_retries=0, initial_backoff=2,
+                   max_backoff=600, yield_ok=True, ignore_status=(), *args, **kwargs):
+    if not isinstance(client, FakeElasticsearch):
+        for result in _streaming_bulk(client, actions, chunk_size, max_chunk_bytes, raise_on_error,
+                                      expand_action_callback, raise_on_exception, max_retries, initial_backoff,
+                                      max_backoff, yield_ok, ignore_status, *args, **kwargs):
+            yield result
+        return
+
+    for ok, bulk_result in _iter_bulk_results(client, actions, chunk_size, raise_on_error, expand_action_callback,
+                                              raise_on_exception, ignore_status, kwargs.get('index')):
+        if not ok or yield_ok:
+            yield ok, _make_item(bulk_result)
+
+
+def bulk(client, actions, stats_only=False, ignore_status=(), *args, **kwargs):
+    if not isinstance(client, FakeElasticsearch):
+        return _bulk(client, actions, stats_only, ignore_status, *args, **kwargs)
+
+    success, failed = 0, 0
+    errors = []
+    for ok, bulk_result in _iter_bulk_results(client, actions, kwargs.get('chunk_size', 500),
+                                              kwargs.get('raise_on_error', True),
+                                              kwargs.get('expand_action_callback', expand_action),
+                                              kwargs.get('raise_on_exception', True), ignore_status,
+                                              kwargs.get('index')):
+        if ok:
+            success += 1
+        else:
+            if not stats_only:
+                errors.append(_make_item(bulk_result))
+            failed += 1
+
+    return success, failed if stats_only else errors
+
+
+def parallel_bulk(client, actions, thread_count=4, chunk_size=500, max_chunk_bytes=100 * 1024 * 1024,
+                  queue_size=4, expand_action_callback=expand_action, ignore_status=(), *args, **kwargs):
+    if not isinstance(client, FakeElasticsearch):
+        for result in _parallel_bulk(client, actions, thread_count, chunk_size, max_chunk_bytes, queue_size,
+                                     expand_action_callback, ignore_status, *args, **kwargs):
+            yield result
+        return
+
+    # The fake applies actions faster than threads would hand them over
+    for ok, bulk_result in _iter_bulk_results(client, actions, chunk_size, kwargs.get('raise_on_error', True),
+                                              expand_action_callback, kwargs.get('raise_on_exception', True),
+                                              ignore_status, kwargs.get('index')):
+        yield ok, _make_item(bulk_result)
+
+
+async def async_scan(client, query=None, scroll='5m', raise_on_error=True, preserve_order=False, size=1000,
+                     request_timeout=None, clear_scroll=True, scroll_kwargs=None, **kwargs):
+    if not isinstance(client, AsyncFakeElasticsearch):
+        async for hit in _async_scan(client, query, scroll, raise_on_error, preserve_order, size, request_timeout,
+                                     clear_scroll, scroll_kwargs, **kwargs):
+            yield hit
+        return
+
+    scroll_kwargs = dict(scroll_kwargs or {}, scroll=scroll)
+    response = await client.search(body=query, scroll=scroll, size=size, **kwargs)
+    scroll_id = response.get('_scroll_id')
+    try:
+        while scroll_id and response['hits']['hits']:
+            for hit in response['hits']['hits']:
+                yield hit
+            response = await client.scroll(scroll_id=scroll_id, **scroll_kwargs)
+            scroll_id = response.get('_scroll_id')
+    finally:
+        if scroll_id and clear_scroll:
+            await client.clear_scroll(scroll_id=scroll_id)
+
+
+def _iter_bulk_results(client, actions, chunk_size, raise_on_error, expand_action_callback, raise_on_exception,
+                       ignore_status, index):
+    """Applies actions chunk by chunk, with the error handling of the
+    original helpers. Yields (ok, bulk result) for each action, the bulk
+    result being an item already when the whole chunk failed."""
+    if not isinstance(ignore_status, (list, tuple)):
+        ignore_status = (ignore_status,)
+
+    if expand_action_callback is expand_action:
+        expanded_actions = map(_expand_action, actions)
+    else:
+        expanded_actions = (_parse_expanded_action(*expand_action_callback(action)) for action in actions)
+    while True:
+        chunk = list(itertools.islice(expanded_actions, chunk_size))
+        if not chunk:
+            return
+
+        try:
+            bulk_results = list(client._iter_bulk_results(
+                ((action, meta, source) for action, meta, source, _ in chunk), index
+            ))
+        except TransportError as e:
+            if raise_on_exception and e.status_code not in ignore_status:
+                raise
+            errors = [_make_exception_item(e, action, meta, data) for action, meta, _, data in chunk]
+            if raise_on_error and e.status_code not in ignore_status:
+                raise BulkIndexError('%i document(s) failed to index.' % len(errors), errors)
+            for error in errors:
+                yield False, error
+            continue
+
+        errors = []
+        for (_, _, _, data), bulk_result in zip(chunk, bulk_results):
+            status = bulk_result[4]
+            ok = 200 <= status < 300
+            if not ok and raise_on_error and status not in ignore_status:
+                # Failed items include the original document, as with the helpers
+                errors.append(_make_item(bulk_result, data))
+            if ok or not errors:
+                yield ok, bulk_result
+
+        if errors:
+            raise BulkIndexError('%i document(s) failed to index.' % len(errors), errors)
+
+
+def _expand_action(data):
+    """Does what _parse_expanded_action does with the result of expand_action,
+    without the copies expand_action makes to build action lines"""
+    if isinstance(data, str):
+        return _parse_expanded_action('{"index":{}}', data)
+
+    action_type = data.get('_op_type', 'index')
+    meta = {field: data[field] for field in ACTION_FIELDS.intersection(data) if field != '_op_type'}
+    if action_type == 'delete':
+        return action_type, meta, None, None
+
+    source = data.get('_source')
+    if not isinstance(source, Mapping):
+        # A _source that isn't a document is an option of update actions
+        source = {field: value for field, value in data.items() if field not in ACTION_FIELDS and field != '_source'}
+    return _parse_expanded_action({action_type: meta}, source)
+
+
+def _parse_expanded_action(action, data):
+    # expand_action gives raw JSON strings for documents given as strings
+    if isinstance(action, str):
+        action = json.loads(action)
+    if isinstance(data, str):
+        data = json.loads(data)
+    action_type, meta = next(iter(action.items()))
+    source = data
+    if action_type == 'update' and data is not None and 'doc' in data:
+        source = data['doc']
+    # Stored sources must not change with the caller's objects, as they
+    # would not once serialized
+    return action_type, meta, copy_json(source), data
+
+
+def _make_item(bulk_result, data=None):
+    if isinstance(bulk_result, dict):
+        return bulk_result
+    item = FakeElasticsearch._make_bulk_item(*bulk_result)
+    if data is not None:
+        next(iter(item.values()))['data'] = data
+    return item
+
+
+def _make_exception_item(error, action, meta, data):
+    info = {'error': str(error), 'status': error.status_code, 'exception': error}
+    if action != 'delete':
+        info['data'] = data
+    info.update(meta)
+    return {action: info}
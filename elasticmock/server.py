@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+
+"""Serves a FakeElasticsearch over HTTP, for clients that aren't Python:
+
+    python -m elasticmock.server --port 9200
+
+Connections are kept alive and each one is served by its own thread. Bulk
+bodies, plain or gzip-compressed, sent with a length or chunked, are
+applied as they are read from the connection.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import re
+import threading
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from elasticsearch.exceptions import TransportError
+from elasticsearch.serializer import JSONSerializer
+
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+from elasticmock.fake_index import ALL_DOC_TYPES
+
+# Index names can't start with an underscore, which keeps them apart from APIs
+_INDEX = r'(?P<index>[^/_][^/]*)'
+_OPTIONAL_INDEX = r'(?:/{0})?'.format(_INDEX)
+_DOCUMENT = r'/{0}/_doc/(?P<id>[^/]+)'.format(_INDEX)
+_SCROLL = r'/_search/scroll(?:/(?P<scroll_id>[^/]+))?'
+
+ROUTES = [(methods, re.compile(pattern), handler) for methods, pattern, handler in (
+    (('GET',), r'/', '_info'),
+    (('HEAD',), r'/', '_ping'),
+    (('GET',), r'/_cluster/health(?:/{0})?'.format(_INDEX), '_cluster_health'),
+    (('POST', 'PUT'), _OPTIONAL_INDEX + r'/_bulk', '_bulk'),
+    (('GET', 'POST'), _SCROLL, '_scroll'),
+    (('GET', 'POST'), r'/_scroll', '_scroll'),
+    (('DELETE',), _SCROLL, '_clear_scroll'),
+    (('POST',), r'/{0}/_pit'.format(_INDEX), '_open_point_in_time'),
+    (('DELETE',), r'/_pit', '_close_point_in_time'),
+    (('GET', 'POST'), _OPTIONAL_INDEX + r'/_search', '_search'),
+    (('GET', 'POST'), _OPTIONAL_INDEX + r'/_msearch', '_msearch'),
+    (('GET', 'POST'), _OPTIONAL_INDEX + r'/_count', '_count'),
+    (('GET', 'POST'), _OPTIONAL_INDEX + r'/_refresh', '_refresh'),
+    (('GET',), _DOCUMENT, '_get'),
+    (('HEAD',), _DOCUMENT, '_exists'),
+    (('DELETE',), _DOCUMENT, '_delete'),
+    (('PUT', 'POST'), r'/{0}/_doc(?:/(?P<id>[^/]+))?'.format(_INDEX), '_index'),
+    (('PUT',), r'/' + _INDEX, '_create_index'),
+    (('HEAD',), r'/' + _INDEX, '_index_exists'),
+    (('DELETE',), r'/' + _INDEX, '_delete_index'),
+)]
+
+# Clients check which product and version they talk to before anything else
+PRODUCT_HEADER = ('X-Elastic-Product', 'Elasticsearch')
+VERSION = {'number': '7.17.0', 'build_flavor': 'default', 'lucene_version': '8.11.1'}
+
+_serializer = JSONSerializer()
+
+
+class _RequestBody(io.RawIOBase):
+    """Request body read from the connection as it is consumed, whether its
+    length is given or it is sent chunked"""
+
+    def __init__(self, rfile, length=0, chunked=False):
+        self._rfile = rfile
+        self._remaining = length
+        self._chunked = chunked
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._remaining and self._chunked:
+            self._start_chunk()
+        if not self._remaining:
+            return 0
+        data = self._rfile.read(min(len(buffer), self._remaining))
+        if not data:
+            raise ConnectionError('Connection closed before the end of the request body')
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        if self._chunked and not self._remaining:
+            # Chunk data is followed by a line break
+            self._rfile.readline()
+        return len(data)
+
+    def drain(self):
+        while self.read(io.DEFAULT_BUFFER_SIZE):
+            pass
+
+    def _start_chunk(self):
+        size = int(self._rfile.readline().split(b';')[0], 16)
+        if not size:
+            # The last chunk is followed by trailers and an empty line
+            while self._rfile.readline().strip():
+                pass
+            self._chunked = False
+        self._remaining = size
+
+
+class FakeElasticsearchRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'elasticmock'
+    # Headers and body are written separately, which Nagle's algorithm delays
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    do_HEAD = do_POST = do_PUT = do_DELETE = do_GET
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        raw_body = _RequestBody(
+            self.rfile,
+            int(self.headers.get('Content-Length') or 0),
+            self.headers.get('Transfer-Encoding', '').lower() == 'chunked',
+        )
+        body = io.BufferedReader(raw_body)
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=body)
+
+        try:
+            handler, arguments = self._route(url.path)
+            if handler is None:
+                status, response = 400, self._make_error(
+                    'illegal_argument_exception',
+                    'no handler found for uri [{0}] and method [{1}]'.format(url.path, self.command),
+                )
+            else:
+                status, response = handler(body, params, **arguments)
+        except TransportError as e:
+            status, response = self._get_error_response(e)
+        except ValueError as e:
+            status, response = 400, self._make_error('parse_exception', str(e))
+        except Exception as e:
+            status, response = 500, self._make_error(type(e).__name__, str(e), 500)
+
+        # Whatever the handler left unread would be taken for the next request
+        raw_body.drain()
+        self._send(status, response)
+
+    def _route(self, path):
+        for methods, pattern, handler in ROUTES:
+            match = pattern.fullmatch(path)
+            if match and self.command in methods:
+                arguments = {name: unquote(value) for name, value in match.groupdict().items() if value is not None}
+                return getattr(self, handler), arguments
+        return None, None
+
+    def _send(self, status, response):
+        data = b'' if response is None else _serializer.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header(*PRODUCT_HEADER)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def _get_error_response(self, error):
+        status = error.status_code if isinstance(error.status_code, int) else 500
+        details = [str(detail) for detail in error.args[1:]] or ['exception']
+        # Some errors of the fake carry the response of the real API
+        if details[0].startswith('{'):
+            return status, json.loads(details[0])
+        return status, self._make_error(details[0], details[-1], status)
+
+    @staticmethod
+    def _make_error(error_type, reason, status=400):
+        return {'error': {'type': error_type, 'reason': reason}, 'status': status}
+
+    @staticmethod
+    def _read_json(body):
+        data = body.read()
+        return json.loads(data) if data.strip() else None
+
+    @staticmethod
+    def _read_scroll_body(body):
+        data = body.read().strip()
+        # Clients before elasticsearch 5 send the bare scroll id
+        if data and not data.startswith(b'{'):
+            return {'scroll_id': data.decode('utf-8')}
+        return json.loads(data) if data else {}
+
+    @staticmethod
+    def _split_indexes(index):
+        return index.split(',') if index and ',' in index else index
+
+    @property
+    def _client(self):
+        return self.server.client
+
+    def _info(self, body, params):
+        info = self._client.info()
+        info['version'] = dict(info['version'], **VERSION)
+        return 200, info
+
+    def _ping(self, body, params):
+        return 200, None
+
+    def _cluster_health(self, body, params, index=None):
+        return 200, self._client.cluster.health(index=index, params=params)
+
+    def _bulk(self, body, params, index=None):
+        return 200, self._client.bulk(body=body, index=index, params=params)
+
+    def _search(self, body, params, index=None):
+        return 200, self._client.search(index=self._split_indexes(index), body=self._read_json(body), params=params)
+
+    def _msearch(self, body, params, index=None):
+        lines = [json.loads(line) for line in body if line.strip()]
+        for header in lines[::2]:
+            header.setdefault('index', self._split_indexes(index))
+        return 200, self._client.msearch(body=lines, params=params)
+
+    def _count(self, body, params, index=None):
+        return 200, self._client.count(index=self._split_indexes(index), body=self._read_json(body), params=params)
+
+    def _refresh(self, body, params, index=None):
+        self._client.indices.refresh(index=index)
+        return 200, {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    def _scroll(self, body, params, scroll_id=None):
+        data = self._read_scroll_body(body)
+        scroll_id = scroll_id or data.get('scroll_id') or params.pop('scroll_id', None)
+        if 'scroll' in data:
+            params['scroll'] = data['scroll']
+        return 200, self._client.scroll(scroll_id=scroll_id, params=params)
+
+    def _clear_scroll(self, body, params, scroll_id=None):
+        data = self._read_scroll_body(body)
+        return 200, self._client.clear_scroll(scroll_id=scroll_id or data.get('scroll_id'))
+
+    def _open_point_in_time(self, body, params, index):
+        return 200, self._client.open_point_in_time(index=self._split_indexes(index), params=params)
+
+    def _close_point_in_time(self, body, params):
+        return 200, self._client.close_point_in_time(body=self._read_json(body))
+
+    def _get(self, body, params, index, id):
+        return 200, self._client.get(index=index, id=id, params=params)
+
+    def _exists(self, body, params, index, id):
+        exists = self._client.exists(index=index, id=id, doc_type=ALL_DOC_TYPES, params=params)
+        return (200 if exists else 404), None
+
+    def _delete(self, body, params, index, id):
+        return 200, self._client.delete(index=index, id=id, params=params)
+
+    def _index(self, body, params, index, id=None):
+        response = self._client.index(index=index, id=id, body=self._read_json(body), params=params)
+        return (201 if response['result'] == 'created' else 200), response
+
+    def _create_index(self, body, params, index):
+        self._client.indices.create(index=index, body=self._read_json(body))
+        return 200, {'acknowledged': True, 'shards_acknowledged': True, 'index': index}
+
+    def _index_exists(self, body, params, index):
+        return (200 if self._client.indices.exists(index=index) else 404), None
+
+    def _delete_index(self, body, params, index):
+        self._client.indices.delete(index=index)
+        return 200, {'acknowledged': True}
+
+
+class FakeElasticsearchServer(ThreadingMixIn, HTTPServer):
+    """HTTP server answering the REST API of Elasticsearch from client, a new
+    FakeElasticsearch when None"""
+    daemon_threads = True
+
+    def __init__(self, server_address, client=None, verbose=False):
+        self.client = client if client is not None else FakeElasticsearch()
+        self.verbose = verbose
+        HTTPServer.__init__(self, server_address, FakeElasticsearchRequestHandler)
+
+
+def run_benchmark(documents=1000, requests=5000, connections=4):
+    """Serves documents on a free port and returns the requests per second
+    answered over keep-alive connections, for each kind of request"""
+    server = FakeElasticsearchServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_address[1]
+        bulk = ''.join(
+            '{{"index":{{"_index":"benchmark","_id":"{0}"}}}}\n{{"n":{0}}}\n'.format(i) for i in range(documents)
+        )
+        _request(HTTPConnection('127.0.0.1', port), 'POST', '/_bulk', bulk)
+
+        kinds = (
+            ('get', lambda i: ('GET', '/benchmark/_doc/{0}'.format(i % documents), None)),
+            ('search', lambda i: ('POST', '/benchmark/_search', '{{"query":{{"term":{{"n":{0}}}}}}}'.format(i))),
+            ('index', lambda i: ('PUT', '/benchmark/_doc/{0}'.format(i % documents), '{{"n":{0}}}'.format(i))),
+        )
+        return {kind: _measure(port, make_request, requests, connections) for kind, make_request in kinds}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_scroll_benchmark(documents=20000, slices=(1, 2, 4, 8), size=500, page_latency=0.02):
+    """Serves documents on a free port and returns the documents per second
+    scrolled by each number of slices, each slice consumed over its own
+    connection. Consumers wait page_latency after each page, as a reindex
+    worker does while writing it elsewhere."""
+    server = FakeElasticsearchServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_address[1]
+        bulk = ''.join(
+            '{{"index":{{"_index":"benchmark","_id":"{0}"}}}}\n{{"n":{0}}}\n'.format(i) for i in range(documents)
+        )
+        _request(HTTPConnection('127.0.0.1', port), 'POST', '/_bulk', bulk)
+
+        def consume(slice_body, counts):
+            connection = HTTPConnection('127.0.0.1', port)
+            try:
+                body = json.dumps({'slice': slice_body} if slice_body else {})
+                result = json.loads(_request(connection, 'POST', '/benchmark/_search?scroll=1m&size={0}'.format(size),
+                                             body))
+                while result['hits']['hits']:
+                    counts.append(len(result['hits']['hits']))
+                    time.sleep(page_latency)
+                    body = json.dumps({'scroll': '1m', 'scroll_id': result['_scroll_id']})
+                    result = json.loads(_request(connection, 'POST', '/_search/scroll', body))
+            finally:
+                connection.close()
+
+        rates = {}
+        for max_slices in slices:
+            counts = []
+            slice_bodies = [{'id': slice_id, 'max': max_slices} for slice_id in range(max_slices)]
+            threads = [
+                threading.Thread(target=consume, args=(slice_body if max_slices > 1 else None, counts))
+                for slice_body in slice_bodies
+            ]
+            started = time.time()
+            for consumer in threads:
+                consumer.start()
+            for consumer in threads:
+                consumer.join()
+            if sum(counts) != documents:
+                raise RuntimeError('{0} slices scrolled {1} of {2} documents'.format(
+                    max_slices, sum(counts), documents))
+            rates[max_slices] = documents / (time.time() - started)
+        return rates
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _measure(port, make_request, requests, connections):
+    def send(offset):
+        connection = HTTPConnection('127.0.0.1', port)
+        try:
+            for i in range(offset, requests, connections):
+                _request(connection, *make_request(i))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=send, args=(offset,)) for offset in range(connections)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests / (time.time() - started)
+
+
+def _request(connection, method, url, body=None):
+    connection.request(method, url, body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    data = response.read()
+    if response.status >= 300:
+        raise RuntimeError('{0} {1} answered {2}: {3}'.format(method, url, response.status, data))
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m elasticmock.server', description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--snapshot', help='snapshot file written by save_snapshot, to serve its indexes')
+    parser.add_argument('--verbose', action='store_true', help='log each request')
+    parser.add_argument('--benchmark', action='store_true', help='print the requests per second served and exit')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        for kind, rate in run_benchmark().items():
+            print('{0}: {1:.0f} requests/s'.format(kind, rate))
+        for max_slices, rate in run_scroll_benchmark().items():
+            print('scroll in {0} slice(s): {1:.0f} documents/s'.format(max_slices, rate))
+        return
+
+    server = FakeElasticsearchServer((args.host, args.port), verbose=args.verbose)
+    if args.snapshot:
+        # The server keeps its indexes until it exits
+        server.client.load_snapshot(args.snapshot, freeze=True)
+    print('Serving a fake Elasticsearch on http://{0}:{1}'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ CHARSET_FOR_ELASTICSEARCH_ID = string.ascii_letters + string.digits
 
 DEFAULT_ELASTICSEARCH_SEARCHRESULTPHASE_COUNT = 6
 
+_CONTAINER_TYPES = (dict, list)
+
 
 def get_random_id(size=DEFAULT_ELASTICSEARCH_ID_SIZE):
     return ''.join(random.choice(CHARSET_FOR_ELASTICSEARCH_ID) for _ in range(size))
@@ -24,3 +26,13 @@ def extract_ignore_as_iterable(params):
     if isinstance(ignore, int):
         ignore = (ignore,)
     return ignore
+
+
+def copy_json(value):
+    """Copies the dicts and lists of a JSON-like value, sharing the scalars"""
+    value_type = type(value)
+    if value_type is dict:
+        return {key: copy_json(item) if type(item) in _CONTAINER_TYPES else item for key, item in value.items()}
+    elif value_type is list:
+        return [copy_json(item) if type(item) in _CONTAINER_TYPES else item for item in value]
+    return value
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+_SET_BIT = re.compile('1')
+
+
+def ordinals_to_bitmap(ordinals):
+    """Returns an int with the bits of the given non-negative ordinals set"""
+    if not ordinals:
+        return 0
+    bitmap = bytearray(max(ordinals) // 8 + 1)
+    for ordinal in ordinals:
+        bitmap[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bitmap, 'little')
+
+
+def bitmap_to_ordinals(bitmap):
+    """Returns the set of the positions of the bits set in bitmap"""
+    # Binary digits reversed, so that each digit's index is its position
+    bits = bin(bitmap)[:1:-1]
+    return {match.start() for match in _SET_BIT.finditer(bits)}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+from collections import OrderedDict
+
+
+# Marks the values that aren't JSON in keys, and dicts using it as a key
+_TYPE_KEY = '__type__'
+_JSON_TYPES = (str, int, float, bool, type(None))
+# Starts the keys of bodies holding values that aren't JSON, which no JSON
+# document starts with
+_TAGGED_KEY_PREFIX = '#'
+
+
+def get_canonical_key(value):
+    """Returns a key equal for equal JSON bodies whatever their dict order,
+    or None when value can't be serialized. Values that aren't JSON, such
+    as datetimes, are keyed by their type and string form, so that they
+    never share the key of a string."""
+    try:
+        try:
+            return json.dumps(value, sort_keys=True)
+        except TypeError:
+            return _TAGGED_KEY_PREFIX + json.dumps(_tag_types(value), sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+def _tag_types(value):
+    if isinstance(value, dict):
+        tagged = {key: _tag_types(item) for key, item in value.items()}
+        return {_TYPE_KEY: 'dict', 'value': tagged} if _TYPE_KEY in value else tagged
+    elif isinstance(value, (list, tuple)):
+        return [_tag_types(item) for item in value]
+    elif isinstance(value, _JSON_TYPES):
+        return value
+    value_type = type(value)
+    return {_TYPE_KEY: '{0}.{1}'.format(value_type.__module__, value_type.__qualname__), 'value': str(value)}
+
+
+class LRUCache:
+    """Mapping that evicts the least recently used entries first once the
+    total size of its values exceeds maxsize, counting its hits and misses.
+    Each value has size 1 unless a getsizeof function is given. It can be
+    shared between threads."""
+
+    def __init__(self, maxsize, getsizeof=None):
+        self.maxsize = maxsize
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._getsizeof = getsizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._getsizeof(value) if self._getsizeof else 1
+        if size > self.maxsize:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.currsize -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.currsize += size
+            while self.currsize > self.maxsize:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.currsize -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.currsize = 0
+            self._entries.clear()
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'currsize': self.currsize,
+            'maxsize': self.maxsize,
+        }
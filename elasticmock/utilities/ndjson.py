@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import itertools
+import json
+
+BULK_ACTIONS = ('index', 'create', 'update', 'delete')
+DEFAULT_CHUNK_SIZE = 10000
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def is_bulk_action(line):
+    if not isinstance(line, dict) or len(line) != 1:
+        return False
+    action, meta = next(iter(line.items()))
+    return action in BULK_ACTIONS and isinstance(meta, dict)
+
+
+def iter_lines(text):
+    """Splits str or bytes on newlines without copying it whole"""
+    newline = '\n' if isinstance(text, str) else b'\n'
+    start = 0
+    end = text.find(newline)
+    while end >= 0:
+        yield text[start:end]
+        start = end + 1
+        end = text.find(newline, start)
+    if start < len(text):
+        yield text[start:]
+
+
+def iter_body_lines(body):
+    """Yields the lines of a bulk-like body one at a time. body is a str,
+    bytes (gzip-compressed or not), a binary or text file, or an iterable of
+    lines and of already decoded dicts."""
+    if isinstance(body, (bytes, bytearray)) and body[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as body_file:
+            for line in body_file:
+                yield line
+    elif isinstance(body, (str, bytes, bytearray)):
+        for line in iter_lines(body):
+            yield line
+    else:
+        for item in body:
+            if isinstance(item, (str, bytes, bytearray)):
+                for line in iter_lines(item):
+                    yield line
+            else:
+                yield item
+
+
+def iter_json_lines(lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Decodes str or bytes JSON lines, reading at most chunk_size of them
+    ahead. Blank lines are skipped and dicts are passed through as they are."""
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        for line in chunk:
+            if isinstance(line, dict):
+                yield line
+            elif line.strip():
+                yield json.loads(line)
+
+
+def iter_bulk_actions(lines):
+    """Pairs decoded bulk lines into (action, meta, source) tuples. Delete
+    actions have no source line and get None."""
+    lines = iter(lines)
+    for line in lines:
+        if not is_bulk_action(line):
+            raise ValueError('Malformed bulk body: expected an action, got {0!r}'.format(line))
+        action, meta = next(iter(line.items()))
+        source = None
+        if action != 'delete':
+            source = next(lines, None)
+            if source is None:
+                raise ValueError('Malformed bulk body: {0} action without source'.format(action))
+            if action == 'update' and 'doc' in source:
+                source = source['doc']
+        yield action, meta, source
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import array
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+from elasticmock.fake_index import FakeIndex, MappedDocument
+
+SHARED_IMAGE_MAGIC = b'ELASTICMOCK-IMAGE-1\n'
+SHARED_IMAGE_EXTENSION = '.image'
+# The footer holds the offset of the document table
+_FOOTER = struct.Struct('<Q')
+
+
+def write_shared_image(documents_dict, directory):
+    """Writes the documents of all indexes to an image file of directory,
+    named by the sha256 of its content, and returns its path. Each _source
+    is pickled on its own, followed by a table of the _type, _id, version
+    and source offsets of the documents of each index, column by column.
+    An existing file with the same content is reused; new files are renamed
+    into place once fully written."""
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=SHARED_IMAGE_EXTENSION + '.tmp')
+    content_hash = hashlib.sha256()
+    try:
+        with os.fdopen(file_descriptor, 'wb') as image_file:
+            def write(data):
+                content_hash.update(data)
+                image_file.write(data)
+                return image_file.tell()
+
+            offset = write(SHARED_IMAGE_MAGIC)
+            table = {}
+            for name, fake_index in documents_dict.items():
+                doc_types, ids, versions = [], [], []
+                offsets = array.array('Q', [offset])
+                for document in fake_index:
+                    doc_types.append(document.type)
+                    ids.append(document.id)
+                    versions.append(document.version)
+                    offset = write(pickle.dumps(document.source, protocol=pickle.HIGHEST_PROTOCOL))
+                    offsets.append(offset)
+                table[name] = (doc_types, ids, versions, offsets)
+            write(pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL))
+            write(_FOOTER.pack(offset))
+
+        path = os.path.join(directory, content_hash.hexdigest() + SHARED_IMAGE_EXTENSION)
+        if os.path.exists(path):
+            os.unlink(temporary_path)
+        else:
+            os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+    return path
+
+
+def read_shared_image(path, freeze=False):
+    """Returns the indexes of an image written by write_shared_image.
+
+    The file stays mapped read-only for as long as its documents are in use,
+    and sources are unpickled from it when read, so processes attaching the
+    same image share its pages through the page cache. Only the table of
+    documents is loaded, with the garbage collector paused, then frozen with
+    the rest of the process when freeze is given, as read_snapshot_file
+    does.
+    """
+    with open(path, 'rb') as image_file:
+        mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(SHARED_IMAGE_MAGIC)] != SHARED_IMAGE_MAGIC:
+        mapped.close()
+        raise ValueError('{0} is not an elasticmock image file'.format(path))
+
+    buffer = memoryview(mapped)
+    table_offset, = _FOOTER.unpack(buffer[-_FOOTER.size:])
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        table = pickle.loads(buffer[table_offset:-_FOOTER.size])
+        documents_dict = {
+            name: FakeIndex.from_documents(name, (
+                MappedDocument(name, doc_type, id, version, buffer, start, end)
+                for doc_type, id, version, start, end in zip(doc_types, ids, versions, offsets, offsets[1:])
+            ))
+            for name, (doc_types, ids, versions, offsets) in table.items()
+        }
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.freeze()
+    return documents_dict
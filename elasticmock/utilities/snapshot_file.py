@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import tempfile
+
+SNAPSHOT_FILE_MAGIC = b'ELASTICMOCK-SNAPSHOT-1\n'
+SNAPSHOT_FILE_EXTENSION = '.snapshot'
+
+
+def get_snapshot_file_path(directory, content_hash):
+    return os.path.join(directory, content_hash + SNAPSHOT_FILE_EXTENSION)
+
+
+def write_snapshot_file(snapshot, directory):
+    """Writes snapshot to a file of directory named by the sha256 of its
+    content and returns its path. An existing file with the same content
+    is reused; new files are renamed into place once fully written."""
+    payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+    path = get_snapshot_file_path(directory, hashlib.sha256(payload).hexdigest())
+    if os.path.exists(path):
+        return path
+
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=SNAPSHOT_FILE_EXTENSION + '.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as snapshot_file:
+            snapshot_file.write(SNAPSHOT_FILE_MAGIC)
+            snapshot_file.write(payload)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return path
+
+
+def read_snapshot_file(path, freeze=False):
+    """Loads a snapshot written by write_snapshot_file.
+
+    The file is memory-mapped and unpickled in one pass with the garbage
+    collector paused. With freeze, every object alive afterwards, the
+    loaded ones included, is moved out of the collector's tracking
+    (gc.freeze) so later collections don't walk the whole fixture again.
+    This applies to the whole process: objects of other code alive then
+    are never collected either, so only freeze in processes that keep
+    the fixture until they exit.
+    """
+    with open(path, 'rb') as snapshot_file:
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:len(SNAPSHOT_FILE_MAGIC)] != SNAPSHOT_FILE_MAGIC:
+                raise ValueError('{0} is not an elasticmock snapshot file'.format(path))
+
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                with memoryview(mapped) as content, content[len(SNAPSHOT_FILE_MAGIC):] as payload:
+                    snapshot = pickle.loads(payload)
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.freeze()
+    return snapshot
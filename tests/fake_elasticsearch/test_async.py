@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import elasticsearch
+
+from elasticmock import elasticmock
+from elasticmock.fake_async_elasticsearch import AsyncFakeElasticsearch
+from elasticmock.fake_elasticsearch import FakeElasticsearch, FakeQueryCondition
+from elasticmock.helpers import async_scan
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE, DOC_ID, BODY
+
+
+class TestAsync(TestElasticmock):
+
+    def setUp(self):
+        super(TestAsync, self).setUp()
+        self.async_es = AsyncFakeElasticsearch(client=self.es)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def __run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_should_share_store_with_sync_client(self):
+        self.__run(self.async_es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=DOC_ID, body=BODY))
+
+        self.assertEqual(BODY, self.es.get(index=INDEX_NAME, id=DOC_ID)['_source'])
+        self.assertTrue(self.__run(self.async_es.exists(index=INDEX_NAME, doc_type=DOC_TYPE, id=DOC_ID)))
+
+    def test_should_search_and_count_in_executor(self):
+        for i in range(0, 10):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body={'data': 'test_{0}'.format(i)})
+
+        search = self.__run(self.async_es.search(index=INDEX_NAME, body={'query': {'term': {'data': 'test_3'}}}))
+        count = self.__run(self.async_es.count(index=INDEX_NAME))
+
+        self.assertEqual(1, search['hits']['total']['value'])
+        self.assertEqual(10, count['count'])
+
+    def test_should_use_indices_and_cluster_clients(self):
+        self.__run(self.async_es.indices.create(index=INDEX_NAME))
+
+        self.assertTrue(self.__run(self.async_es.indices.exists(index=INDEX_NAME)))
+        self.assertEqual('green', self.__run(self.async_es.cluster.health())['status'])
+
+    def test_should_scan_all_documents_and_clear_scroll(self):
+        for i in range(0, 25):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body={'data': i})
+
+        async def scan():
+            return [hit async for hit in async_scan(self.async_es, index=INDEX_NAME, size=10)]
+
+        hits = self.__run(scan())
+
+        self.assertEqual(list(range(0, 25)), sorted(hit['_source']['data'] for hit in hits))
+        self.assertEqual(0, self.es.clear_scroll(scroll_id='_all')['num_freed'])
+
+    def test_should_not_block_event_loop_during_search(self):
+        def slow_search(*args, **kwargs):
+            time.sleep(0.2)
+            return {}
+        self.es.search = slow_search
+        ticks = []
+
+        async def tick():
+            for _ in range(0, 5):
+                await asyncio.sleep(0.01)
+                ticks.append(time.time())
+
+        async def search_and_tick():
+            search = asyncio.ensure_future(self.async_es.search(index=INDEX_NAME))
+            await tick()
+            return await search
+
+        started = time.time()
+        self.__run(search_and_tick())
+
+        self.assertEqual(5, len(ticks))
+        self.assertLess(ticks[-1] - started, 0.2)
+
+    def test_should_not_block_event_loop_on_index_locks_during_long_search(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=DOC_ID, body=BODY)
+        searching = threading.Event()
+
+        def slow_evaluate(*args, **kwargs):
+            searching.set()
+            time.sleep(0.3)
+            return True
+        latencies = []
+
+        async def tick():
+            for _ in range(0, 10):
+                started = time.time()
+                await asyncio.sleep(0.01)
+                latencies.append(time.time() - started)
+
+        async def write_and_tick():
+            writes = asyncio.gather(
+                self.async_es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='2', body=BODY),
+                self.async_es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=DOC_ID),
+                self.async_es.get(index=INDEX_NAME, id='2'),
+                self.async_es.exists(index=INDEX_NAME, id='2'),
+                self.async_es.open_point_in_time(index=INDEX_NAME, keep_alive='1m'))
+            await tick()
+            return await writes
+
+        with mock.patch.object(FakeQueryCondition, 'find_ordinals', return_value=None), \
+                mock.patch.object(FakeQueryCondition, 'evaluate', slow_evaluate):
+            search = threading.Thread(target=self.es.search, kwargs={
+                'index': INDEX_NAME, 'body': {'query': {'term': {'data': 'test'}}}})
+            search.start()
+            searching.wait()
+            self.__run(write_and_tick())
+            search.join()
+
+        self.assertEqual(10, len(latencies))
+        self.assertLess(max(latencies), 0.15)
+
+    def test_should_keep_patches_for_decorated_coroutine(self):
+        @elasticmock
+        async def decorated():
+            await asyncio.sleep(0)
+            return elasticsearch.Elasticsearch()
+
+        self.assertIsInstance(self.__run(decorated()), FakeElasticsearch)
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import gzip
 import json
 
+from parameterized import parameterized
+
 from tests import TestElasticmock, INDEX_NAME, DOC_TYPE, BODY, DOC_ID
 
 
@@ -209,3 +212,23 @@ class TestBulk(TestElasticmock):
 
         self.assertTrue(data.get('errors'))
         self.assertEqual(actual, expected)
+
+    @parameterized.expand([
+        ('bytes', lambda lines: '\n'.join(lines).encode()),
+        ('gzip', lambda lines: gzip.compress('\n'.join(lines).encode())),
+        ('generator', lambda lines: (line for line in lines)),
+        ('dicts', lambda lines: [json.loads(line) for line in lines]),
+    ])
+    def test_should_bulk_index_documents_from_body(self, _, make_body):
+        lines = []
+        for document_id in range(1, 4):
+            lines.append(json.dumps({'index': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': document_id}}))
+            lines.append(json.dumps({'data': 'test_{0}'.format(document_id)}))
+        lines.append(json.dumps({'delete': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 1}}))
+
+        data = self.es.bulk(body=make_body(lines))
+
+        self.assertFalse(data.get('errors'))
+        self.assertEqual(['created', 'created', 'created', 'deleted'],
+                         [next(iter(item.values()))['result'] for item in data.get('items')])
+        self.assertEqual(2, self.es.count(index=INDEX_NAME)['count'])
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from elasticmock.fake_elasticsearch import FakeQueryCondition
+from elasticmock.fake_index import FakeIndex, SortedField
+from elasticmock.utilities.rwlock import ReadWriteLock
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+WRITERS = 4
+READERS = 4
+DOCUMENTS_PER_WRITER = 2000
+FORKS_PER_READER = 500
+# Seconds a stress run gets before it is taken for a deadlock
+RUN_TIMEOUT = 60
+
+
+class TestConcurrency(TestElasticmock):
+
+    def __write(self, writer):
+        for i in range(0, DOCUMENTS_PER_WRITER):
+            document_id = '{0}-{1}'.format(writer, i)
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=document_id, body={'writer': writer, 'i': i})
+            if i % 10 == 0:
+                self.es.bulk(body=[
+                    {'index': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': document_id + '-bulk'}},
+                    {'writer': writer, 'i': i},
+                ])
+                self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=document_id + '-bulk')
+
+    def __read(self, stop):
+        searches = 0
+        while not stop.is_set():
+            hits = self.es.search(
+                index=INDEX_NAME, body={'query': {'range': {'i': {'gte': 100}}}}, size=5
+            )['hits']['hits']
+            for hit in hits:
+                self.assertGreaterEqual(hit['_source']['i'], 100)
+            self.es.search(index=INDEX_NAME, size=1)
+            self.es.count(index=INDEX_NAME)
+            searches += 1
+        return searches
+
+    def test_should_not_lose_writes_with_concurrent_readers(self):
+        # Switching threads often makes races show up within a short run
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        self.es.indices.create(index=INDEX_NAME)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=WRITERS + READERS) as executor:
+            readers = [executor.submit(self.__read, stop) for _ in range(0, READERS)]
+            writers = [executor.submit(self.__write, writer) for writer in range(0, WRITERS)]
+            for writer in writers:
+                writer.result()
+            stop.set()
+            searches = sum(reader.result() for reader in readers)
+
+        self.assertGreater(searches, 0)
+        self.assertEqual(WRITERS * DOCUMENTS_PER_WRITER, self.es.count(index=INDEX_NAME)['count'])
+        total = self.es.search(index=INDEX_NAME, body={'query': {'term': {'writer': 1}}}, size=0)['hits']['total']
+        self.assertEqual(DOCUMENTS_PER_WRITER, total['value'])
+
+    def test_should_not_deadlock_searching_indexes_in_any_order(self):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        indexes = ['index_a', 'index_b', 'index_c']
+        for index in indexes:
+            self.es.index(index=index, doc_type=DOC_TYPE, id='0', body={'i': 0})
+        stop = threading.Event()
+
+        def search(indexes):
+            while not stop.is_set():
+                self.es.search(index=indexes, body={'query': {'range': {'i': {'gte': 0}}}}, size=1)
+
+        def write(index):
+            for i in range(0, 500):
+                self.es.index(index=index, doc_type=DOC_TYPE, id=str(i), body={'i': i})
+
+        # Daemon threads, so that a deadlock fails the test instead of
+        # hanging the run
+        readers = [threading.Thread(target=search, args=(order,), daemon=True)
+                   for order in (indexes, indexes[::-1], indexes[1:] + indexes[:1]) for _ in range(0, 2)]
+        writers = [threading.Thread(target=write, args=(index,), daemon=True) for index in indexes]
+        for thread in readers + writers:
+            thread.start()
+        deadline = time.monotonic() + RUN_TIMEOUT
+        for writer in writers:
+            writer.join(max(deadline - time.monotonic(), 0))
+        stop.set()
+        for reader in readers:
+            reader.join(max(deadline - time.monotonic(), 0))
+
+        self.assertFalse(any(thread.is_alive() for thread in readers + writers), 'searches and writes deadlocked')
+        self.assertEqual(1500, self.es.count(index=indexes)['count'])
+
+    def test_should_run_searches_of_an_index_together(self):
+        for i in range(0, 10):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body={'i': i})
+        barrier = threading.Barrier(READERS, timeout=5)
+
+        def evaluate(condition, document):
+            # Only passes once all searches are reading the index together
+            barrier.wait()
+            return True
+
+        with mock.patch.object(FakeQueryCondition, 'find_ordinals', return_value=None), \
+                mock.patch.object(FakeQueryCondition, 'evaluate', evaluate), \
+                ThreadPoolExecutor(max_workers=READERS) as executor:
+            body = {'query': {'range': {'i': {'gte': 0}}}, 'size': 1}
+            searches = [executor.submit(self.es.search, index=INDEX_NAME, body=body) for _ in range(0, READERS)]
+            for search in searches:
+                self.assertEqual(1, len(search.result(timeout=RUN_TIMEOUT)['hits']['hits']))
+
+    def test_should_count_forks_taken_and_written_together(self):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='0', body={'i': 0})
+        fake_index = self.es._FakeElasticsearch__documents_dict[INDEX_NAME]
+
+        def fork_and_write(_):
+            forks = [self.es.snapshot()[INDEX_NAME] for _ in range(0, FORKS_PER_READER)]
+            for fork in forks:
+                with fork.lock.write_locked():
+                    fork.put('1', DOC_TYPE, {'i': 1})
+
+        with ThreadPoolExecutor(max_workers=READERS) as executor:
+            list(executor.map(fork_and_write, range(0, READERS), timeout=RUN_TIMEOUT))
+
+        # Every fork has copied the documents it shared with the index
+        self.assertEqual(1, fake_index._sharers[0])
+
+    def test_should_not_copy_fork_while_another_fork_builds_shared_state(self):
+        fake_index = FakeIndex(INDEX_NAME)
+        for i in range(0, 10):
+            fake_index.put(str(i), DOC_TYPE, {'i': i})
+        reading, written = fake_index.fork(), fake_index.fork()
+        building, proceed = threading.Event(), threading.Event()
+        build = SortedField.build
+
+        def slow_build(sorted_field, documents):
+            building.set()
+            proceed.wait(RUN_TIMEOUT)
+            build(sorted_field, documents)
+
+        def write():
+            with written.lock.write_locked():
+                written.put('10', DOC_TYPE, {'i': 10})
+
+        with mock.patch.object(SortedField, 'build', slow_build), ThreadPoolExecutor(max_workers=2) as executor:
+            read = executor.submit(reading.find_range_ordinals, 'i', {'gte': 5})
+            building.wait(RUN_TIMEOUT)
+            write_done = executor.submit(write)
+            # Copying the state of the written fork waits for the build
+            time.sleep(0.1)
+            written_during_build = write_done.done()
+            proceed.set()
+            self.assertEqual(5, len(read.result(timeout=RUN_TIMEOUT)))
+            write_done.result(timeout=RUN_TIMEOUT)
+
+        self.assertFalse(written_during_build)
+        self.assertEqual(6, len(written.find_range_ordinals('i', {'gte': 5})))
+        self.assertEqual(5, len(reading.find_range_ordinals('i', {'gte': 5})))
+        self.assertEqual(5, len(fake_index.find_range_ordinals('i', {'gte': 5})))
+
+    def test_should_let_readers_hold_lock_together(self):
+        lock = ReadWriteLock()
+        barrier = threading.Barrier(READERS, timeout=5)
+
+        def read():
+            with lock.read_locked():
+                # Only passes once all readers are inside the lock together
+                barrier.wait()
+
+        with ThreadPoolExecutor(max_workers=READERS) as executor:
+            for reader in [executor.submit(read) for _ in range(0, READERS)]:
+                reader.result()
+
+    def test_should_give_writers_exclusive_access(self):
+        lock = ReadWriteLock()
+        holders = []
+        overlaps = []
+
+        def hold(acquire):
+            with acquire():
+                holders.append(1)
+                overlaps.append(len(holders))
+                time.sleep(0.001)
+                holders.pop()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(hold, lock.write_locked) for _ in range(0, 20)]
+            for future in futures:
+                future.result()
+
+        self.assertEqual([1] * 20, overlaps)
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+from unittest import mock
 
+from elasticmock.fake_elasticsearch import FakeQueryCondition
+from elasticmock.fake_index import FakeIndex
 from tests import TestElasticmock, DOC_TYPE
 
 
@@ -36,3 +39,39 @@ class TestCount(TestElasticmock):
         self.es.index(index='index', doc_type='different-doc-type', body={'data': 'test2'})
         count = self.es.count(doc_type=DOC_TYPE)
         self.assertEqual(1, count.get('count'))
+
+    def test_should_count_with_doc_type_list(self):
+        self.es.index(index='index', doc_type=DOC_TYPE, body={'data': 'test1'})
+        self.es.index(index='index', doc_type='different-doc-type', body={'data': 'test2'})
+        self.es.index(index='index', doc_type='another-doc-type', body={'data': 'test3'})
+        count = self.es.count(doc_type=[DOC_TYPE, 'another-doc-type'])
+        self.assertEqual(2, count.get('count'))
+
+    def test_should_count_documents_matching_query(self):
+        for i in range(0, 10):
+            doc_type = DOC_TYPE if i % 2 else 'different-doc-type'
+            self.es.index(index='index', doc_type=doc_type, body={'data': 'test_{0}'.format(i % 3), 'number': i})
+
+        self.assertEqual(4, self.es.count(index='index', body={'query': {'term': {'data': 'test_0'}}})['count'])
+        self.assertEqual(4, self.es.count(index='index', body={'query': {'range': {'number': {'gte': 6}}}})['count'])
+        self.assertEqual(10, self.es.count(index='index', body={'query': {'match_all': {}}})['count'])
+        body = {'query': {'bool': {'must': [{'term': {'data': 'test_0'}}, {'range': {'number': {'gte': 6}}}]}}}
+        self.assertEqual(2, self.es.count(index='index', body=body)['count'])
+        self.assertEqual(1, self.es.count(index='index', doc_type=DOC_TYPE, body=body)['count'])
+
+        result = self.es.count(index='index', body={'query': {'term': {'data': 'test_0'}}}, terminate_after=2)
+        self.assertEqual(2, result['count'])
+        self.assertTrue(result['terminated_early'])
+        result = self.es.count(index='index', body={'query': {'term': {'data': 'test_0'}}, 'terminate_after': 2})
+        self.assertEqual(4, result['count'])
+        self.assertNotIn('terminated_early', result)
+
+    def test_should_count_without_reading_documents_when_query_resolves_to_ordinals(self):
+        for i in range(0, 10):
+            self.es.index(index='index', doc_type=DOC_TYPE, body={'data': 'test_{0}'.format(i % 3)})
+
+        with mock.patch.object(FakeIndex, 'iter_items', side_effect=AssertionError), \
+                mock.patch.object(FakeQueryCondition, 'evaluate', side_effect=AssertionError):
+            self.assertEqual(10, self.es.count(index='index', doc_type=DOC_TYPE)['count'])
+            body = {'query': {'term': {'data': 'test_1'}}}
+            self.assertEqual(3, self.es.count(index='index', body=body, request_cache=False)['count'])
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 
 from elasticsearch.exceptions import NotFoundError
 
@@ -68,3 +69,37 @@ class TestGet(TestElasticmock):
             ids.append(data.get('_id'))
         results = self.es.mget(index=INDEX_NAME, body={'docs': [{'_id': id} for id in ids]})
         self.assertEqual(len(results['docs']), 10)
+
+    def test_should_not_change_stored_document_through_response(self):
+        body = {'author': 'kimchy', 'tags': ['cool'], 'user': {'name': 'Shay'}}
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='1', body=body)
+
+        target_doc = self.es.get(index=INDEX_NAME, id='1')
+        self.assertIsInstance(target_doc['_source'], dict)
+        self.assertEqual(body, json.loads(json.dumps(target_doc))['_source'])
+        target_doc['found'] = False
+        target_doc['_source']['author'] = 'banon'
+        target_doc['_source']['user']['name'] = 'Banon'
+        target_doc['_source']['tags'].append('bonsai')
+        for value in target_doc['_source'].values():
+            if isinstance(value, list):
+                value.append('search')
+
+        self.assertEqual({'author': 'banon', 'tags': ['cool', 'bonsai', 'search'], 'user': {'name': 'Banon'}},
+                         target_doc['_source'])
+        self.assertEqual({'author': 'kimchy', 'tags': ['cool'], 'user': {'name': 'Shay'}}, body)
+        self.assertEqual(body, self.es.get(index=INDEX_NAME, id='1')['_source'])
+        self.assertTrue(self.es.get(index=INDEX_NAME, id='1')['found'])
+
+    def test_should_not_change_stored_document_through_copies_of_response(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='1', body={'user': {'name': 'Shay'}, 'tags': ['cool']})
+
+        for copy_source in (dict.copy, dict, lambda source: {**source}):
+            source = copy_source(self.es.get(index=INDEX_NAME, id='1')['_source'])
+            source['user']['name'] = 'Banon'
+            source['tags'].append('bonsai')
+
+            self.assertEqual({'user': {'name': 'Shay'}, 'tags': ['cool']},
+                             self.es.get(index=INDEX_NAME, id='1')['_source'])
+            hits = self.es.search(index=INDEX_NAME, body={'query': {'term': {'tags': 'bonsai'}}})['hits']['hits']
+            self.assertEqual([], hits)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import elasticsearch
+from elasticsearch.helpers import BulkIndexError
+
+from elasticmock import elasticmock, helpers
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestHelpers(TestElasticmock):
+
+    def __actions(self, ids):
+        for document_id in ids:
+            yield {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': document_id, 'data': 'test_{0}'.format(document_id)}
+
+    def test_should_bulk_index_actions(self):
+        success, errors = helpers.bulk(self.es, self.__actions(range(1, 4)))
+
+        self.assertEqual(3, success)
+        self.assertEqual([], errors)
+        document = self.es.get(index=INDEX_NAME, id=2)
+        self.assertEqual({'data': 'test_2'}, document['_source'])
+
+    def test_should_not_share_sources_with_actions(self):
+        source = {'data': ['test']}
+        helpers.bulk(self.es, [{'_index': INDEX_NAME, '_id': 1, '_source': source}])
+        source['data'].append('changed')
+
+        self.assertEqual({'data': ['test']}, self.es.get(index=INDEX_NAME, id=1)['_source'])
+
+    def test_should_stream_bulk_results(self):
+        actions = list(self.__actions([1, 2])) + [
+            {'_op_type': 'update', '_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 1, 'doc': {'data': 'updated'}},
+            {'_op_type': 'delete', '_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 2},
+        ]
+
+        results = list(helpers.streaming_bulk(self.es, actions, chunk_size=3))
+
+        self.assertEqual([True] * 4, [ok for ok, _ in results])
+        self.assertEqual(['created', 'created', 'updated', 'deleted'],
+                         [next(iter(item.values()))['result'] for _, item in results])
+        self.assertEqual({'data': 'updated'}, self.es.get(index=INDEX_NAME, id=1)['_source'])
+        self.assertTrue(self.es.exists(index=INDEX_NAME, doc_type=DOC_TYPE, id=1))
+        self.assertFalse(self.es.exists(index=INDEX_NAME, doc_type=DOC_TYPE, id=2))
+
+    def test_should_report_bulk_errors(self):
+        actions = [{'_op_type': 'create', '_index': INDEX_NAME, '_id': 1, 'data': 'test'}] * 2
+
+        with self.assertRaises(BulkIndexError) as context:
+            helpers.bulk(self.es, actions)
+        self.assertEqual(409, context.exception.errors[0]['create']['status'])
+
+        success, failed = helpers.bulk(self.es, actions, stats_only=True, raise_on_error=False)
+        self.assertEqual((0, 2), (success, failed))
+
+    def test_should_parallel_bulk_actions(self):
+        results = list(helpers.parallel_bulk(self.es, self.__actions(range(1, 11)), chunk_size=3))
+
+        self.assertEqual(10, len(results))
+        self.assertEqual(10, self.es.count(index=INDEX_NAME)['count'])
+
+    @elasticmock
+    def test_should_patch_elasticsearch_helpers(self):
+        es = elasticsearch.Elasticsearch()
+
+        self.assertIs(helpers.bulk, elasticsearch.helpers.bulk)
+        self.assertEqual((2, []), elasticsearch.helpers.bulk(es, self.__actions([1, 2])))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from elasticsearch.exceptions import RequestError
+
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestLoadNdjson(TestElasticmock):
+
+    def __write_lines(self, lines, suffix='.ndjson'):
+        file_descriptor, path = tempfile.mkstemp(suffix=suffix)
+        os.close(file_descriptor)
+        self.addCleanup(os.unlink, path)
+        content = '\n'.join(json.dumps(line) for line in lines).encode()
+        opener = gzip.open if suffix.endswith('.gz') else open
+        with opener(path, 'wb') as ndjson_file:
+            ndjson_file.write(content)
+        return path
+
+    def test_should_load_one_document_per_line(self):
+        path = self.__write_lines([{'data': 'test_{0}'.format(i)} for i in range(0, 5)])
+
+        stats = self.es.load_ndjson(path, index=INDEX_NAME, doc_type=DOC_TYPE, chunk_size=2)
+
+        self.assertEqual(5, stats['documents'])
+        self.assertEqual(0, stats['errors'])
+        self.assertIn('docs_per_second', stats)
+        self.assertEqual(5, self.es.count(index=INDEX_NAME)['count'])
+        hits = self.es.search(index=INDEX_NAME, body={'query': {'term': {'data': 'test_3'}}})['hits']['hits']
+        self.assertEqual(1, len(hits))
+        self.assertEqual(DOC_TYPE, hits[0]['_type'])
+
+    def test_should_load_bulk_format(self):
+        path = self.__write_lines([
+            {'index': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 1}},
+            {'data': 'test_1'},
+            {'create': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 2}},
+            {'data': 'test_2'},
+            {'create': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 2}},
+            {'data': 'conflict'},
+            {'update': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 1}},
+            {'doc': {'data': 'updated'}},
+            {'delete': {'_index': INDEX_NAME, '_type': DOC_TYPE, '_id': 2}},
+        ], suffix='.ndjson.gz')
+
+        stats = self.es.load_ndjson(path)
+
+        self.assertEqual(4, stats['documents'])
+        self.assertEqual(1, stats['errors'])
+        document = self.es.get(index=INDEX_NAME, id=1)
+        self.assertEqual({'data': 'updated'}, document['_source'])
+        self.assertEqual(2, document['_version'])
+        self.assertTrue(self.es.exists(index=INDEX_NAME, doc_type=DOC_TYPE, id=1))
+        self.assertFalse(self.es.exists(index=INDEX_NAME, doc_type=DOC_TYPE, id=2))
+
+    def test_should_load_file_object(self):
+        lines = io.BytesIO(b'{"data": "test_1"}\n\n{"data": "test_2"}\n')
+
+        stats = self.es.load_ndjson(lines, index=INDEX_NAME)
+
+        self.assertEqual(2, stats['documents'])
+        self.assertEqual(2, self.es.count(index=INDEX_NAME)['count'])
+
+    def test_should_require_index_for_plain_documents(self):
+        with self.assertRaises(ValueError):
+            self.es.load_ndjson(io.BytesIO(b'{"data": "test"}\n'))
+
+    def test_should_require_id_to_delete(self):
+        with self.assertRaises(RequestError):
+            self.es.load_ndjson(io.BytesIO(b'{"delete": {"_index": "test_index"}}\n'))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from elasticsearch.exceptions import NotFoundError, RequestError
+
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestPointInTime(TestElasticmock):
+
+    def setUp(self):
+        super(TestPointInTime, self).setUp()
+        for i in range(0, 10):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body={'data': i % 5, 'name': str(i)})
+
+    def __search_all(self, body, size=3):
+        ids = []
+        result = self.es.search(body=dict(body, size=size))
+        while result['hits']['hits']:
+            ids.extend(hit['_id'] for hit in result['hits']['hits'])
+            body = dict(body, search_after=result['hits']['hits'][-1]['sort'])
+            if 'pit_id' in result:
+                body['pit'] = {'id': result['pit_id'], 'keep_alive': '1m'}
+            result = self.es.search(body=dict(body, size=size))
+        return ids
+
+    def test_should_page_sorted_hits_with_search_after(self):
+        ids = []
+        body = {'sort': [{'data': 'desc'}, 'name'], 'size': 3}
+        result = self.es.search(index=INDEX_NAME, body=body)
+        while result['hits']['hits']:
+            self.assertEqual(10, result['hits']['total']['value'])
+            ids.extend(hit['_id'] for hit in result['hits']['hits'])
+            body['search_after'] = result['hits']['hits'][-1]['sort']
+            result = self.es.search(index=INDEX_NAME, body=body)
+
+        self.assertEqual(['4', '9', '3', '8', '2', '7', '1', '6', '0', '5'], ids)
+
+    def test_should_search_documents_as_they_were_when_point_in_time_opened(self):
+        pit_id = self.es.open_point_in_time(index=INDEX_NAME, keep_alive='1m')['id']
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='10', body={'data': 0, 'name': '10'})
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='0', body={'data': 4, 'name': '0'})
+        self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id='5')
+
+        body = {'pit': {'id': pit_id, 'keep_alive': '1m'}, 'sort': ['data'], 'query': {'term': {'data': 0}}}
+        result = self.es.search(body=body)
+        self.assertEqual(pit_id, result['pit_id'])
+        self.assertEqual(['0', '5'], [hit['_id'] for hit in result['hits']['hits']])
+        self.assertEqual({'data': 0, 'name': '0'}, result['hits']['hits'][0]['_source'])
+
+        self.assertEqual([str(i) for i in range(0, 10)], self.__search_all({'pit': body['pit']}))
+        live = self.es.search(index=INDEX_NAME, body={'query': {'term': {'data': 0}}})
+        self.assertEqual(['10'], [hit['_id'] for hit in live['hits']['hits']])
+
+    def test_should_not_find_closed_point_in_time(self):
+        pit_id = self.es.open_point_in_time(index=INDEX_NAME, keep_alive='1m')['id']
+        self.assertEqual({'succeeded': True, 'num_freed': 1}, self.es.close_point_in_time(body={'id': pit_id}))
+        self.assertEqual({'succeeded': True, 'num_freed': 0}, self.es.close_point_in_time(body={'id': pit_id}))
+
+        with self.assertRaises(NotFoundError):
+            self.es.search(body={'pit': {'id': pit_id}})
+
+    def test_should_reject_invalid_point_in_time_searches(self):
+        pit_id = self.es.open_point_in_time(index=INDEX_NAME, keep_alive='1m')['id']
+
+        with self.assertRaises(RequestError):
+            self.es.search(index=INDEX_NAME, body={'pit': {'id': pit_id}})
+        with self.assertRaises(RequestError):
+            self.es.search(index=INDEX_NAME, body={'search_after': [1]})
+        with self.assertRaises(RequestError):
+            self.es.search(body={'pit': {'id': pit_id}, 'sort': ['data'], 'search_after': [1]})
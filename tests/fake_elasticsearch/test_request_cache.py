@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+AGGREGATION_BODY = {
+    'size': 0,
+    'aggs': {
+        'by_data': {
+            'composite': {'sources': [{'data': {'terms': {'field': 'data'}}}]},
+            'aggs': {'distinct_data': {'cardinality': {'field': 'data'}}},
+        }
+    },
+}
+
+
+class TestRequestCache(TestElasticmock):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(0, 3):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i)})
+
+    def test_should_cache_search_without_hits(self):
+        first = self.es.search(index=INDEX_NAME, body=AGGREGATION_BODY)
+        first['aggregations']['by_data']['buckets'].clear()
+        second = self.es.search(index=INDEX_NAME, body=AGGREGATION_BODY)
+
+        self.assertEqual(3, len(second['aggregations']['by_data']['buckets']))
+        self.assertEqual(1, self.es.request_cache_stats()['hits'])
+        self.assertEqual(1, self.es.request_cache_stats()['misses'])
+
+    def test_should_not_cache_search_with_hits_by_default(self):
+        self.es.search(index=INDEX_NAME)
+        self.es.search(index=INDEX_NAME)
+
+        self.assertEqual(0, self.es.request_cache_stats()['size'])
+
+    def test_should_honor_request_cache_param(self):
+        self.es.search(index=INDEX_NAME, request_cache=True)
+        self.es.search(index=INDEX_NAME, request_cache=True)
+        self.assertEqual(1, self.es.request_cache_stats()['hits'])
+        self.assertEqual(1, self.es.request_cache_stats()['size'])
+
+        self.es.count(index=INDEX_NAME, request_cache=False)
+        self.es.count(index=INDEX_NAME, request_cache=False)
+
+        self.assertEqual(1, self.es.request_cache_stats()['hits'])
+        self.assertEqual(1, self.es.request_cache_stats()['size'])
+
+    def test_should_invalidate_on_write(self):
+        self.assertEqual(3, self.es.count(index=INDEX_NAME)['count'])
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=3, body={'data': 'test_3'})
+        self.assertEqual(4, self.es.count(index=INDEX_NAME)['count'])
+        self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=0)
+        self.assertEqual(3, self.es.count(index=INDEX_NAME)['count'])
+
+        self.es.indices.delete(index=INDEX_NAME)
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=0, body={'data': 'test_0'})
+        self.assertEqual(1, self.es.count(index=INDEX_NAME)['count'])
+        self.assertEqual(0, self.es.request_cache_stats()['hits'])
+
+    def test_should_clear_cache(self):
+        self.es.count(index=INDEX_NAME)
+        self.es.indices.clear_cache(index=INDEX_NAME, request=True)
+
+        self.assertEqual(0, self.es.request_cache_stats()['size'])
@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import threading
+import time
+
+from elasticsearch.exceptions import NotFoundError, RequestError, TransportError
+
+from elasticmock.fake_scroll import MAX_OPEN_SCROLL_CONTEXT
 from tests import TestElasticmock, INDEX_NAME, DOC_TYPE, BODY
 
 
@@ -19,6 +25,111 @@ class TestScroll(TestElasticmock):
         result = self.es.scroll(scroll_id=result.get('_scroll_id'), scroll='1m')
         self.__assert_scroll(result, 10)
 
+    def test_should_serve_pages_of_documents_matched_when_search_ran(self):
+        for i in range(0, 10):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=i, body={'data': i})
+
+        result = self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 4})
+        scroll_id = result['_scroll_id']
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=10, body={'data': 10})
+        self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=9)
+
+        ids = [hit['_id'] for hit in result['hits']['hits']]
+        while result['hits']['hits']:
+            result = self.es.scroll(scroll_id=scroll_id, scroll='1m')
+            self.assertEqual(scroll_id, result['_scroll_id'])
+            self.assertEqual(10, result['hits']['total']['value'])
+            ids.extend(hit['_id'] for hit in result['hits']['hits'])
+
+        self.assertEqual(list(range(0, 10)), ids)
+
+    def test_should_give_first_hits_of_scan_search_on_first_scroll(self):
+        for i in range(0, 5):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=i, body={'data': i})
+
+        result = self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 3, 'search_type': 'scan'})
+        self.assertEqual(5, result['hits']['total']['value'])
+        self.assertEqual([], result['hits']['hits'])
+
+        result = self.es.scroll(scroll_id=result['_scroll_id'], scroll='1m')
+        self.assertEqual([0, 1, 2], [hit['_id'] for hit in result['hits']['hits']])
+
+    def test_should_expire_scroll_after_keep_alive(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body=BODY)
+        result = self.es.search(index=INDEX_NAME, params={'scroll': '1ms', 'size': 1})
+
+        time.sleep(0.01)
+
+        with self.assertRaises(NotFoundError):
+            self.es.scroll(scroll_id=result['_scroll_id'])
+
+    def test_should_clear_scroll(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body=BODY)
+        first = self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 1})
+        second = self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 1})
+
+        self.assertEqual(1, self.es.clear_scroll(scroll_id=first['_scroll_id'])['num_freed'])
+        with self.assertRaises(NotFoundError):
+            self.es.scroll(scroll_id=first['_scroll_id'])
+        self.assertEqual(1, self.es.clear_scroll(body={'scroll_id': [second['_scroll_id']]})['num_freed'])
+
+    def test_should_limit_open_scroll_contexts(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body=BODY)
+        for _ in range(0, MAX_OPEN_SCROLL_CONTEXT):
+            self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 1})
+
+        with self.assertRaises(TransportError):
+            self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 1})
+        self.es.clear_scroll(scroll_id='_all')
+        self.es.search(index=INDEX_NAME, params={'scroll': '1m', 'size': 1})
+
+    def test_should_split_scroll_into_slices(self):
+        for i in range(0, 100):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body={'worker': i % 3})
+
+        slices = [self.__scroll_slice({'id': slice_id, 'max': 4}) for slice_id in range(0, 4)]
+        self.assertTrue(all(slices))
+        self.assertEqual(sorted(str(i) for i in range(0, 100)), sorted(sum(slices, [])))
+        self.assertEqual(slices[1], self.__scroll_slice({'id': 1, 'max': 4}))
+
+        by_worker = self.__scroll_slice({'id': 1, 'max': 3, 'field': 'worker'})
+        self.assertEqual([str(i) for i in range(1, 100, 3)], by_worker)
+
+    def test_should_scroll_slices_from_threads(self):
+        for i in range(0, 1000):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body={'data': i})
+
+        slices = [None] * 8
+
+        def consume(slice_id):
+            slices[slice_id] = self.__scroll_slice({'id': slice_id, 'max': 8}, size=10)
+
+        threads = [threading.Thread(target=consume, args=(slice_id,)) for slice_id in range(0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(str(i) for i in range(0, 1000)), sorted(sum(slices, [])))
+
+    def test_should_reject_invalid_slices(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body=BODY)
+
+        for slice_body in ({'id': 0, 'max': 1}, {'id': 2, 'max': 2}, {'max': 2}):
+            with self.assertRaises(RequestError):
+                self.es.search(index=INDEX_NAME, body={'slice': slice_body}, params={'scroll': '1m'})
+        with self.assertRaises(RequestError):
+            self.es.search(index=INDEX_NAME, body={'slice': {'id': 0, 'max': 2}})
+
+    def __scroll_slice(self, slice_body, size=30):
+        result = self.es.search(index=INDEX_NAME, body={'slice': slice_body}, params={'scroll': '1m', 'size': size})
+        ids = []
+        while result['hits']['hits']:
+            ids.extend(hit['_id'] for hit in result['hits']['hits'])
+            result = self.es.scroll(scroll_id=result['_scroll_id'], scroll='1m')
+        self.es.clear_scroll(scroll_id=result['_scroll_id'])
+        return ids
+
     def __assert_scroll(self, result, expected_scroll_hits):
         hits = result.get('hits')
 
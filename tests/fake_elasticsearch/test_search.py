@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
+import copy
 import datetime
+import decimal
+import json
+from unittest import mock
 
 from elasticsearch.exceptions import NotFoundError
 from parameterized import parameterized
 
+from elasticmock.fake_elasticsearch import FILTER_CACHE, QUERY_PLAN_CACHE, FakeQueryCondition
+from elasticmock.fake_index import FakeDocument, parse_datetime
 from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
 
 
@@ -55,6 +61,20 @@ class TestSearch(TestElasticmock):
         search = self.es.search(index=INDEX_NAME, doc_type=DOC_TYPE)
         self.assertEqual(index_quantity, search.get('hits').get('total').get('value'))
 
+    def test_should_return_documents_of_several_doc_types_in_insertion_order(self):
+        for i, doc_type in enumerate(['type_a', 'type_b', 'type_c', 'type_a', 'type_b']):
+            self.es.index(index=INDEX_NAME, doc_type=doc_type, id=i, body={'data': i})
+
+        search = self.es.search(index=INDEX_NAME, doc_type=['type_b', 'type_a'])
+        self.assertEqual([0, 1, 3, 4], [hit['_id'] for hit in search['hits']['hits']])
+
+    def test_should_not_expose_search_metadata_on_stored_documents(self):
+        data = self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, body={'data': 'test'})
+        self.es.search(index=INDEX_NAME)
+
+        document = self.es.get(index=INDEX_NAME, id=data['_id'])
+        self.assertNotIn('_score', document)
+
     def test_should_search_in_multiple_indexes(self):
         self.es.index(index='groups', doc_type='groups', body={'budget': 1000})
         self.es.index(index='users', doc_type='users', body={'name': 'toto'})
@@ -131,6 +151,18 @@ class TestSearch(TestElasticmock):
         self.assertEqual(len(hits), 1)
         self.assertEqual(hits[0]['_source'], {'data': 'test_3'})
 
+    def test_search_with_term_query_after_update_and_delete(self):
+        for i in range(0, 3):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i)})
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=0, body={'data': 'updated'})
+        self.es.delete(index='index_for_search', doc_type=DOC_TYPE, id=1)
+
+        response = self.es.search(index='index_for_search', body={'query': {'term': {'data': 'test'}}})
+        self.assertEqual([2], [hit['_id'] for hit in response['hits']['hits']])
+
+        response = self.es.search(index='index_for_search', body={'query': {'match': {'data': 'UPDATED'}}})
+        self.assertEqual([0], [hit['_id'] for hit in response['hits']['hits']])
+
     def test_search_with_bool_query(self):
         for i in range(0, 10):
             self.es.index(index='index_for_search', doc_type=DOC_TYPE, body={'id': i})
@@ -339,6 +371,193 @@ class TestSearch(TestElasticmock):
         hits = response['hits']['hits']
         self.assertEqual(set(expected_ids), set(hit['_source']['id'] for hit in hits))
 
+    def test_search_with_range_query_after_update_and_delete(self):
+        for i in range(0, 5):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data_int': 10 * i})
+        body = {'query': {'range': {'data_int': {'gte': 20}}}}
+        response = self.es.search(index='index_for_search', body=body)
+        self.assertEqual([2, 3, 4], [hit['_id'] for hit in response['hits']['hits']])
+
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=0, body={'data_int': 50})
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=4, body={'data_int': 0})
+        self.es.delete(index='index_for_search', doc_type=DOC_TYPE, id=3)
+
+        response = self.es.search(index='index_for_search', body=body)
+        self.assertEqual([2, 0], [hit['_id'] for hit in response['hits']['hits']])
+
+    def test_search_reuses_compiled_query_plan(self):
+        for i in range(0, 3):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i)})
+        QUERY_PLAN_CACHE.clear()
+        query = {'bool': {'should': [{'term': {'data': 'test_1'}}, {'term': {'data': 'test_2'}}]}}
+
+        first = self.es.search(index='index_for_search', body={'query': query})
+        query['bool']['should'].pop()
+        second = self.es.search(
+            index='index_for_search',
+            body={'query': {'bool': {'should': [{'term': {'data': 'test_1'}}, {'term': {'data': 'test_2'}}]}}}
+        )
+
+        self.assertEqual(1, QUERY_PLAN_CACHE.hits)
+        self.assertEqual([1, 2], [hit['_id'] for hit in first['hits']['hits']])
+        self.assertEqual([1, 2], [hit['_id'] for hit in second['hits']['hits']])
+
+    def test_search_doesnt_reuse_query_plan_of_value_of_another_type(self):
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='1', body={'value': 1})
+
+        by_string = self.es.search(index='index_for_search', body={'query': {'term': {'value': '1'}}})
+        by_decimal = self.es.search(index='index_for_search', body={'query': {'term': {'value': decimal.Decimal('1')}}})
+
+        self.assertEqual(0, by_string['hits']['total']['value'])
+        self.assertEqual(1, by_decimal['hits']['total']['value'])
+
+    def test_search_with_range_query_on_datetimes_of_several_time_zones(self):
+        utc, paris = datetime.timezone.utc, datetime.timezone(datetime.timedelta(hours=1))
+        timestamps = [
+            datetime.datetime(2009, 1, 1, 10, 0),
+            datetime.datetime(2009, 1, 1, 11, 15, tzinfo=paris),
+            datetime.datetime(2009, 1, 1, 10, 30, tzinfo=utc),
+            datetime.datetime(2009, 1, 1, 9, 45, tzinfo=utc),
+        ]
+        for i, timestamp in enumerate(timestamps):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'timestamp': timestamp, 'id': i})
+
+        body = {
+            'query': {'range': {'timestamp': {'gte': '2009-01-01T10:00:00Z', 'lt': '2009-01-01T11:30:00+01:00'}}},
+            'sort': ['timestamp'],
+        }
+        response = self.es.search(index='index_for_search', body=body)
+        self.assertEqual([0, 1], [hit['_id'] for hit in response['hits']['hits']])
+        self.assertEqual([[1230804000000], [1230804900000]], [hit['sort'] for hit in response['hits']['hits']])
+
+        # Evaluated document by document, without parsing their datetimes
+        body['query']['range']['timestamp']['lt'] = '2009-01-01T10:30:00Z'
+        with mock.patch.object(FakeQueryCondition, 'find_ordinals', return_value=None), \
+                mock.patch('elasticmock.fake_index.parse_datetime', wraps=parse_datetime) as parse:
+            response = self.es.search(index='index_for_search', body=body)
+        self.assertEqual([0, 1], [hit['_id'] for hit in response['hits']['hits']])
+        self.assertEqual(2, parse.call_count)
+
+    def test_search_with_term_query_on_datetimes_matches_their_iso_form_with_or_without_index(self):
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='1',
+                      body={'timestamp': datetime.datetime(2009, 1, 1, 10, 0, tzinfo=datetime.timezone.utc)})
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='2',
+                      body={'timestamp': datetime.datetime(2009, 1, 2, 10, 0)})
+
+        for term in ('2009-01-01T10:00', 'T10:00:00', '+00:00', ' 10:00'):
+            indexed = self.es.search(index='index_for_search', body={'query': {'term': {'timestamp': term}}})
+            # A should clause that isn't a list is evaluated document by document
+            evaluated = self.es.search(index='index_for_search',
+                                       body={'query': {'bool': {'should': {'term': {'timestamp': term}}}}})
+            self.assertEqual(sorted(hit['_id'] for hit in indexed['hits']['hits']),
+                             sorted(hit['_id'] for hit in evaluated['hits']['hits']), term)
+        self.assertEqual(2, self.es.count(index='index_for_search',
+                                          body={'query': {'bool': {'should': {'term': {'timestamp': 'T10:00'}}}}})['count'])
+
+    def test_search_with_range_query_on_datetimes_raises_for_unparseable_bounds(self):
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='1',
+                      body={'timestamp': datetime.datetime(2009, 1, 1, 10, 0)})
+
+        with self.assertRaises(ValueError):
+            self.es.search(index='index_for_search', body={'query': {'range': {'timestamp': {'gte': 'now-1d'}}}})
+        with self.assertRaises(ValueError):
+            self.es.count(index='index_for_search', body={'query': {'range': {'timestamp': {'lt': 'now'}}}})
+
+    def test_search_gives_datetimes_in_iso_form_without_changing_stored_documents(self):
+        timestamp = datetime.datetime(2009, 1, 1, 10, 5)
+        body = {'timestamp': timestamp, 'event': {'ends': [timestamp]}}
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='1', body=body)
+
+        for _ in range(2):
+            response = self.es.search(index='index_for_search', body={'query': {'match_all': {}}})
+            expected = {'timestamp': '2009-01-01T10:05:00', 'event': {'ends': ['2009-01-01T10:05:00']}}
+            self.assertEqual(expected, response['hits']['hits'][0]['_source'])
+        self.assertEqual({'timestamp': timestamp, 'event': {'ends': [timestamp]}}, body)
+        self.assertEqual(body, self.es.get(index='index_for_search', id='1')['_source'])
+
+    def test_search_hits_are_plain_dicts_that_dont_change_stored_documents(self):
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='1', body={'data': {'tags': ['a']}})
+
+        response = self.es.search(index='index_for_search', body={'query': {'match_all': {}}})
+        source = response['hits']['hits'][0]['_source']
+        self.assertIsInstance(source, dict)
+        self.assertEqual(response, json.loads(json.dumps(response)))
+        self.assertEqual(source, copy.deepcopy(response)['hits']['hits'][0]['_source'])
+        source['data']['tags'].append('b')
+
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id='2', body=source)
+        self.assertEqual({'data': {'tags': ['a', 'b']}}, self.es.get(index='index_for_search', id='2')['_source'])
+        self.assertEqual({'data': {'tags': ['a']}}, self.es.get(index='index_for_search', id='1')['_source'])
+
+    def test_search_reuses_cached_filters_until_write(self):
+        for i in range(0, 4):
+            body = {'tenant': 'tenant_{0}'.format(i % 2), 'status': 'open' if i < 3 else 'closed'}
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body=body)
+        FILTER_CACHE.clear()
+
+        def search_ids(*filters):
+            body = {'query': {'bool': {'filter': list(filters)}}}
+            return [hit['_id'] for hit in self.es.search(index='index_for_search', body=body)['hits']['hits']]
+
+        self.assertEqual([0, 2], search_ids({'term': {'tenant': 'tenant_0'}}))
+        self.assertEqual([0, 2], search_ids({'term': {'status': 'open'}}, {'term': {'tenant': 'tenant_0'}}))
+        self.assertEqual(1, FILTER_CACHE.hits)
+
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=2, body={'tenant': 'tenant_0', 'status': 'closed'})
+        self.assertEqual([0], search_ids({'term': {'status': 'open'}}, {'term': {'tenant': 'tenant_0'}}))
+
+    def test_search_with_from_and_size(self):
+        for i in range(0, 10):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': i})
+
+        response = self.es.search(index='index_for_search', from_=2, size=3)
+        self.assertEqual([2, 3, 4], [hit['_id'] for hit in response['hits']['hits']])
+        self.assertEqual({'value': 10, 'relation': 'eq'}, response['hits']['total'])
+
+    def test_search_with_terminate_after(self):
+        for i in range(0, 10):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': i})
+
+        response = self.es.search(index='index_for_search', terminate_after=4, size=2)
+        self.assertTrue(response['terminated_early'])
+        self.assertEqual([0, 1], [hit['_id'] for hit in response['hits']['hits']])
+        self.assertEqual(4, response['hits']['total']['value'])
+
+    def test_search_with_track_total_hits(self):
+        for i in range(0, 10):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': i})
+
+        response = self.es.search(index='index_for_search', body={'track_total_hits': False}, size=2)
+        self.assertNotIn('total', response['hits'])
+        self.assertEqual(2, len(response['hits']['hits']))
+        response = self.es.search(index='index_for_search', track_total_hits=5, size=2)
+        self.assertEqual({'value': 5, 'relation': 'gte'}, response['hits']['total'])
+        response = self.es.search(index='index_for_search', track_total_hits=20, size=2)
+        self.assertEqual({'value': 10, 'relation': 'eq'}, response['hits']['total'])
+
+    def test_search_stops_reading_matches_once_page_is_full(self):
+        for i in range(0, 100):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i)})
+        body = {'query': {'match': {'data': 'test'}}, 'track_total_hits': False}
+
+        with mock.patch.object(FakeQueryCondition, 'find_ordinals', return_value=None), \
+                mock.patch.object(FakeQueryCondition, 'evaluate', autospec=True,
+                                  side_effect=FakeQueryCondition.evaluate) as evaluate:
+            response = self.es.search(index='index_for_search', body=body, size=5)
+
+        self.assertEqual([0, 1, 2, 3, 4], [hit['_id'] for hit in response['hits']['hits']])
+        self.assertEqual(5, evaluate.call_count)
+
+    def test_search_without_hits_does_not_build_hits(self):
+        for i in range(0, 10):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i % 2)})
+
+        with mock.patch.object(FakeDocument, 'to_dict', autospec=True, side_effect=FakeDocument.to_dict) as to_dict:
+            response = self.es.search(index='index_for_search', body={'query': {'term': {'data': 'test_1'}}}, size=0)
+
+        self.assertEqual(0, to_dict.call_count)
+        self.assertEqual(5, response['hits']['total']['value'])
+
     def test_bucket_aggregation(self):
         data = [
             {"data_x": 1, "data_y": "a"},
@@ -379,3 +598,31 @@ class TestSearch(TestElasticmock):
         for x, y in zip(expected, actual):
             self.assertDictEqual(x["key"], y["key"])
             self.assertEqual(x["doc_count"], y["doc_count"])
+
+    def test_bucket_aggregation_after_update_and_delete(self):
+        data = [
+            {"data_x": "a", "data_y": 1},
+            {"data_x": "a", "data_y": 2},
+            {"data_x": "b", "data_y": 2},
+            {"data_x": "c", "data_y": 3},
+        ]
+        for i, body in enumerate(data):
+            self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=i, body=body)
+        body = {
+            "aggs": {
+                "stats": {
+                    "composite": {"sources": [{"data_x": {"terms": {"field": "data_x"}}}]},
+                    "aggs": {"distinct_data_y": {"cardinality": {"field": "data_y"}}},
+                }
+            },
+        }
+        self.es.search(index="index_for_search", body=body)
+
+        self.es.index(index='index_for_search', doc_type=DOC_TYPE, id=2, body={"data_x": "a", "data_y": 3})
+        self.es.delete(index='index_for_search', doc_type=DOC_TYPE, id=3)
+        response = self.es.search(index="index_for_search", body=body)
+
+        expected = [
+            {"key": {"data_x": "a"}, "doc_count": 3, "distinct_data_y": {"value": 3}},
+        ]
+        self.assertEqual(expected, response["aggregations"]["stats"]["buckets"])
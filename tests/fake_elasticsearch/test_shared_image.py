@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import tempfile
+
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestSharedImage(TestElasticmock):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for i in range(0, 5):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=i, body={
+                'data': 'test_{0}'.format(i),
+                'timestamp': datetime.datetime(2020, 1, i + 1),
+            })
+
+    def __attach(self, path):
+        es = FakeElasticsearch()
+        es.attach_image(path)
+        return es
+
+    def __search_ids(self, es, query):
+        return [hit['_id'] for hit in es.search(index=INDEX_NAME, body={'query': query})['hits']['hits']]
+
+    def test_should_attach_published_image(self):
+        path = self.es.publish_image(self.directory.name)
+        self.assertEqual(path, self.es.publish_image(self.directory.name))
+
+        attached = self.__attach(path)
+
+        self.assertEqual(self.es.get(index=INDEX_NAME, id=3), attached.get(index=INDEX_NAME, id=3))
+        self.assertEqual([2], self.__search_ids(attached, {'term': {'data': 'test_2'}}))
+        self.assertEqual([3, 4], self.__search_ids(attached, {'range': {'timestamp': {'gte': '2020-01-04'}}}))
+
+    def test_should_keep_writes_to_attaching_instance(self):
+        path = self.es.publish_image(self.directory.name)
+        attached = self.__attach(path)
+        other = self.__attach(path)
+
+        attached.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=0, body={'data': 'updated'})
+        attached.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=4)
+
+        self.assertEqual([0], self.__search_ids(attached, {'term': {'data': 'updated'}}))
+        self.assertEqual(2, attached.get(index=INDEX_NAME, id=0)['_version'])
+        self.assertEqual([0, 1, 2, 3, 4], self.__search_ids(other, {'term': {'data': 'test'}}))
+        self.assertEqual([0, 1, 2, 3, 4], self.__search_ids(self.__attach(path), {'term': {'data': 'test'}}))
+
+    def test_should_save_snapshot_of_attached_image(self):
+        attached = self.__attach(self.es.publish_image(self.directory.name))
+
+        restored = FakeElasticsearch()
+        restored.load_snapshot(attached.save_snapshot(self.directory.name))
+
+        self.assertEqual(self.es.get(index=INDEX_NAME, id=1), restored.get(index=INDEX_NAME, id=1))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+from unittest import mock
+
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+from elasticmock.utilities.snapshot_file import SNAPSHOT_FILE_MAGIC
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestSnapshot(TestElasticmock):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(0, 5):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=i, body={'data': 'test_{0}'.format(i)})
+
+    def __search_ids(self, es, query=None):
+        body = {'query': query} if query else None
+        return [hit['_id'] for hit in es.search(index=INDEX_NAME, body=body)['hits']['hits']]
+
+    def test_should_restore_snapshot(self):
+        snapshot = self.es.snapshot()
+
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=5, body={'data': 'test_5'})
+        self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=0)
+        self.es.index(index='another_index', doc_type=DOC_TYPE, body={'data': 'test'})
+        self.es.restore(snapshot)
+
+        self.assertEqual([0, 1, 2, 3, 4], self.__search_ids(self.es))
+        self.assertFalse(self.es.indices.exists('another_index'))
+
+    def test_should_restore_same_snapshot_several_times(self):
+        snapshot = self.es.snapshot()
+
+        for i in range(0, 2):
+            self.es.restore(snapshot)
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=1, body={'data': 'updated'})
+            self.assertEqual(2, self.es.get(index=INDEX_NAME, id=1)['_version'])
+            self.assertEqual([1], self.__search_ids(self.es, {'match': {'data': 'updated'}}))
+
+    def test_should_not_share_writes_between_fork_and_origin(self):
+        forked = self.es.fork()
+
+        forked.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=0, body={'data': 'forked'})
+        self.es.delete(index=INDEX_NAME, doc_type=DOC_TYPE, id=4)
+
+        self.assertEqual([1, 2, 3, 4, 0], self.__search_ids(forked, {'term': {'data': 'e'}}))
+        self.assertEqual([0, 1, 2, 3], self.__search_ids(self.es, {'term': {'data': 'e'}}))
+        self.assertEqual([], self.__search_ids(self.es, {'term': {'data': 'forked'}}))
+
+    def test_should_save_and_load_snapshot_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.es.save_snapshot(directory)
+            self.assertEqual(path, self.es.save_snapshot(directory))
+            with open(path, 'rb') as snapshot_file:
+                content_hash = hashlib.sha256(snapshot_file.read()[len(SNAPSHOT_FILE_MAGIC):]).hexdigest()
+            self.assertEqual(content_hash + '.snapshot', os.path.basename(path))
+
+            loaded = FakeElasticsearch()
+            loaded.load_snapshot(path)
+
+        self.assertEqual([0, 1, 2, 3, 4], self.__search_ids(loaded))
+        self.assertEqual([3], self.__search_ids(loaded, {'term': {'data': '3'}}))
+        loaded.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=3, body={'data': 'updated'})
+        self.assertEqual(2, loaded.get(index=INDEX_NAME, id=3)['_version'])
+        self.assertEqual([0, 1, 2, 4], self.__search_ids(loaded, {'term': {'data': 'test'}}))
+
+    def test_should_only_freeze_garbage_collector_when_asked(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('elasticmock.utilities.snapshot_file.gc.freeze', create=True) as freeze:
+            path = self.es.save_snapshot(directory)
+            FakeElasticsearch().load_snapshot(path)
+            freeze.assert_not_called()
+
+            FakeElasticsearch().load_snapshot(path, freeze=True)
+            freeze.assert_called_once_with()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import datetime
+import gc
+import weakref
+
+from elasticsearch.exceptions import RequestError
+
+from elasticmock.fake_elasticsearch import FakeElasticsearch
+from tests import TestElasticmock, INDEX_NAME, DOC_TYPE
+
+
+class TestSort(TestElasticmock):
+
+    def setUp(self):
+        super(TestSort, self).setUp()
+        data = [
+            {'group': 'b', 'value': 1},
+            {'group': 'a', 'value': 2},
+            {'group': 'b', 'value': 3},
+            {'group': 'a'},
+            {'group': 'a', 'value': 1},
+        ]
+        for i, body in enumerate(data):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body=body)
+
+    def __search_ids(self, sort, **kwargs):
+        result = self.es.search(index=INDEX_NAME, body={'sort': sort}, **kwargs)
+        return [hit['_id'] for hit in result['hits']['hits']]
+
+    def test_should_sort_on_several_keys(self):
+        result = self.es.search(index=INDEX_NAME, body={'sort': ['group', {'value': {'order': 'desc'}}]})
+
+        self.assertEqual(['1', '4', '3', '2', '0'], [hit['_id'] for hit in result['hits']['hits']])
+        self.assertEqual(['a', 2], result['hits']['hits'][0]['sort'])
+        self.assertEqual(['a', None], result['hits']['hits'][2]['sort'])
+
+    def test_should_sort_missing_values_as_asked(self):
+        self.assertEqual(['0', '4', '1', '2', '3'], self.__search_ids([{'value': 'asc'}, '_doc']))
+        self.assertEqual(['2', '1', '0', '4', '3'], self.__search_ids([{'value': 'desc'}, '_doc']))
+        self.assertEqual(['3', '0', '4', '1', '2'], self.__search_ids([{'value': {'missing': '_first'}}, '_doc']))
+        self.assertEqual(['0', '4', '1', '3', '2'], self.__search_ids([{'value': {'missing': 2}}, '_doc']))
+
+    def test_should_sort_with_sort_param(self):
+        result = self.es.search(index=INDEX_NAME, sort='group:desc,_doc')
+        self.assertEqual(['0', '2', '1', '3', '4'], [hit['_id'] for hit in result['hits']['hits']])
+
+    def test_should_select_top_hits_without_sorting_all_matches(self):
+        for i in range(5, 200):
+            self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id=str(i), body={'group': 'c', 'value': (i * 37) % 101})
+        self.es.clear_sorted_matches_cache()
+
+        sort = [{'value': 'desc'}, {'_doc': 'asc'}]
+        expected = self.__search_ids(sort, size=200)
+        self.assertEqual(1, self.es.sorted_matches_cache_stats()['size'])
+        self.es.clear_sorted_matches_cache()
+
+        self.assertEqual(expected[3:13], self.__search_ids(sort, from_=3, size=10))
+        self.assertEqual(0, self.es.sorted_matches_cache_stats()['size'])
+
+    def test_should_keep_sorted_matches_per_client_until_index_is_deleted(self):
+        self.__search_ids([{'value': 'desc'}, '_doc'])
+        self.assertEqual(1, self.es.sorted_matches_cache_stats()['size'])
+        self.assertEqual(0, FakeElasticsearch().sorted_matches_cache_stats()['size'])
+
+        fake_index = weakref.ref(self.es._FakeElasticsearch__documents_dict[INDEX_NAME])
+        self.es.indices.delete(index=INDEX_NAME)
+        gc.collect()
+
+        self.assertEqual(0, self.es.sorted_matches_cache_stats()['size'])
+        self.assertIsNone(fake_index())
+
+    def test_should_sort_by_mode_of_several_values_and_dates(self):
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='5', body={'value': [0, 10]})
+        self.es.index(index=INDEX_NAME, doc_type=DOC_TYPE, id='6',
+                      body={'value': datetime.datetime(1970, 1, 1, 0, 0, 1)})
+
+        result = self.es.search(index=INDEX_NAME, body={'sort': [{'value': {'mode': 'avg'}}], 'size': 7})
+        ids = [hit['_id'] for hit in result['hits']['hits']]
+        self.assertEqual(['0', '4', '1', '2', '5', '6', '3'], ids)
+        self.assertEqual([1000], result['hits']['hits'][5]['sort'])
+
+    def test_should_reject_invalid_sort(self):
+        for sort in ([{'value': 'up'}], [{'value': {'mode': 'first'}}], [['value']]):
+            with self.assertRaises(RequestError):
+                self.es.search(index=INDEX_NAME, body={'sort': sort})
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import threading
+from http.client import HTTPConnection
+
+import elasticsearch
+from elasticsearch import helpers
+
+from elasticmock.server import FakeElasticsearchServer
+from tests import TestElasticmock, INDEX_NAME
+
+
+class TestServer(TestElasticmock):
+
+    def setUp(self):
+        super(TestServer, self).setUp()
+        self.server = FakeElasticsearchServer(('127.0.0.1', 0), client=self.es)
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.connection = HTTPConnection(*self.server.server_address)
+        self.addCleanup(self.connection.close)
+
+    def __request(self, method, url, body=None, headers=None):
+        self.connection.request(method, url, body=body, headers=headers or {})
+        response = self.connection.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+
+    def test_should_index_get_and_delete_document(self):
+        status, response = self.__request('PUT', '/{0}/_doc/1'.format(INDEX_NAME), json.dumps({'author': 'kimchy'}))
+        self.assertEqual(201, status)
+        self.assertEqual('created', response['result'])
+
+        status, response = self.__request('GET', '/{0}/_doc/1'.format(INDEX_NAME))
+        self.assertEqual(200, status)
+        self.assertEqual({'author': 'kimchy'}, response['_source'])
+
+        self.assertEqual(200, self.__request('HEAD', '/{0}/_doc/1'.format(INDEX_NAME))[0])
+        self.assertEqual(200, self.__request('DELETE', '/{0}/_doc/1'.format(INDEX_NAME))[0])
+        status, response = self.__request('GET', '/{0}/_doc/1'.format(INDEX_NAME))
+        self.assertEqual(404, status)
+        self.assertFalse(response['found'])
+
+    def test_should_stream_chunked_and_gzip_bulk_bodies_on_one_connection(self):
+        lines = ''.join(
+            '{{"index":{{"_id":"{0}"}}}}\n{{"data":{0}}}\n'.format(i) for i in range(1, 101)
+        ).encode('utf-8')
+        chunks = (lines[i:i + 1000] for i in range(0, len(lines), 1000))
+
+        self.connection.request('POST', '/{0}/_bulk'.format(INDEX_NAME), body=chunks, encode_chunked=True)
+        response = self.connection.getresponse()
+        self.assertEqual(200, response.status)
+        self.assertFalse(json.loads(response.read())['errors'])
+
+        status, response = self.__request(
+            'POST', '/{0}/_bulk'.format(INDEX_NAME), gzip.compress(b'{"delete":{"_id":"1"}}\n'),
+            {'Content-Encoding': 'gzip'},
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(99, self.es.count(index=INDEX_NAME)['count'])
+
+    def test_should_serve_elasticsearch_client(self):
+        client = elasticsearch.Elasticsearch(['http://{0}:{1}'.format(*self.server.server_address)])
+        helpers.bulk(client, ({'_index': INDEX_NAME, '_id': str(i), 'data': i} for i in range(1, 31)))
+
+        search = client.search(index=INDEX_NAME, body={'query': {'term': {'data': 12}}})
+        msearch = client.msearch(index=INDEX_NAME, body=[{}, {'query': {'match_all': {}}}])
+        scanned = list(helpers.scan(client, index=INDEX_NAME, size=7))
+
+        self.assertEqual('12', search['hits']['hits'][0]['_id'])
+        self.assertEqual(30, msearch['responses'][0]['hits']['total']['value'])
+        self.assertEqual(30, len(scanned))
+        self.assertEqual('green', client.cluster.health()['status'])
+
+    def test_should_answer_unknown_routes_with_error(self):
+        status, response = self.__request('GET', '/_unknown')
+
+        self.assertEqual(400, status)
+        self.assertEqual('illegal_argument_exception', response['error']['type'])